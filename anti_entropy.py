@@ -0,0 +1,136 @@
+# anti_entropy.py
+
+from config import ANTI_ENTROPY_RATE
+from merkle import ARITY, DEPTH, coverage, range_intervals
+from rebalancer import RebalanceJob
+from log import get_logger
+
+log = get_logger("AntiEntropy")
+
+
+def shared_ranges(ring):
+    # {(a, b): [(start, end), ...]} for every pair of nodes that replicate
+    # the same token ranges.
+    pairs = {}
+    for start, end, pref in ring.ranges():
+        for i, a in enumerate(pref):
+            for b in pref[i + 1:]:
+                pairs.setdefault(tuple(sorted((a, b))), []).append((start, end))
+    return pairs
+
+
+class AntiEntropyJob(RebalanceJob):
+    # One anti-entropy pass over the ring. For each pair of replicas the
+    # Merkle trees are compared top-down over the token ranges the pair
+    # shares: one MERKLE_HASHES round trip per level to each side, descending
+    # only below nodes whose hashes differ. The keys of divergent leaves are
+    # listed with their versions and each side receives the keys it is
+    # missing or holds an older version of. Versioned deletes leave
+    # tombstones that take part in the comparison: when a key's newest
+    # version on either side is a delete, the delete is copied, not the
+    # value. A delete that reached only one replica spreads as long as that
+    # replica keeps its tombstone (TOMBSTONE_GRACE).
+    kind = "anti_entropy"
+
+    def __init__(self, ring, pool, rate=ANTI_ENTROPY_RATE, **kwargs):
+        super().__init__("all", pool, rate=rate, **kwargs)
+        self.ring = ring
+        self.pairs_checked = 0
+        self.leaves_compared = 0
+
+    def execute(self):
+        for (a, b), ranges in shared_ranges(self.ring).items():
+            try:
+                self.repair_pair(a, b, range_intervals(ranges))
+            except Exception as e:
+                self.failed()
+                log.error("Comparing %s and %s failed: %s", a, b, e)
+            self.pairs_checked += 1
+
+    def hashes(self, a, b, level, nodes, intervals):
+        message = {"action": "MERKLE_HASHES", "level": level, "nodes": nodes, "ranges": intervals}
+        replies = self.pool.request_many({a: message, b: message})
+        for reply in replies.values():
+            if isinstance(reply, Exception):
+                raise reply
+        return replies[a]["hashes"], replies[b]["hashes"]
+
+    def repair_pair(self, a, b, intervals):
+        level, nodes = 0, [0]
+        while True:
+            hashes_a, hashes_b = self.hashes(a, b, level, nodes, intervals)
+            differing = [node for node, x, y in zip(nodes, hashes_a, hashes_b) if x is None or x != y]
+            if level == DEPTH or not differing:
+                break
+            level += 1
+            nodes = [child for node in differing for child in range(node * ARITY, (node + 1) * ARITY)
+                     if coverage(level, child, intervals)]
+        if level != DEPTH:
+            return
+        for i in range(0, len(differing), self.batch_size):
+            self.repair_leaves(a, b, differing[i:i + self.batch_size], intervals)
+
+    def repair_leaves(self, a, b, leaves, intervals):
+        message = {"action": "MERKLE_LEAVES", "leaves": leaves, "ranges": intervals}
+        replies = self.pool.request_many({a: message, b: message})
+        for reply in replies.values():
+            if isinstance(reply, Exception):
+                raise reply
+        self.leaves_compared += len(leaves)
+        newest_a = self.newest(replies[a])
+        newest_b = self.newest(replies[b])
+        for source, target, ours, theirs in ((a, b, newest_a, newest_b), (b, a, newest_b, newest_a)):
+            keys = []
+            deletes = {}
+            for k, (version, deleted) in ours.items():
+                if theirs.get(k, (-1, False))[0] < version:
+                    if deleted:
+                        deletes[k] = version
+                    else:
+                        keys.append(k)
+            for i in range(0, len(keys), self.batch_size):
+                self.copy(source, target, keys[i:i + self.batch_size])
+            if deletes:
+                self.bury(target, deletes)
+
+    def newest(self, reply):
+        # {key: (version, deleted)} from a MERKLE_LEAVES reply.
+        newest = {k: (v, False) for k, v in reply["versions"].items()}
+        for k, v in reply.get("tombstones", {}).items():
+            if v >= newest.get(k, (-1, False))[0]:
+                newest[k] = (v, True)
+        return newest
+
+    def bury(self, target, deletes):
+        # Deletes carry their own versions: a write newer than the delete
+        # that reached the target since the comparison is kept.
+        self.keys_total += len(deletes)
+        self.limiter.acquire(len(deletes))
+        reply = self.pool.request(target, {"action": "MDEL", "keys": list(deletes), "versions": deletes})
+        if reply.get("status") != "OK":
+            raise Exception(reply.get("message", "delete rejected"))
+        self.moved(len(deletes))
+
+    def copy(self, source, target, keys):
+        self.keys_total += len(keys)
+        self.limiter.acquire(len(keys))
+        # A repair read is not a client access: peek so the source's
+        # eviction order is left alone.
+        reply = self.pool.request(source, {"action": "MGET", "keys": keys, "touch": False})
+        values = {k: v for k, v in reply.get("values", {}).items() if v is not None}
+        if not values:
+            return
+        # The target merges on version: a write that landed there since the
+        # comparison wins over the copy.
+        reply = self.pool.request(target, {
+            "action": "MSET", "items": values, "versions": reply.get("versions", {}),
+            "ttls": reply.get("ttls", {})})
+        if reply.get("status") != "STORED":
+            raise Exception(reply.get("message", "write rejected"))
+        self.moved(len(values))
+
+    def status(self):
+        status = super().status()
+        status["pairs_checked"] = self.pairs_checked
+        status["leaves_compared"] = self.leaves_compared
+        return status
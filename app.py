@@ -1,14 +1,15 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 import subprocess
 import socket
-import pickle
 import time
 import signal
 import os
 import threading
-from config import WORKER_NODES, WORKER_PORTS, PRIMARY_SERVER_PORT, REPLICATION_FACTOR
-from hashing_ring import ConsistentHashRing
-import hashlib
+from config import WORKER_NODES, WORKER_PORTS, PRIMARY_SERVER_PORT, REPLICATION_FACTOR, PROBE_TIMEOUT, SCAN_COUNT
+from hashing_ring import ConsistentHashRing, ring_hash
+from framing import send_message, recv_message
+from codec import open_connection
+from metrics import prometheus_text
 
 app = Flask(__name__)
 
@@ -18,6 +19,8 @@ processes = {
     'workers': {}
 }
 PRIMARY_LOG_PATH = 'primary_server.log'
+PRIMARY_OUTPUT_PATH = 'primary_server.out'
+LOG_TAIL_BYTES = 64 * 1024
 class SystemManager:
     def __init__(self):
         self.active_nodes = []
@@ -27,10 +30,22 @@ class SystemManager:
             return False
         port = WORKER_PORTS[node_id]
         try:
-            with socket.create_connection(("localhost", port), timeout=10):
+            with socket.create_connection(("localhost", port), timeout=PROBE_TIMEOUT):
                 return True
-        except (socket.timeout, ConnectionRefusedError):
+        except OSError:
             return False
+
+    def get_membership(self):
+        # The primary's heartbeat-based view of the workers, or None when the
+        # primary is unreachable.
+        try:
+            sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=1)
+            with sock:
+                send_message(sock, {"action": "MEMBERSHIP"}, codec)
+                response = recv_message(sock, codec)
+                return response.get("members") if response else None
+        except Exception:
+            return None
     
     def check_primary_status(self):
         try:
@@ -39,27 +54,60 @@ class SystemManager:
         except (socket.timeout, ConnectionRefusedError):
             return False
     
+    def scan_pages(self, match=None, count=SCAN_COUNT):
+        # Yields (keys, active_nodes) for each SCAN page, over one
+        # connection, until the primary returns cursor 0.
+        sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=10)
+        with sock:
+            cursor = 0
+            while True:
+                message = {"action": "SCAN", "cursor": cursor, "count": count}
+                if match:
+                    message["match"] = match
+                send_message(sock, message, codec)
+                response = recv_message(sock, codec)
+                yield response.get("keys", []), response.get("active_nodes", [])
+                cursor = response.get("cursor", 0)
+                if not cursor:
+                    return
+
+    def scan_keys(self, match=None):
+        for keys, _ in self.scan_pages(match):
+            yield from keys
+
     def get_system_state(self):
+        # (number of keys, active nodes) from one STATS request: the key
+        # count is the primary's DataStore size, which every write reaches,
+        # so the status poll never scans the keyspace.
+        stats = self.get_stats()
+        if stats.get("status") != "OK":
+            return 0, []
+        nodes = stats["nodes"]
+        count = nodes["primary"]["gauges"].get("entries", 0)
+        active_nodes = [node for node, snapshot in nodes.items()
+                        if node != "primary" and snapshot["gauges"].get("up")]
+        return count, active_nodes
+    
+    def get_keys_metadata(self, cursor=0, count=SCAN_COUNT, match=None):
+        # One SCAN page with placement and value previews, in one request.
+        message = {"action": "KEYS_METADATA", "cursor": cursor, "count": count}
+        if match:
+            message["match"] = match
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(10)
-                sock.connect(("localhost", PRIMARY_SERVER_PORT))
-                sock.sendall(pickle.dumps({"action": "LIST_KEYS"}))
-                data = sock.recv(4096)
-                response = pickle.loads(data)
-                return response.get("keys", []),response.get("active_nodes",[])
+            sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=10)
+            with sock:
+                send_message(sock, message, codec)
+                return recv_message(sock, codec)
         except Exception as e:
-            return [], []
+            return {"status": "ERROR", "message": str(e)}
     
-    def get_key_details(self, key):
+    def get_stats(self):
+        # Cluster STATS from the primary: per-node snapshots and totals.
         try:
-            with socket.create_connection(("localhost", PRIMARY_SERVER_PORT), timeout=10) as sock:
-                sock.sendall(pickle.dumps({
-                    "action": "KEY_METADATA",
-                    "key": key
-                }))
-                response = pickle.loads(sock.recv(4096))
-                return response
+            sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=10)
+            with sock:
+                send_message(sock, {"action": "STATS"}, codec)
+                return recv_message(sock, codec)
         except Exception as e:
             return {"status": "ERROR", "message": str(e)}
     
@@ -69,11 +117,10 @@ class SystemManager:
             request["value"] = value
         
         try:
-            with socket.create_connection(("localhost", PRIMARY_SERVER_PORT), timeout=10) as sock:
-                sock.sendall(pickle.dumps(request))
-                data = sock.recv(4096)
-                response = pickle.loads(data)
-                return response
+            sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=10)
+            with sock:
+                send_message(sock, request, codec)
+                return recv_message(sock, codec)
         except Exception as e:
             return {"status": "ERROR", "message": str(e)}
 
@@ -91,17 +138,23 @@ def dashboard():
 def get_status():
     primary_status = system_manager.check_primary_status()
     worker_status = {}
+    members = system_manager.get_membership() if primary_status else None
     
     for node in WORKER_NODES:
+        if members and node in members:
+            active = members[node]['active']
+        else:
+            active = system_manager.check_node_status(node)
         worker_status[node] = {
-            'active': system_manager.check_node_status(node),
+            'active': active,
+            'phi': members[node]['phi'] if members and node in members else None,
             'port': WORKER_PORTS[node],
             'process_running': node in processes['workers'] and 
                             processes['workers'][node] is not None and 
                             processes['workers'][node].poll() is None
         }
     
-    keys, active_nodes = system_manager.get_system_state()
+    keys_count, active_nodes = system_manager.get_system_state()
     
     return jsonify({
         'primary': {
@@ -110,7 +163,7 @@ def get_status():
             'process_running': processes['primary'] is not None and processes['primary'].poll() is None
         },
         'workers': worker_status,
-        'keys_count': len(keys),
+        'keys_count': keys_count,
         'active_nodes_count': len(active_nodes),
         'replication_factor': REPLICATION_FACTOR
     })
@@ -127,8 +180,10 @@ def start_primary():
         with open(log_path, 'w') as f:
             pass  # clear old logs
 
-        proc = subprocess.Popen(['python3', 'primary_server.py'],
-                        stdout=open(log_path, 'a'),
+        # The primary writes and rotates its own log; stdout/stderr only
+        # catch anything printed outside it, such as a crash traceback.
+        proc = subprocess.Popen(['python3', 'primary_server.py', '--log-file', log_path],
+                        stdout=open(PRIMARY_OUTPUT_PATH, 'w'),
                         stderr=subprocess.STDOUT)
 
         processes['primary'] = proc
@@ -168,9 +223,11 @@ def start_worker():
         return jsonify({'success': False, 'message': f'Worker {node_id} already running'})
     
     try:
-        proc = subprocess.Popen(['python3', 'worker_node.py', node_id],
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
+        # Unread pipes would fill up and stall the worker, so it logs to
+        # its own rotated file instead.
+        proc = subprocess.Popen(['python3', 'worker_node.py', node_id, '--log-file', f'{node_id}.log'],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
         processes['workers'][node_id] = proc
         time.sleep(1)  # Give it time to start
         
@@ -202,27 +259,33 @@ def stop_worker():
 
 @app.route('/api/data', methods=['GET'])
 def get_data():
-    keys, active_nodes = system_manager.get_system_state()
-    print(keys)
-    print(active_nodes)
-    data_details = []
+    # One page of keys per call: ?cursor= resumes where the previous page
+    # stopped (0 starts over), ?count= sets the page size and ?match= keeps
+    # keys starting with a prefix. The reply's cursor is 0 on the last page
+    # and its total is the number of keys in the cluster.
+    cursor = request.args.get('cursor', 0, type=int)
+    count = request.args.get('count', SCAN_COUNT, type=int)
+    match = request.args.get('match') or None
+    response = system_manager.get_keys_metadata(cursor, count, match)
+    if response.get('status') != 'OK':
+        return jsonify({'keys': [], 'active_nodes': [], 'cursor': 0, 'total': 0,
+                        'message': response.get('message', 'Unknown error')})
     
-    for key in keys:
-        details = system_manager.get_key_details(key)
-        if details.get('status') == 'OK':
-            key_hash = hashlib.md5(key.encode()).hexdigest()[:8]
-            data_details.append({
-                'key': key,
-                'hash': key_hash,
-                'primary': details.get('primary', 'Unknown'),
-                'replicas': details.get('replicas', []),
-                'value': str(details.get('value', ''))[:50]  # Truncate long values
-            })
+    data_details = []
+    for item in response['keys']:
+        data_details.append({
+            'key': item['key'],
+            'hash': item['hash'][:8],
+            'primary': item['primary'] or 'Unknown',
+            'replicas': item['replicas'],
+            'value': item['value'] if item['value'] is not None else ''
+        })
     
     return jsonify({
         'keys': data_details,
-        'active_nodes': active_nodes,
-        'total_keys': len(keys)
+        'active_nodes': response['active_nodes'],
+        'cursor': response['cursor'],
+        'total': response['total']
     })
 
 @app.route('/api/data', methods=['POST'])
@@ -291,7 +354,7 @@ def get_hash_ring():
             for node in active_nodes:
                 for i in range(5):  # Show first 5 virtual nodes per node
                     vnode_key = f"{node}-vn{i}"
-                    h = int(hashlib.md5(vnode_key.encode()).hexdigest(), 16)
+                    h = ring_hash(vnode_key)
                     ring_data.append({
                         'node': node,
                         'vnode': vnode_key,
@@ -304,11 +367,27 @@ def get_hash_ring():
         })
     except Exception as e:
         return jsonify({'error': str(e)})
+@app.route('/api/metrics')
+def get_metrics():
+    # Prometheus text format, one series per node; ?format=json returns the
+    # raw STATS reply including the cluster totals.
+    stats = system_manager.get_stats()
+    if request.args.get('format') == 'json':
+        return jsonify(stats)
+    if stats.get('status') != 'OK':
+        body = prometheus_text({'primary': {'gauges': {'up': 0}}})
+    else:
+        body = prometheus_text(stats['nodes'])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/logs')
 def get_logs():
     try:
-        with open(PRIMARY_LOG_PATH, 'r') as f:
-            lines = f.readlines()[-100:]
+        # The log is rotated by size, so only its tail needs reading.
+        with open(PRIMARY_LOG_PATH, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - LOG_TAIL_BYTES))
+            lines = f.read().decode('utf-8', 'replace').splitlines(keepends=True)[-100:]
         return jsonify({'success': True, 'logs': lines})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
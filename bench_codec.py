@@ -0,0 +1,39 @@
+# bench_codec.py
+import sys
+import timeit
+from codec import CODECS
+
+MESSAGES = {
+    "GET request": {"action": "GET", "key": "user:1024"},
+    "GET response": {"status": "OK", "value": "x" * 64},
+    "SET request": {"action": "SET", "key": "user:1024", "value": "x" * 256},
+    "SET response": {"status": "STORED"},
+    "LIST_KEYS response": {
+        "status": "OK",
+        "keys": [f"user:{i}" for i in range(1000)],
+        "active_nodes": ["node1", "node2", "node3", "node4"],
+    },
+}
+
+
+def bench(codec, message, number):
+    encoded = codec.encode(message)
+    assert codec.decode(encoded) == message
+    encode_time = timeit.timeit(lambda: codec.encode(message), number=number)
+    decode_time = timeit.timeit(lambda: codec.decode(encoded), number=number)
+    return len(encoded), number / encode_time, number / decode_time
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print(f"{'Message':<20} {'Codec':<8} {'Bytes':>7} {'Encode/s':>12} {'Decode/s':>12}")
+    print("-" * 63)
+    for label, message in MESSAGES.items():
+        n = number // 100 if "LIST_KEYS" in label else number
+        for name, codec in CODECS.items():
+            size, enc, dec = bench(codec, message, n)
+            print(f"{label:<20} {name:<8} {size:>7} {enc:>12,.0f} {dec:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# bench_eviction.py
+import sys
+import time
+from eviction import POLICIES, make_cache
+from workload import zipf_trace, scan_trace
+
+
+def replay(policy, capacity, trace):
+    # Read-through replay: every miss is filled with a put, as the primary
+    # does when it falls back to the DataStore.
+    cache = make_cache(policy, capacity)
+    hits = 0
+    start = time.perf_counter()
+    for key in trace:
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.put(key, key)
+    return hits / len(trace), len(trace) / (time.perf_counter() - start)
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    keyspace = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    traces = {
+        "zipf 0.8": zipf_trace(length, keyspace, alpha=0.8),
+        "zipf 0.99": zipf_trace(length, keyspace, alpha=0.99),
+        "zipf+scan": scan_trace(length, keyspace, alpha=0.99),
+    }
+    print(f"{length} accesses over {keyspace} keys, capacity in entries")
+    print(f"{'Trace':<11} {'Capacity':>9} " + " ".join(f"{p:>16}" for p in POLICIES))
+    print("-" * (22 + 17 * len(POLICIES)))
+    for name, trace in traces.items():
+        for capacity in (keyspace // 100, keyspace // 20, keyspace // 5):
+            cells = []
+            for policy in POLICIES:
+                ratio, speed = replay(policy, capacity, trace)
+                cells.append(f"{ratio:>7.2%} {speed / 1000:>6.0f}k/s")
+            print(f"{name:<11} {capacity:>9} " + " ".join(f"{c:>16}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
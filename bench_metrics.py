@@ -0,0 +1,44 @@
+# bench_metrics.py
+import sys
+import threading
+import time
+from metrics import Metrics
+
+
+def handler(request):
+    return {"status": "OK", "value": None}
+
+
+def run(threads, ops, tracked):
+    metrics = Metrics()
+    call = metrics.track(handler) if tracked else handler
+    request = {"action": "GET", "key": "key:1"}
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(ops):
+            call(request)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (threads * ops)
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"Cost of recording one request (counter + latency histogram), {ops} calls per thread")
+    print(f"{'Threads':>7} {'Bare':>10} {'Tracked':>10} {'Overhead':>10}")
+    for threads in (1, 4, 8):
+        bare = run(threads, ops, False)
+        tracked = run(threads, ops, True)
+        print(f"{threads:>7} {bare * 1e9:>8.0f}ns {tracked * 1e9:>8.0f}ns {(tracked - bare) * 1e9:>8.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# bench_ring.py
+import sys
+import time
+from hashing_ring import ConsistentHashRing, np
+from config import VIRTUAL_NODES, REPLICATION_FACTOR
+
+
+def rate(count, seconds):
+    return f"{count / seconds:>14,.0f}/s"
+
+
+def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    num_keys = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    nodes = [f"node{i}" for i in range(1, num_nodes + 1)]
+    keys = [f"key_{i}" for i in range(num_keys)]
+
+    start = time.perf_counter()
+    ring = ConsistentHashRing(nodes, vnodes=VIRTUAL_NODES)
+    build = time.perf_counter() - start
+    print(f"{num_nodes} nodes x {VIRTUAL_NODES} vnodes, {num_keys} keys, numpy={'yes' if np else 'no'}")
+    print(f"build ring            {build * 1000:>10.2f} ms")
+
+    start = time.perf_counter()
+    ring.add_node("extra")
+    print(f"add_node              {(time.perf_counter() - start) * 1000:>10.2f} ms")
+    start = time.perf_counter()
+    ring.remove_node("extra")
+    print(f"remove_node           {(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+    start = time.perf_counter()
+    single = [ring.get_node(key) for key in keys]
+    print(f"get_node              {rate(num_keys, time.perf_counter() - start)}")
+
+    start = time.perf_counter()
+    batch = ring.get_nodes(keys)
+    print(f"get_nodes (batch)     {rate(num_keys, time.perf_counter() - start)}")
+    assert batch == single
+
+    start = time.perf_counter()
+    for key in keys:
+        ring.get_replicas(key, REPLICATION_FACTOR)
+    print(f"get_replicas          {rate(num_keys, time.perf_counter() - start)}")
+
+
+if __name__ == "__main__":
+    main()
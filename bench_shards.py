@@ -0,0 +1,51 @@
+# bench_shards.py
+import sys
+import threading
+import time
+from sharded_store import ShardedStore
+from workload import ZipfGenerator
+
+
+def run(shards, threads, ops, keyspace, read_ratio=0.9):
+    store = ShardedStore(capacity=keyspace * 2, shards=shards, policy="lru")
+    for i in range(keyspace):
+        store.put(f"key:{i}", (i, 0))
+
+    plans = []
+    for t in range(threads):
+        ranks = ZipfGenerator(keyspace, 0.99, seed=t).sample(ops)
+        plans.append([(f"key:{rank}", (rank * 7919 + t) % 100 < read_ratio * 100) for rank in ranks])
+
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(plan):
+        get, put = store.get, store.put
+        barrier.wait()
+        for key, is_read in plan:
+            if is_read:
+                get(key)
+            else:
+                put(key, (key, 1))
+
+    workers = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return threads * ops / (time.perf_counter() - start)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    keyspace = 100000
+    print(f"{threads} threads x {ops} ops, 90% GET / 10% SET, Zipf 0.99 over {keyspace} keys")
+    print(f"{'Shards':>6} {'Ops/s':>12}")
+    for shards in (1, 2, 4, 8, 16, 32):
+        print(f"{shards:>6} {run(shards, threads, ops, keyspace):>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,70 @@
 # client.py
 
-import socket
-import pickle
 import argparse
 from config import PRIMARY_SERVER_PORT
+from framing import send_message, recv_message
+from codec import open_connection
 
-def send_request(action, key, value=None):
+def send_request(action, key, value=None, ttl=None):
     request = {"action": action, "key": key}
     if value:
         request["value"] = value
+    if ttl:
+        request["ttl"] = ttl
 
     try:
-        with socket.create_connection(("localhost", PRIMARY_SERVER_PORT)) as sock:
-            sock.sendall(pickle.dumps(request))
-            data = sock.recv(4096)
-            response = pickle.loads(data)
-            return response
+        sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT)
+        with sock:
+            send_message(sock, request, codec)
+            return recv_message(sock, codec)
+    except Exception as e:
+        print(f"[Client] Error: {e}")
+        return None
+
+def send_batch_request(action, keys=None, items=None, ttl=None):
+    request = {"action": action}
+    if keys is not None:
+        request["keys"] = list(keys)
+    if items is not None:
+        request["items"] = dict(items)
+    if ttl:
+        request["ttl"] = ttl
+
+    try:
+        sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT)
+        with sock:
+            send_message(sock, request, codec)
+            return recv_message(sock, codec)
     except Exception as e:
         print(f"[Client] Error: {e}")
         return None
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("action", choices=["GET", "SET"])
-    parser.add_argument("key", help="The key to fetch or set")
-    parser.add_argument("value", nargs="?", help="The value to set (for SET only)")
+    parser.add_argument("action", choices=["GET", "SET", "MGET", "MSET", "MDEL"])
+    parser.add_argument("args", nargs="+",
+                        help="GET key | SET key value | MGET key... | MSET key=value... | MDEL key...")
+    parser.add_argument("--ttl", type=float, help="Seconds until SET/MSET keys expire")
 
     args = parser.parse_args()
 
-    if args.action == "SET" and not args.value:
-        print("SET requires a value.")
-        return
+    if args.action == "MSET":
+        if not all("=" in arg for arg in args.args):
+            print("MSET requires key=value pairs.")
+            return
+        response = send_batch_request("MSET", items=(arg.split("=", 1) for arg in args.args), ttl=args.ttl)
+    elif args.action in ("MGET", "MDEL"):
+        response = send_batch_request(args.action, keys=args.args)
+    else:
+        key = args.args[0]
+        value = args.args[1] if len(args.args) > 1 else None
+        if args.action == "SET" and not value:
+            print("SET requires a value.")
+            return
+        response = send_request(args.action, key, value, args.ttl)
 
-    response = send_request(args.action, args.key, args.value)
     if response:
         print("Response:", response)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,422 @@
+# codec.py
+#
+# Message codecs for the wire protocol. A connection starts with an optional
+# HELLO frame naming the codec the client wants; connections that skip it are
+# legacy pickle connections. The binary codec is a compact struct layout:
+#
+#   request:  0x01 | opcode u8 | key | value | extras
+#   response: 0x02 | status u8 | value | extras
+#
+# The key is a u32 length followed by UTF-8 bytes. Values and extras use a
+# small tagged encoding (tag byte + length-prefixed payload). Extras carry any
+# fields beyond action/key/value or status/value, so new actions work without
+# a new opcode.
+#
+# The binary codec is smaller than pickle but slower in pure Python, so it is
+# what clients negotiate (config.WIRE_CODEC): a server never has to unpickle
+# their bytes. Cluster members talk to each other with config.PEER_CODEC,
+# pickle by default.
+
+import socket
+import asyncio
+import struct
+import pickle
+from config import ALLOW_PICKLE, WIRE_CODEC
+from framing import send_frame, recv_frame, read_frame, write_frame, FrameError
+from log import get_logger
+
+HELLO_MAGIC = b"\x00DCS"
+
+
+class CodecError(Exception):
+    pass
+
+
+class PickleCodec:
+    name = "pickle"
+
+    def encode(self, message):
+        return pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        try:
+            return pickle.loads(data)
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise CodecError(str(e))
+
+
+OPCODES = {
+    "GET": 1,
+    "SET": 2,
+    "DELETE": 3,
+    "KEY_METADATA": 4,
+    "LIST_KEYS": 5,
+    "MGET": 6,
+    "MSET": 7,
+    "MDEL": 8,
+    "SCAN": 9,
+    "KEYS_METADATA": 10,
+}
+STATUSES = {
+    "OK": 1,
+    "STORED": 2,
+    "DELETED": 3,
+    "NOT_FOUND": 4,
+    "MISS": 5,
+    "ERROR": 6,
+    "NOT_ADMITTED": 7,
+}
+ACTION_NAMES = {code: name for name, code in OPCODES.items()}
+STATUS_NAMES = {code: name for name, code in STATUSES.items()}
+
+KIND_REQUEST = 1
+KIND_RESPONSE = 2
+
+T_NONE, T_STR, T_BYTES, T_INT, T_FLOAT, T_TRUE, T_FALSE, T_LIST, T_TUPLE, T_DICT, T_BIGINT, T_STRLIST = range(12)
+T_ABSENT = 0xFF
+
+KEY_ABSENT = 0xFFFFFFFF
+
+_REQUEST_FIELDS = ("action", "key", "value")
+_RESPONSE_FIELDS = ("status", "value")
+
+_u32 = struct.Struct("!I")
+_i64 = struct.Struct("!q")
+_f64 = struct.Struct("!d")
+_head = struct.Struct("!BB")
+_head_key = struct.Struct("!BBI")
+_tag_len = struct.Struct("!BI")
+_tag_i64 = struct.Struct("!Bq")
+_tag_f64 = struct.Struct("!Bd")
+
+
+def _encode_value(value, append):
+    # Type checks are ordered by how often each shape shows up on the wire.
+    t = type(value)
+    if t is str:
+        data = value.encode()
+        append(_tag_len.pack(T_STR, len(data)))
+        append(data)
+    elif value is None:
+        append(b"\x00")
+    elif t is bool:
+        append(b"\x05" if value else b"\x06")
+    elif t is int:
+        if -(1 << 63) <= value < (1 << 63):
+            append(_tag_i64.pack(T_INT, value))
+        else:
+            data = str(value).encode()
+            append(_tag_len.pack(T_BIGINT, len(data)))
+            append(data)
+    elif t is float:
+        append(_tag_f64.pack(T_FLOAT, value))
+    elif t is bytes or t is bytearray:
+        append(_tag_len.pack(T_BYTES, len(value)))
+        append(bytes(value))
+    elif t is list or t is tuple:
+        if t is list and value and all(type(item) is str for item in value):
+            # Key lists are the bulk of SCAN replies: send them as one
+            # NUL-separated blob unless a key itself contains a NUL.
+            joined = "\x00".join(value)
+            if joined.count("\x00") == len(value) - 1:
+                data = joined.encode()
+                append(_tag_len.pack(T_STRLIST, len(data)))
+                append(data)
+                return
+        append(_tag_len.pack(T_LIST if t is list else T_TUPLE, len(value)))
+        for item in value:
+            _encode_value(item, append)
+    elif t is dict:
+        append(_tag_len.pack(T_DICT, len(value)))
+        for k, v in value.items():
+            _encode_value(k, append)
+            _encode_value(v, append)
+    else:
+        raise CodecError(f"Cannot encode value of type {t.__name__}")
+
+
+def _decode_value(buf, pos):
+    tag = buf[pos]
+    pos += 1
+    if tag == T_STR:
+        (n,) = _u32.unpack_from(buf, pos)
+        pos += 4
+        return str(buf[pos:pos + n], "utf-8"), pos + n
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_INT:
+        return _i64.unpack_from(buf, pos)[0], pos + 8
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_FLOAT:
+        return _f64.unpack_from(buf, pos)[0], pos + 8
+    (n,) = _u32.unpack_from(buf, pos)
+    pos += 4
+    if tag == T_BYTES:
+        return bytes(buf[pos:pos + n]), pos + n
+    if tag == T_STRLIST:
+        return str(buf[pos:pos + n], "utf-8").split("\x00"), pos + n
+    if tag == T_BIGINT:
+        return int(str(buf[pos:pos + n], "ascii")), pos + n
+    if tag == T_LIST or tag == T_TUPLE:
+        items = []
+        for _ in range(n):
+            item, pos = _decode_value(buf, pos)
+            items.append(item)
+        return (items if tag == T_LIST else tuple(items)), pos
+    if tag == T_DICT:
+        result = {}
+        for _ in range(n):
+            k, pos = _decode_value(buf, pos)
+            v, pos = _decode_value(buf, pos)
+            result[k] = v
+        return result, pos
+    raise CodecError(f"Unknown value tag {tag}")
+
+
+def encode_value(value):
+    out = []
+    _encode_value(value, out.append)
+    return b"".join(out)
+
+
+def decode_value(buf, pos=0):
+    try:
+        return _decode_value(buf, pos)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise CodecError(f"Malformed value: {e}")
+
+
+class BinaryCodec:
+    name = "binary"
+
+    def encode(self, message):
+        out = []
+        append = out.append
+        known = 1
+        if "action" in message:
+            action = message["action"]
+            code = OPCODES.get(action, 0)
+            key = message.get("key")
+            if key is None:
+                append(_head_key.pack(KIND_REQUEST, code, KEY_ABSENT))
+            elif type(key) is not str:
+                raise CodecError(f"Keys must be strings, got {type(key).__name__}")
+            else:
+                data = key.encode()
+                append(_head_key.pack(KIND_REQUEST, code, len(data)))
+                append(data)
+            if "key" in message:
+                known += 1
+            skip = _REQUEST_FIELDS
+            extra_name = "action" if not code else None
+        else:
+            status = message.get("status")
+            code = STATUSES.get(status, 0)
+            append(_head.pack(KIND_RESPONSE, code))
+            skip = _RESPONSE_FIELDS
+            extra_name = "status" if not code else None
+
+        if "value" in message:
+            known += 1
+            value = message["value"]
+            if type(value) is str:
+                data = value.encode()
+                append(_tag_len.pack(T_STR, len(data)))
+                append(data)
+            else:
+                _encode_value(value, append)
+        else:
+            append(b"\xff")
+
+        if len(message) > known or extra_name:
+            extras = {k: v for k, v in message.items() if k not in skip}
+            if extra_name:
+                extras[extra_name] = message.get(extra_name)
+            _encode_value(extras, append)
+        else:
+            append(b"\x00")
+        return b"".join(out)
+
+    def decode(self, data):
+        buf = memoryview(data)
+        try:
+            kind, code = _head.unpack_from(buf, 0)
+            pos = 2
+            if kind == KIND_REQUEST:
+                (n,) = _u32.unpack_from(buf, 2)
+                pos = 6
+                message = {"action": ACTION_NAMES.get(code)}
+                if n != KEY_ABSENT:
+                    message["key"] = str(buf[6:6 + n], "utf-8")
+                    pos += n
+            elif kind == KIND_RESPONSE:
+                message = {"status": STATUS_NAMES.get(code)}
+            else:
+                raise CodecError(f"Unknown message kind {kind}")
+
+            tag = buf[pos]
+            if tag == T_ABSENT:
+                pos += 1
+            elif tag == T_STR:
+                (n,) = _u32.unpack_from(buf, pos + 1)
+                pos += 5
+                message["value"] = str(buf[pos:pos + n], "utf-8")
+                pos += n
+            else:
+                message["value"], pos = _decode_value(buf, pos)
+
+            if buf[pos] != T_NONE:
+                extras, pos = _decode_value(buf, pos)
+                message.update(extras)
+        except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+            raise CodecError(f"Malformed message: {e}")
+        return message
+
+
+CODECS = {
+    "pickle": PickleCodec(),
+    "binary": BinaryCodec(),
+}
+
+
+def get_codec(name):
+    if name == "pickle" and not ALLOW_PICKLE:
+        raise CodecError("Pickle codec is disabled")
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise CodecError(f"Unknown codec: {name}")
+
+
+def client_handshake(sock, name):
+    codec = CODECS[name]
+    send_frame(sock, HELLO_MAGIC + name.encode())
+    reply = recv_frame(sock)
+    if reply is None or bytes(reply[:4]) != HELLO_MAGIC:
+        raise CodecError("Server did not acknowledge codec handshake")
+    accepted = str(reply[4:], "utf-8")
+    if accepted != name:
+        raise CodecError(f"Server refused codec {name}: {accepted}")
+    return codec
+
+
+def _accept_hello(frame):
+    # Returns (codec, reply frame) for the first frame of a connection; the
+    # reply is None when the frame is a legacy pickle message, not a HELLO.
+    if bytes(frame[:4]) != HELLO_MAGIC:
+        return get_codec("pickle"), None
+    name = str(frame[4:], "utf-8")
+    try:
+        return get_codec(name), HELLO_MAGIC + name.encode()
+    except CodecError as e:
+        return None, HELLO_MAGIC + str(e).encode()
+
+
+def server_handshake(sock, frame):
+    # Called with the first frame of a connection. Returns the codec to use
+    # and whether the frame was consumed as a HELLO.
+    codec, reply = _accept_hello(frame)
+    if reply is not None:
+        send_frame(sock, reply)
+        if codec is None:
+            raise CodecError(str(reply[4:], "utf-8"))
+    return codec, reply is not None
+
+
+async def client_handshake_async(reader, writer, name):
+    codec = CODECS[name]
+    write_frame(writer, HELLO_MAGIC + name.encode())
+    await writer.drain()
+    reply = await read_frame(reader)
+    if reply is None or reply[:4] != HELLO_MAGIC:
+        raise CodecError("Server did not acknowledge codec handshake")
+    accepted = str(reply[4:], "utf-8")
+    if accepted != name:
+        raise CodecError(f"Server refused codec {name}: {accepted}")
+    return codec
+
+
+def open_connection(host, port, timeout=None, codec_name=WIRE_CODEC):
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        return sock, client_handshake(sock, codec_name)
+    except Exception:
+        sock.close()
+        raise
+
+
+def serve_connection(conn, handler, label="Server"):
+    # Request loop shared by the primary and the workers: negotiate the codec
+    # on the first frame, then answer frames until the peer hangs up.
+    codec = None
+    try:
+        while True:
+            try:
+                frame = recv_frame(conn)
+                if frame is None:
+                    return
+                if codec is None:
+                    codec, consumed = server_handshake(conn, frame)
+                    if consumed:
+                        continue
+                request = codec.decode(frame)
+            except (FrameError, CodecError) as e:
+                if codec is not None:
+                    send_frame(conn, codec.encode({"status": "ERROR", "message": str(e)}))
+                return
+            try:
+                response = handler(request)
+            except Exception as e:
+                get_logger(label).error("Error: %s", e)
+                response = {"status": "ERROR", "message": str(e)}
+            send_frame(conn, codec.encode(response))
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+async def serve_stream(reader, writer, handler, label="Server", limiter=None):
+    # asyncio counterpart of serve_connection. handler may be a plain function
+    # or a coroutine function; limiter bounds requests in flight across all
+    # connections.
+    is_async = asyncio.iscoroutinefunction(handler)
+    codec = None
+    try:
+        while True:
+            try:
+                frame = await read_frame(reader)
+                if frame is None:
+                    return
+                if codec is None:
+                    codec, reply = _accept_hello(frame)
+                    if reply is not None:
+                        write_frame(writer, reply)
+                        await writer.drain()
+                        if codec is None:
+                            return
+                        continue
+                request = codec.decode(frame)
+            except (FrameError, CodecError) as e:
+                if codec is not None:
+                    write_frame(writer, codec.encode({"status": "ERROR", "message": str(e)}))
+                    await writer.drain()
+                return
+            try:
+                if limiter is not None:
+                    async with limiter:
+                        response = await handler(request) if is_async else handler(request)
+                else:
+                    response = await handler(request) if is_async else handler(request)
+            except Exception as e:
+                get_logger(label).error("Error: %s", e)
+                response = {"status": "ERROR", "message": str(e)}
+            write_frame(writer, codec.encode(response))
+            await writer.drain()
+    except (OSError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
@@ -2,8 +2,23 @@
 
 # System Configuration
 REPLICATION_FACTOR = 2  # Number of replicas per key
+WRITE_QUORUM = 1        # Replica acks required before a write is acknowledged (W <= REPLICATION_FACTOR)
+WRITE_TIMEOUT = 5       # Seconds to wait for the write quorum
+READ_STRATEGY = "first" # "first": one replica plus a hedged request, "quorum": wait for READ_QUORUM replies
+READ_QUORUM = 1         # Replies a quorum read waits for (R <= REPLICATION_FACTOR)
+READ_TIMEOUT = 2        # Seconds a GET waits on replicas before falling back to the DataStore
+HEDGE_PERCENTILE = 95   # Hedge to the next replica after this percentile of recent latency
+HEDGE_MIN_DELAY = 0.002 # Bounds (seconds) on the hedge delay
+HEDGE_MAX_DELAY = 0.5
+READ_WORKERS = 8        # Threads for replica reads, kept apart from the write fan-out (FANOUT_WORKERS)
+READ_REPAIR_CHANCE = 0.1  # Share of "first" reads that also check the other replicas (quorum reads always do)
+READ_REPAIR_WORKERS = 4   # Background threads running read repairs
+HLC_MAX_DRIFT = 60        # Seconds ahead of the local clock a remote version may be before it is ignored
 VIRTUAL_NODES = 100       # Virtual nodes per worker for consistent hashing
 WORKER_NODES = ["node1", "node2", "node3", "node4"]
+WORKER_MEMORY_BYTES = 64 * 1024 * 1024  # Cache budget per worker (key + value + ENTRY_OVERHEAD per entry)
+ENTRY_OVERHEAD = 224    # Approximate bytes of bookkeeping per cached entry (dict slots, entry tuple, version)
+EVICTION_POLICY = "lru" # Worker eviction policy: "lru", "clock", "arc" or "tinylfu"
 
 WORKER_PORTS = {
     "node1": 5001,
@@ -13,3 +28,73 @@ WORKER_PORTS = {
 }
 
 PRIMARY_SERVER_PORT = 4001
+
+# Connection pooling between the primary and worker nodes
+POOL_MAX_SIZE = 8           # Max open connections per worker
+POOL_IDLE_TIMEOUT = 30      # Seconds an idle pooled connection is kept
+POOL_CHECKOUT_TIMEOUT = 5   # Seconds to wait for a free connection slot
+POOL_SOCKET_TIMEOUT = 10    # Socket timeout for pooled connections
+
+# Wire protocol
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # Largest message accepted on any connection
+WIRE_CODEC = "binary"   # Codec clients negotiate at connection start ("binary" or "pickle")
+ALLOW_PICKLE = True     # Accept pickle connections; disable to stop unpickling untrusted bytes
+# Codec for traffic between cluster members (the primary's worker pools and
+# worker heartbeats). Both ends are trusted and pickle is the faster codec in
+# bench_codec.py, so binary is only used there when pickle is disabled.
+PEER_CODEC = "pickle" if ALLOW_PICKLE else "binary"
+
+# Server mode: "thread" spawns a thread per connection, "async" runs an asyncio event loop
+SERVER_MODE = "thread"
+MAX_INFLIGHT_REQUESTS = 1024  # Requests processed at once in async mode
+
+# Parallel fan-out from the primary to workers (batch actions, replication)
+FANOUT_WORKERS = 32
+
+# Keys per SCAN page unless the request asks for another count
+SCAN_COUNT = 500
+
+# Characters of each value returned by KEYS_METADATA
+VALUE_PREVIEW = 50
+
+# Smart client (smart_client.py): routes to workers directly using the primary's topology
+TOPOLOGY_REFRESH = 5  # Seconds between topology refetches when nothing forced one sooner
+
+# Key migration when a node joins or leaves the ring
+MIGRATION_BATCH_SIZE = 500  # Keys moved per round trip
+MIGRATION_RATE = 5000       # Keys per second a rebalance job may move (0 = unthrottled)
+RECOVERY_WORKERS = 4        # Parallel batches when re-replicating a failed node's keys
+
+# Failure detection: workers push heartbeats, the primary scores them with phi accrual
+HEARTBEAT_INTERVAL = 0.5  # Seconds between worker heartbeats
+PHI_THRESHOLD = 8         # Suspicion level at which a node leaves the ring
+MONITOR_INTERVAL = 0.5    # Seconds between membership checks on the primary
+PROBE_TIMEOUT = 0.5       # Connect timeout for the one-off startup/status probes
+
+# Key expiry (TTL)
+TTL_TICK = 0.1        # Timing wheel resolution in seconds
+EXPIRY_BATCH = 1000   # Expired keys removed per lock hold by the background expirer
+
+# Worker storage is split into independently locked shards chosen by key hash.
+# The shards share WORKER_MEMORY_BYTES: one shard may hold more than an even
+# split, and a single value may be as large as the whole budget.
+WORKER_SHARDS = 8
+
+# Anti-entropy: periodic Merkle-tree comparison of replicas
+ANTI_ENTROPY_INTERVAL = 30  # Seconds between passes (0 disables)
+ANTI_ENTROPY_RATE = 5000    # Keys per second a pass may repair (0 = unthrottled)
+# Seconds a versioned delete's tombstone is kept. It must outlast several
+# anti-entropy passes, or a replica that missed the delete copies the key back.
+TOMBSTONE_GRACE = 600
+
+# Optional worker persistence (enabled with worker_node.py --data-dir)
+PERSIST_GROUP_COMMIT_DELAY = 0.002       # Seconds a log flush waits for more writes to share its fsync
+PERSIST_COMPACT_BYTES = 64 * 1024 * 1024  # Log size that triggers rotation and a new snapshot
+PERSIST_RETRY_DELAY = 5.0                  # Longest wait between retries of a failed log write
+
+# Logging (log.py): a background thread writes the log, fed by a bounded queue
+LOG_LEVEL = "INFO"                  # DEBUG, INFO, WARNING or ERROR
+LOG_QUEUE_SIZE = 10000              # Messages waiting to be written; more are dropped and counted
+LOG_MAX_BYTES = 10 * 1024 * 1024    # Size at which a --log-file is rotated
+LOG_BACKUPS = 3                     # Rotated files kept (primary_server.log.1 ...)
+LOG_REQUEST_SAMPLE = 0.01           # Fraction kept of messages that can fire on every request
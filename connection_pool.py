@@ -0,0 +1,251 @@
+# connection_pool.py
+
+import socket
+import asyncio
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from framing import send_message, recv_message, read_frame, write_frame, FrameError
+from codec import client_handshake, client_handshake_async, CodecError
+from latency import LatencyTracker
+from config import (
+    WORKER_PORTS, POOL_MAX_SIZE, POOL_IDLE_TIMEOUT,
+    POOL_CHECKOUT_TIMEOUT, POOL_SOCKET_TIMEOUT, PEER_CODEC, FANOUT_WORKERS
+)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, ports=None, host="localhost", max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 socket_timeout=POOL_SOCKET_TIMEOUT, codec_name=PEER_CODEC):
+        self.ports = ports if ports is not None else WORKER_PORTS
+        self.host = host
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.socket_timeout = socket_timeout
+        self.codec_name = codec_name
+        self.codec = None
+        self.latency = LatencyTracker()
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _node_state(self, node):
+        with self._lock:
+            if node not in self._slots:
+                self._slots[node] = threading.BoundedSemaphore(self.max_size)
+                self._idle[node] = deque()
+            return self._slots[node], self._idle[node]
+
+    def _is_healthy(self, sock, last_used):
+        if time.monotonic() - last_used > self.idle_timeout:
+            return False
+        try:
+            # An idle keep-alive socket should never be readable: readable means
+            # the worker closed it (EOF) or left stray bytes behind.
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def _connect(self, node):
+        sock = socket.create_connection((self.host, self.ports[node]), timeout=self.socket_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            self.codec = client_handshake(sock, self.codec_name)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def acquire(self, node):
+        slots, idle = self._node_state(node)
+        if not slots.acquire(timeout=self.checkout_timeout):
+            raise PoolExhausted(f"No free connection to {node}")
+        try:
+            while True:
+                with self._lock:
+                    entry = idle.pop() if idle else None
+                if entry is None:
+                    return self._connect(node), False
+                sock, last_used = entry
+                if self._is_healthy(sock, last_used):
+                    return sock, True
+                sock.close()
+        except Exception:
+            slots.release()
+            raise
+
+    def release(self, node, sock):
+        slots, idle = self._node_state(node)
+        with self._lock:
+            idle.append((sock, time.monotonic()))
+        slots.release()
+
+    def discard(self, node, sock):
+        slots, _ = self._node_state(node)
+        try:
+            sock.close()
+        finally:
+            slots.release()
+
+    def request(self, node, message):
+        # A reused socket may have been closed by the worker since its health
+        # check, so a failure on one gets a single retry on a fresh connection.
+        start = time.monotonic()
+        for attempt in range(2):
+            sock, reused = self.acquire(node)
+            try:
+                send_message(sock, message, self.codec)
+                response = recv_message(sock, self.codec)
+                if response is None:
+                    raise ConnectionError(f"{node} closed the connection")
+            except (OSError, FrameError, CodecError):
+                self.discard(node, sock)
+                if reused and attempt == 0:
+                    continue
+                raise
+            self.release(node, sock)
+            self.latency.record(node, time.monotonic() - start)
+            return response
+
+    def submit(self, node, message):
+        # Runs request() on the pool's fan-out executor and returns a Future.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+        return self._executor.submit(self.request, node, message)
+
+    def request_many(self, messages):
+        # Sends one message per node in parallel. Returns {node: response},
+        # with the exception in place of the response for nodes that failed.
+        futures = {node: self.submit(node, message) for node, message in messages.items()}
+        results = {}
+        for node, future in futures.items():
+            try:
+                results[node] = future.result()
+            except Exception as e:
+                results[node] = e
+        return results
+
+    def close_node(self, node):
+        _, idle = self._node_state(node)
+        with self._lock:
+            entries = list(idle)
+            idle.clear()
+        for sock, _ in entries:
+            sock.close()
+
+    def close_all(self):
+        for node in list(self._slots):
+            self.close_node(node)
+
+
+class AsyncConnectionPool:
+    # asyncio version of ConnectionPool used by the async server mode. All
+    # methods must be called from the event loop that owns the pool.
+    def __init__(self, ports=None, host="localhost", max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 socket_timeout=POOL_SOCKET_TIMEOUT, codec_name=PEER_CODEC):
+        self.ports = ports if ports is not None else WORKER_PORTS
+        self.host = host
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.socket_timeout = socket_timeout
+        self.codec_name = codec_name
+        self.codec = None
+        self.latency = LatencyTracker()
+        self._idle = {}
+        self._slots = {}
+
+    def _node_state(self, node):
+        if node not in self._slots:
+            self._slots[node] = asyncio.Semaphore(self.max_size)
+            self._idle[node] = deque()
+        return self._slots[node], self._idle[node]
+
+    def _is_healthy(self, reader, writer, last_used):
+        if time.monotonic() - last_used > self.idle_timeout:
+            return False
+        return not reader.at_eof() and not writer.is_closing()
+
+    async def _connect(self, node):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.ports[node]), self.socket_timeout)
+        try:
+            self.codec = await asyncio.wait_for(
+                client_handshake_async(reader, writer, self.codec_name), self.socket_timeout)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def acquire(self, node):
+        slots, idle = self._node_state(node)
+        try:
+            await asyncio.wait_for(slots.acquire(), self.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhausted(f"No free connection to {node}")
+        try:
+            while idle:
+                reader, writer, last_used = idle.pop()
+                if self._is_healthy(reader, writer, last_used):
+                    return reader, writer, True
+                writer.close()
+            reader, writer = await self._connect(node)
+            return reader, writer, False
+        except BaseException:
+            slots.release()
+            raise
+
+    def release(self, node, reader, writer):
+        slots, idle = self._node_state(node)
+        idle.append((reader, writer, time.monotonic()))
+        slots.release()
+
+    def discard(self, node, writer):
+        slots, _ = self._node_state(node)
+        writer.close()
+        slots.release()
+
+    async def request(self, node, message):
+        start = time.monotonic()
+        for attempt in range(2):
+            reader, writer, reused = await self.acquire(node)
+            try:
+                write_frame(writer, self.codec.encode(message))
+                await writer.drain()
+                frame = await asyncio.wait_for(read_frame(reader), self.socket_timeout)
+                if frame is None:
+                    raise ConnectionError(f"{node} closed the connection")
+                response = self.codec.decode(frame)
+            except (OSError, FrameError, CodecError, asyncio.TimeoutError):
+                self.discard(node, writer)
+                if reused and attempt == 0:
+                    continue
+                raise
+            except asyncio.CancelledError:
+                # A reply may still arrive for a cancelled request, so the
+                # connection can't be handed to the next caller.
+                self.discard(node, writer)
+                raise
+            self.release(node, reader, writer)
+            self.latency.record(node, time.monotonic() - start)
+            return response
+
+    def close_node(self, node):
+        _, idle = self._node_state(node)
+        while idle:
+            _, writer, _ = idle.pop()
+            writer.close()
@@ -1,5 +1,11 @@
 # datastore.py
 
+import threading
+import time
+from config import TOMBSTONE_GRACE
+from timing_wheel import TimingWheel, expiry_loop
+from merkle import MerkleTree
+
 class DataStore:
     def __init__(self):
         self.store = {
@@ -7,10 +13,104 @@ class DataStore:
             "code": "it559",
             "dis": "sys"
         }
+        # Keys with a TTL map to their wall-clock deadline. Expired keys are
+        # dropped on access and by a timing-wheel thread in the background.
+        self.expiry = {}
+        self.lock = threading.Lock()
+        # Token-ordered key index that SCAN pages through.
+        self.index = MerkleTree()
+        # Every write and delete carries the version the replicas get, so a
+        # write reaching the DataStore late (from a smart client, say) never
+        # undoes a newer one. Deletes leave a tombstone with their version for
+        # TOMBSTONE_GRACE seconds, as on the workers. The seed data is
+        # version 0.
+        self.versions = dict.fromkeys(self.store, 0)
+        self.tombstones = {}
+        for key in self.store:
+            self.index.add(key, 0)
+        self.wheel = TimingWheel()
+        self.tombstone_wheel = TimingWheel()
+        threading.Thread(target=expiry_loop, args=([(self.wheel, self.lock, self._expire),
+                                                    (self.tombstone_wheel, self.lock, self._collect)],),
+                         daemon=True).start()
 
     def get(self, key):
+        deadline = self.expiry.get(key)
+        if deadline is not None and deadline <= time.time():
+            with self.lock:
+                self._expire((key, deadline))
+            return None
         return self.store.get(key)
 
-    def set(self, key, value):
-        self.store[key] = value
+    def version(self, key):
+        # Version of the value held for key, or None.
+        return self.versions.get(key)
+
+    def superseded(self, key, version):
+        # True when the value or the tombstone held for key is at least as
+        # new as `version`. Expects the caller to hold `lock`.
+        current = self.versions.get(key, self.tombstones.get(key))
+        return current is not None and current >= version
+
+    def set(self, key, value, ttl=None, version=0):
+        # False when a newer write or delete of key was already applied.
+        with self.lock:
+            if version and self.superseded(key, version):
+                return False
+            self.store[key] = value
+            self.versions[key] = version
+            self.tombstones.pop(key, None)
+            self.index.add(key, 0)
+            if ttl:
+                deadline = time.time() + ttl
+                self.expiry[key] = deadline
+                self.wheel.schedule((key, deadline), deadline)
+            else:
+                self.expiry.pop(key, None)
+            return True
+
+    def delete(self, key, version=0):
+        # True when key was held. A delete older than the value held leaves
+        # it in place.
+        with self.lock:
+            if version:
+                if self.versions.get(key, 0) > version:
+                    return False
+                if self.tombstones.get(key, 0) < version:
+                    self.tombstones[key] = version
+                    self.tombstone_wheel.schedule((key, version), time.time() + TOMBSTONE_GRACE)
+            self.expiry.pop(key, None)
+            self.versions.pop(key, None)
+            self.index.discard(key)
+            return self.store.pop(key, None) is not None
+
+    def scan(self, cursor, count, match=None):
+        # Same contract as ShardedStore.scan, with (token, key) items so the
+        # primary can merge them with worker pages.
+        now = time.time()
+        with self.lock:
+            items, nxt = self.index.scan(cursor, count)
+        items = [item for item in items if self.expiry.get(item[1], now + 1) > now]
+        if match:
+            items = [item for item in items if item[1].startswith(match)]
+        return items, nxt
+
+    def ttl(self, key):
+        # Seconds left before `key` expires, or None when it has no TTL.
+        deadline = self.expiry.get(key)
+        if deadline is None:
+            return None
+        return max(deadline - time.time(), 0.001)
+
+    def _expire(self, item):
+        key, deadline = item
+        if self.expiry.get(key) == deadline:
+            del self.expiry[key]
+            self.store.pop(key, None)
+            self.versions.pop(key, None)
+            self.index.discard(key)
 
+    def _collect(self, item):
+        key, version = item
+        if self.tombstones.get(key) == version:
+            del self.tombstones[key]
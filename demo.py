@@ -1,9 +1,9 @@
 # demo.py
 import socket
-import pickle
-import hashlib
-from config import WORKER_PORTS, PRIMARY_SERVER_PORT, REPLICATION_FACTOR
+from config import WORKER_PORTS, PRIMARY_SERVER_PORT, REPLICATION_FACTOR, SCAN_COUNT
 from hashing_ring import ConsistentHashRing
+from framing import send_message, recv_message
+from codec import open_connection
 class LiveDemo:
     def __init__(self):
         self.active_nodes = self.check_active_nodes()
@@ -22,26 +22,23 @@ class LiveDemo:
     def create_dynamic_ring(self):
         return ConsistentHashRing(self.active_nodes)
 
-    def get_all_keys(self):
+    def iter_metadata(self):
+        # Pages through the keyspace with KEYS_METADATA: one request per
+        # page returns every key's placement and value preview.
         try:
-            with socket.create_connection(("localhost", PRIMARY_SERVER_PORT), timeout=1) as sock:
-                sock.sendall(pickle.dumps({"action": "LIST_KEYS"}))
-                return pickle.loads(sock.recv(4096)).get("keys", [])
+            sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=1)
+            with sock:
+                cursor = 0
+                while True:
+                    send_message(sock, {"action": "KEYS_METADATA", "cursor": cursor, "count": SCAN_COUNT,
+                                        "preview": 15}, codec)
+                    response = recv_message(sock, codec)
+                    yield from response.get("keys", [])
+                    cursor = response.get("cursor", 0)
+                    if not cursor:
+                        return
         except Exception as e:
             print(f"Key retrieval failed: {e}")
-            return []
-
-    def get_key_details(self, key):
-        try:
-            with socket.create_connection(("localhost", PRIMARY_SERVER_PORT), timeout=1) as sock:
-                sock.sendall(pickle.dumps({
-                    "action": "KEY_METADATA",
-                    "key": key
-                }))
-                return pickle.loads(sock.recv(4096))
-        except Exception as e:
-            print(f"Metadata error for {key}: {e}")
-            return None
 
     def display(self):
         print("\n")
@@ -49,15 +46,12 @@ class LiveDemo:
         print(f"│ {'Key'.ljust(20)} │ {'Hash'.ljust(12)} │ {'Primary'.ljust(8)} │ {'Replicas'.ljust(20)} │ {'Value'.ljust(15)} │")
         print("=" * 85)
         
-        for key in self.get_all_keys():
-            details = self.get_key_details(key)
-            if not details or details.get("status") != "OK":
-                continue
-            
-            key_hash = hashlib.md5(key.encode()).hexdigest()[:8]
-            value_preview = str(details.get("value", "")[:15].replace("\n", " "))
+        for details in self.iter_metadata():
+            key = details["key"]
+            key_hash = details["hash"][:8]
+            value_preview = (details["value"] or "").replace("\n", " ")
             
-            print(f"│ {key.ljust(20)} │ {key_hash}.. │ {details['primary'].ljust(8)} │ {', '.join(details['replicas']).ljust(20)} │ {value_preview.ljust(15)} │")
+            print(f"│ {key.ljust(20)} │ {key_hash}.. │ {(details['primary'] or 'None').ljust(8)} │ {', '.join(details['replicas']).ljust(20)} │ {value_preview.ljust(15)} │")
         
         print("=" * 85)
         print(f"Active Nodes: {len(self.active_nodes)}/{len(WORKER_PORTS)}")
@@ -0,0 +1,411 @@
+# eviction.py
+
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+_HALVE = bytes(c >> 1 for c in range(256))
+
+
+def count_sizer(key, value):
+    # Charges one unit per entry, turning the byte budget into an entry count.
+    return 1
+
+
+class Budget:
+    # Byte limit enforced across one or more caches. Each cache charges its
+    # own usage changes here and evicts from itself while the total is over.
+    # Only a budget shared between caches under different locks needs its
+    # own lock.
+    def __init__(self, capacity, shared=False):
+        self.capacity = capacity
+        self.used = 0
+        self.lock = threading.Lock() if shared else None
+
+    def charge(self, delta):
+        if self.lock is None:
+            self.used += delta
+        else:
+            with self.lock:
+                self.used += delta
+
+    def over(self):
+        return self.used > self.capacity
+
+
+class BoundedCache(ABC):
+    # Byte-budgeted key/value store with a pluggable eviction policy.
+    # Subclasses keep their own ordering structures and implement the hooks
+    # _on_access, _on_insert, _on_update, _on_remove and _victim; all of them
+    # are O(1) (amortized for CLOCK's second-chance sweep).
+    #
+    # `capacity` sizes the policy's own structures. The limit actually
+    # enforced is `budget`, which defaults to capacity but may be shared
+    # with other caches; a cache under a shared budget can hold more than
+    # its capacity while the others hold less. Once the budget is full a
+    # cache only evicts from itself down to its capacity, its fair share:
+    # overshoot held by the other caches is left for their owner to reclaim
+    # (ShardedStore.reclaim), so one cache's writes never empty it.
+    policy = None
+
+    def __init__(self, capacity, sizer=count_sizer, on_evict=None, budget=None):
+        self.capacity = capacity
+        self.sizer = sizer
+        self.on_evict = on_evict
+        self.budget = budget if budget is not None else Budget(capacity)
+        self.data = {}
+        self.sizes = {}
+        self.used = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        self._on_access(key, value is not None)
+        return value
+
+    def put(self, key, value):
+        # Returns False, storing nothing, for an entry larger than the whole budget.
+        size = self.sizer(key, value)
+        budget = self.budget
+        if size > budget.capacity:
+            return False
+        old = self.sizes.get(key)
+        self.data[key] = value
+        self.sizes[key] = size
+        delta = size if old is None else size - old
+        self.used += delta
+        budget.charge(delta)
+        if old is None:
+            self._on_insert(key)
+        else:
+            self._on_update(key, delta)
+        while self._over() and len(self.data) > 1:
+            self._evict(self._victim())
+        return True
+
+    def _over(self):
+        return self.budget.over() and self.used > self.capacity
+
+    def pop(self, key):
+        if key not in self.data:
+            return None
+        self._on_remove(key)
+        size = self.sizes.pop(key)
+        self.used -= size
+        self.budget.charge(-size)
+        return self.data.pop(key)
+
+    def evict(self):
+        # Evicts the policy's next victim, for an owner reclaiming a shared
+        # budget from this cache.
+        self._evict(self._victim())
+
+    def _evict(self, key):
+        self._on_remove(key)
+        size = self.sizes.pop(key)
+        self.used -= size
+        self.budget.charge(-size)
+        value = self.data.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def keys(self):
+        return list(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        # Reads without counting as an access, for scans and internal copies.
+        return self.data[key]
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        return {"policy": self.policy, "used_bytes": self.used, "capacity_bytes": self.capacity,
+                "entries": len(self.data), "evictions": self.evictions}
+
+    def _on_access(self, key, hit):
+        pass
+
+    def _on_insert(self, key):
+        pass
+
+    def _on_update(self, key, delta):
+        self._on_access(key, True)
+
+    def _on_remove(self, key):
+        pass
+
+    @abstractmethod
+    def _victim(self):
+        pass
+
+
+class LRUCache(BoundedCache):
+    # The store itself is an OrderedDict kept in recency order.
+    policy = "lru"
+
+    def __init__(self, capacity, sizer=count_sizer, on_evict=None, budget=None):
+        super().__init__(capacity, sizer, on_evict, budget)
+        self.data = OrderedDict()
+
+    def _on_access(self, key, hit):
+        if hit:
+            self.data.move_to_end(key)
+
+    def _victim(self):
+        return next(iter(self.data))
+
+
+class ClockCache(BoundedCache):
+    # CLOCK / second chance: a hit only sets a reference bit, so reads never
+    # reorder anything. The hand sweeps from the oldest entry, clearing set
+    # bits and sending those entries round again, and evicts the first entry
+    # whose bit is already clear.
+    policy = "clock"
+
+    def __init__(self, capacity, sizer=count_sizer, on_evict=None, budget=None):
+        super().__init__(capacity, sizer, on_evict, budget)
+        self.data = OrderedDict()
+        self.referenced = {}
+
+    def _on_access(self, key, hit):
+        if hit:
+            self.referenced[key] = True
+
+    def _on_insert(self, key):
+        self.referenced[key] = False
+
+    def _on_remove(self, key):
+        del self.referenced[key]
+
+    def _victim(self):
+        while True:
+            key = next(iter(self.data))
+            if not self.referenced[key]:
+                return key
+            self.referenced[key] = False
+            self.data.move_to_end(key)
+
+
+class ARCCache(BoundedCache):
+    # Adaptive Replacement Cache (Megiddo & Modha), sized in bytes. T1 holds
+    # entries seen once recently, T2 entries seen at least twice; B1 and B2
+    # remember keys recently evicted from each. A miss that hits a ghost
+    # list moves the target size of T1 (p) toward the list that would have
+    # kept it, so a one-off scan only churns T1.
+    policy = "arc"
+
+    def __init__(self, capacity, sizer=count_sizer, on_evict=None, budget=None):
+        super().__init__(capacity, sizer, on_evict, budget)
+        self.t1 = OrderedDict()
+        self.t2 = OrderedDict()
+        self.b1 = OrderedDict()
+        self.b2 = OrderedDict()
+        self.t1_bytes = 0
+        self.p = 0
+        self.ghost_hit = None
+
+    def _on_access(self, key, hit):
+        if key in self.t1:
+            del self.t1[key]
+            self.t1_bytes -= self.sizes[key]
+            self.t2[key] = None
+        elif key in self.t2:
+            self.t2.move_to_end(key)
+
+    def _on_update(self, key, delta):
+        if key in self.t1:
+            self.t1_bytes += delta
+        self._on_access(key, True)
+
+    def _on_insert(self, key):
+        size = self.sizes[key]
+        self.ghost_hit = None
+        if key in self.b1:
+            self.p = min(self.capacity, self.p + max(len(self.b2) / len(self.b1), 1) * size)
+            del self.b1[key]
+            self.ghost_hit = "b1"
+            self.t2[key] = None
+        elif key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) / len(self.b2), 1) * size)
+            del self.b2[key]
+            self.ghost_hit = "b2"
+            self.t2[key] = None
+        else:
+            self.t1[key] = None
+            self.t1_bytes += size
+
+    def _on_remove(self, key):
+        if key in self.t1:
+            del self.t1[key]
+            self.t1_bytes -= self.sizes[key]
+        else:
+            self.t2.pop(key, None)
+
+    def _evict(self, key):
+        ghost = self.b1 if key in self.t1 else self.b2
+        super()._evict(key)
+        ghost[key] = None
+        # Ghost lists remember at most as many keys as are resident.
+        while len(self.b1) + len(self.b2) > max(len(self.data), 1):
+            longer = self.b1 if len(self.b1) >= len(self.b2) else self.b2
+            longer.popitem(last=False)
+
+    def pop(self, key):
+        self.b1.pop(key, None)
+        self.b2.pop(key, None)
+        return super().pop(key)
+
+    def _victim(self):
+        if self.t1 and (self.t1_bytes > self.p or (self.ghost_hit == "b2" and self.t1_bytes >= self.p) or not self.t2):
+            return next(iter(self.t1))
+        return next(iter(self.t2))
+
+
+class CountMinSketch:
+    # Approximate access frequencies in `depth` rows of counters capped at
+    # 15, stored in one bytearray. Every `sample_size` increments all
+    # counters are halved so old popularity fades.
+    def __init__(self, width, depth=4):
+        width = 1 << max(width - 1, 1).bit_length()
+        self.mask = width - 1
+        self.offsets = tuple(row * width for row in range(depth))
+        self.table = bytearray(width * depth)
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def increment(self, key):
+        h = hash(key)
+        step = (h >> 17) | 1
+        mask = self.mask
+        table = self.table
+        for offset in self.offsets:
+            idx = offset + (h & mask)
+            if table[idx] < 15:
+                table[idx] += 1
+            h += step
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def estimate(self, key):
+        h = hash(key)
+        step = (h >> 17) | 1
+        mask = self.mask
+        table = self.table
+        lowest = 15
+        for offset in self.offsets:
+            count = table[offset + (h & mask)]
+            if count < lowest:
+                lowest = count
+            h += step
+        return lowest
+
+    def reset(self):
+        self.table[:] = self.table.translate(_HALVE)
+        self.additions //= 2
+
+
+class TinyLFUCache(BoundedCache):
+    # W-TinyLFU (Einziger, Friedman & Manes). New entries land in a small LRU
+    # window. When the cache is full, the window's oldest entry only enters
+    # the main segmented LRU (probation + protected) if the count-min sketch
+    # says it is more popular than the main space's eviction victim, so a
+    # scan of one-hit keys cannot displace the hot set.
+    policy = "tinylfu"
+
+    def __init__(self, capacity, sizer=count_sizer, on_evict=None, budget=None, window_ratio=0.01,
+                 protected_ratio=0.8, sketch_width=None):
+        super().__init__(capacity, sizer, on_evict, budget)
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.window_bytes = 0
+        self.protected_bytes = 0
+        self.window_cap = max(capacity * window_ratio, 1)
+        self.protected_cap = (capacity - self.window_cap) * protected_ratio
+        if sketch_width is None:
+            sketch_width = min(max(capacity // 512 if sizer is not count_sizer else capacity, 1024), 1 << 22)
+        self.sketch = CountMinSketch(int(sketch_width))
+
+    def _on_access(self, key, hit):
+        self.sketch.increment(key)
+        if not hit:
+            return
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            self.protected_bytes += self.sizes[key]
+            while self.protected_bytes > self.protected_cap and len(self.protected) > 1:
+                demoted, _ = self.protected.popitem(last=False)
+                self.protected_bytes -= self.sizes[demoted]
+                self.probation[demoted] = None
+        else:
+            self.protected.move_to_end(key)
+
+    def _on_update(self, key, delta):
+        if key in self.window:
+            self.window_bytes += delta
+        elif key in self.protected:
+            self.protected_bytes += delta
+        self._on_access(key, True)
+
+    def _on_insert(self, key):
+        self.sketch.increment(key)
+        self.window[key] = None
+        self.window_bytes += self.sizes[key]
+        if not self._over():
+            # Still room overall: window overflow moves to the main space
+            # without any admission contest.
+            while self.window_bytes > self.window_cap and len(self.window) > 1:
+                self._to_probation(next(iter(self.window)))
+
+    def _to_probation(self, key):
+        del self.window[key]
+        self.window_bytes -= self.sizes[key]
+        self.probation[key] = None
+
+    def _on_remove(self, key):
+        if key in self.window:
+            del self.window[key]
+            self.window_bytes -= self.sizes[key]
+        elif key in self.probation:
+            del self.probation[key]
+        else:
+            del self.protected[key]
+            self.protected_bytes -= self.sizes[key]
+
+    def _victim(self):
+        main = self.probation or self.protected
+        if self.window_bytes > self.window_cap and main:
+            candidate = next(iter(self.window))
+            victim = next(iter(main))
+            if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+                self._to_probation(candidate)
+                return victim
+            return candidate
+        if main:
+            return next(iter(main))
+        return next(iter(self.window))
+
+
+POLICIES = {
+    "lru": LRUCache,
+    "clock": ClockCache,
+    "arc": ARCCache,
+    "tinylfu": TinyLFUCache,
+}
+
+
+def make_cache(policy, capacity, sizer=count_sizer, on_evict=None, budget=None):
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy: {policy}")
+    return cls(capacity, sizer, on_evict, budget)
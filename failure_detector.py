@@ -0,0 +1,71 @@
+# failure_detector.py
+
+import math
+import threading
+import time
+from collections import deque
+from config import HEARTBEAT_INTERVAL, PHI_THRESHOLD
+
+
+class PhiAccrualDetector:
+    # Phi accrual failure detector (Hayashibara et al.). For each node it
+    # keeps a window of heartbeat inter-arrival times and reports phi, the
+    # -log10 probability that a heartbeat this late is still coming. A node
+    # is suspected once phi crosses the threshold, so the timeout adapts to
+    # each node's observed jitter instead of being a fixed number of seconds.
+    def __init__(self, threshold=PHI_THRESHOLD, expected_interval=HEARTBEAT_INTERVAL,
+                 window=100, min_std=None):
+        self.threshold = threshold
+        self.expected_interval = expected_interval
+        self.window = window
+        self.min_std = min_std if min_std is not None else expected_interval / 2
+        self._intervals = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, node, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last.get(node)
+            intervals = self._intervals.get(node)
+            if intervals is None:
+                # Seed the history with the configured interval so a node is
+                # judged sensibly before it has sent a few heartbeats.
+                intervals = self._intervals[node] = deque(maxlen=self.window)
+                intervals.append(self.expected_interval)
+            elif last is not None:
+                intervals.append(now - last)
+            self._last[node] = now
+
+    def phi(self, node, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last.get(node)
+            if last is None:
+                return float("inf")
+            intervals = self._intervals[node]
+            mean = sum(intervals) / len(intervals)
+            variance = sum((x - mean) ** 2 for x in intervals) / len(intervals)
+        std = max(math.sqrt(variance), self.min_std)
+        elapsed = now - last
+        # Logistic approximation of the normal CDF tail.
+        y = (elapsed - mean) / std
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if elapsed > mean:
+            p_later = e / (1.0 + e)
+        else:
+            p_later = 1.0 - 1.0 / (1.0 + e)
+        if p_later <= 0:
+            return float("inf")
+        return -math.log10(p_later)
+
+    def is_available(self, node, now=None):
+        return self.phi(node, now) < self.threshold
+
+    def forget(self, node):
+        with self._lock:
+            self._intervals.pop(node, None)
+            self._last.pop(node, None)
+
+    def last_heartbeat(self, node):
+        return self._last.get(node)
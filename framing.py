@@ -0,0 +1,110 @@
+# framing.py
+#
+# Length-prefixed framing shared by the client, primary and workers. Every
+# message is a 4-byte big-endian payload length followed by the payload, so
+# values of any size survive partial TCP reads and connections can carry
+# many requests back to back.
+
+import struct
+import asyncio
+import pickle
+import threading
+from config import MAX_FRAME_SIZE
+
+HEADER = struct.Struct("!I")
+
+
+class FrameError(Exception):
+    pass
+
+
+_local = threading.local()
+
+
+def _recv_buffer(size):
+    # One receive buffer per thread, grown on demand, so steady-state reads
+    # don't allocate a new bytes object per frame.
+    buf = getattr(_local, "buf", None)
+    if buf is None or len(buf) < size:
+        buf = bytearray(max(size, 4096))
+        _local.buf = buf
+    return buf
+
+
+def recv_exactly(sock, view):
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:], total - received)
+        if n == 0:
+            if received == 0:
+                return False
+            raise ConnectionError("Connection closed mid-frame")
+        received += n
+    return True
+
+
+def send_frame(sock, payload, max_size=MAX_FRAME_SIZE):
+    size = len(payload)
+    if size > max_size:
+        raise FrameError(f"Frame of {size} bytes exceeds limit of {max_size}")
+    if size < 65536:
+        sock.sendall(HEADER.pack(size) + payload)
+    else:
+        sock.sendall(HEADER.pack(size))
+        sock.sendall(payload)
+
+
+def recv_frame(sock, max_size=MAX_FRAME_SIZE):
+    # Returns a memoryview into this thread's receive buffer, valid until the
+    # next recv_frame call on the same thread, or None on a clean close.
+    header = bytearray(HEADER.size)
+    if not recv_exactly(sock, memoryview(header)):
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > max_size:
+        raise FrameError(f"Frame of {size} bytes exceeds limit of {max_size}")
+    view = memoryview(_recv_buffer(size))[:size]
+    if size and not recv_exactly(sock, view):
+        raise ConnectionError("Connection closed mid-frame")
+    return view
+
+
+def send_message(sock, message, codec=None):
+    if codec is None:
+        send_frame(sock, pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+    else:
+        send_frame(sock, codec.encode(message))
+
+
+def recv_message(sock, codec=None):
+    frame = recv_frame(sock)
+    if frame is None:
+        return None
+    if codec is None:
+        return pickle.loads(frame)
+    return codec.decode(frame)
+
+
+async def read_frame(reader, max_size=MAX_FRAME_SIZE):
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Connection closed mid-frame")
+    (size,) = HEADER.unpack(header)
+    if size > max_size:
+        raise FrameError(f"Frame of {size} bytes exceeds limit of {max_size}")
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed mid-frame")
+
+
+def write_frame(writer, payload, max_size=MAX_FRAME_SIZE):
+    size = len(payload)
+    if size > max_size:
+        raise FrameError(f"Frame of {size} bytes exceeds limit of {max_size}")
+    writer.write(HEADER.pack(size))
+    writer.write(payload)
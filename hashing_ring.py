@@ -2,72 +2,236 @@
 
 import hashlib
 import bisect
+import struct
+from array import array
+from heapq import merge
 from config import WORKER_NODES, VIRTUAL_NODES, WORKER_PORTS, REPLICATION_FACTOR
+from log import get_logger
+
+# numpy (in requirements.txt) vectorizes the batch lookups in get_nodes and
+# replicas_for_hashes. Without it they still work but are scalar: one bisect
+# per key, no faster than calling get_node in a loop.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = get_logger("HashRing")
+
+_unpack_u64 = struct.Struct(">Q").unpack_from
+_blake2b = hashlib.blake2b
+
+
+def ring_hash(key):
+    # 64-bit BLAKE2b: positions on the ring are unsigned 64-bit tokens.
+    return _unpack_u64(_blake2b(key.encode(), digest_size=8).digest())[0]
+
+
+def in_ranges(h, ranges):
+    # Ranges are half-open [start, end) token intervals; start >= end wraps
+    # around the top of the ring.
+    for start, end in ranges:
+        if start < end:
+            if start <= h < end:
+                return True
+        elif h >= start or h < end:
+            return True
+    return False
+
 
-        
 class ConsistentHashRing:
-    def __init__(self, nodes=None, vnodes=100):
-        self.ring = {}
-        self.sorted_keys = []
+    # The ring is a sorted array of 64-bit tokens with a parallel array of
+    # owner indices into `nodes`. Each topology change builds a new
+    # (nodes, tokens, owners, preference lists) snapshot and swaps it in with
+    # one assignment, so lookups on other threads always see a consistent ring.
+    def __init__(self, nodes=None, vnodes=VIRTUAL_NODES, replication_factor=REPLICATION_FACTOR):
         self.vnodes = vnodes
-        self.nodes =  []
+        self.replication_factor = replication_factor
+        self._node_tokens = {}
+        self._state = ((), array("Q"), array("H"), [])
+        self._np_state = None
+        # Bumped on every membership change so holders of a topology copy
+        # can tell it is stale.
+        self.epoch = 0
 
+        nodes = list(dict.fromkeys(nodes or []))
         for node in nodes:
-            self.add_node(node)
+            self._node_tokens[node] = self._vnode_tokens(node)
+        pairs = sorted((token, idx) for idx, node in enumerate(nodes) for token in self._node_tokens[node])
+        self._set_state(tuple(nodes), pairs)
 
     def _hash(self, key):
-        return int(hashlib.md5(key.encode()).hexdigest(), 16)
+        return ring_hash(key)
+
+    def _vnode_tokens(self, node):
+        return sorted(ring_hash(f"{node}-vn{i}") for i in range(self.vnodes))
+
+    def _set_state(self, nodes, pairs):
+        tokens = array("Q", [token for token, _ in pairs])
+        owners = array("H", [idx for _, idx in pairs])
+        self._state = (nodes, tokens, owners, self._preference_lists(nodes, owners))
+        self._np_state = None
+        self.epoch += 1
+
+    def _preference_lists(self, nodes, owners):
+        # For every token, the first `replication_factor` distinct nodes met
+        # walking clockwise from it. Ranges that share a list share one tuple.
+        size = len(owners)
+        wanted = min(self.replication_factor, len(nodes))
+        interned = {}
+        prefs = []
+        for start in range(size):
+            picked = []
+            idx = start
+            while len(picked) < wanted and idx < start + size:
+                owner = owners[idx % size]
+                if owner not in picked:
+                    picked.append(owner)
+                idx += 1
+            key = tuple(picked)
+            pref = interned.get(key)
+            if pref is None:
+                pref = interned[key] = tuple(nodes[owner] for owner in picked)
+            prefs.append(pref)
+        return prefs
+
+    @property
+    def nodes(self):
+        return list(self._state[0])
+
+    @property
+    def tokens(self):
+        return self._state[1]
 
     def add_node(self, node):
-        for i in range(self.vnodes):
-            vnode_key = f"{node}-vn{i}"
-            h = self._hash(vnode_key)
-            self.ring[h] = node
-            bisect.insort(self.sorted_keys, h)
-        self.nodes.append(node)
+        nodes, tokens, owners, _ = self._state
+        if node in nodes:
+            return
+        idx = len(nodes)
+        new_tokens = self._node_tokens.get(node) or self._vnode_tokens(node)
+        self._node_tokens[node] = new_tokens
+        # Both sides are already sorted, so one linear merge rebuilds the ring.
+        pairs = list(merge(zip(tokens, owners), ((token, idx) for token in new_tokens)))
+        self._set_state(nodes + (node,), pairs)
 
     def remove_node(self, node):
-        keys_to_remove = [h for h, n in self.ring.items() if n == node]
-        for h in keys_to_remove:
-            try:
-                self.ring.pop(h)
-                self.sorted_keys.remove(h)
-            except ValueError:
-                continue  
-        self.nodes = [n for n in self.nodes if n != node]
-        print(f"Removed node {node} (cleaned {len(keys_to_remove)} vnodes)")
-
+        nodes, tokens, owners, _ = self._state
+        if node not in nodes:
+            return
+        removed = nodes.index(node)
+        pairs = [
+            (token, owner - 1 if owner > removed else owner)
+            for token, owner in zip(tokens, owners)
+            if owner != removed
+        ]
+        self._set_state(nodes[:removed] + nodes[removed + 1:], pairs)
+        log.info("Removed node %s (cleaned %d vnodes)", node, len(tokens) - len(pairs))
 
     def get_node(self, key):
-        if not self.ring:
+        nodes, tokens, owners, _ = self._state
+        if not tokens:
             return None
-        h = self._hash(key)
-        idx = bisect.bisect(self.sorted_keys, h)
-        if idx == len(self.sorted_keys):
+        idx = bisect.bisect(tokens, ring_hash(key))
+        if idx == len(tokens):
             idx = 0
-        return self.ring[self.sorted_keys[idx]]
+        return nodes[owners[idx]]
+
+    def get_nodes(self, keys):
+        # Batch form of get_node. With numpy available the token search is
+        # vectorized; otherwise it falls back to one bisect per key.
+        nodes, tokens, owners, _ = self._state
+        if not tokens:
+            return [None] * len(keys)
+        hashes = [_unpack_u64(_blake2b(key.encode(), digest_size=8).digest())[0] for key in keys]
+        return [nodes[owners[idx]] for idx in self._token_indices(hashes)]
+
+    def replicas_for_hashes(self, hashes, count=None):
+        # Batch form of replicas_for_hash: one preference list per hash.
+        _, tokens, _, prefs = self._state
+        if not tokens:
+            return [[] for _ in hashes]
+        return [list(prefs[idx] if count is None else prefs[idx][:count]) for idx in self._token_indices(hashes)]
+
+    def _token_indices(self, hashes):
+        # Index of the token owning each hash (the first token strictly
+        # greater, wrapping to 0).
+        tokens, owners = self._state[1], self._state[2]
+        if np is not None:
+            np_state = self._np_state
+            if np_state is None or np_state[0] is not tokens:
+                np_state = self._np_state = (
+                    tokens, np.frombuffer(tokens, dtype=np.uint64), np.frombuffer(owners, dtype=np.uint16))
+            np_tokens = np_state[1]
+            idx = np.searchsorted(np_tokens, np.array(hashes, dtype=np.uint64), side="right")
+            idx[idx == len(tokens)] = 0
+            return idx.tolist()
+
+        size = len(tokens)
+        find = bisect.bisect
+        return [find(tokens, h) % size for h in hashes]
+
+    def replicas_for_hash(self, h, count=None):
+        nodes, tokens, owners, prefs = self._state
+        if not tokens:
+            return []
+        pref = prefs[bisect.bisect(tokens, h) % len(tokens)]
+        return list(pref if count is None else pref[:count])
+
+    def ranges(self):
+        # Yields (start, end, preference list) for every token range. A key
+        # hashing to h belongs to the first token strictly greater than h,
+        # so token i covers [token i-1, token i).
+        nodes, tokens, owners, prefs = self._state
+        for i in range(len(tokens)):
+            yield tokens[i - 1], tokens[i], prefs[i]
+
+    def ranges_for(self, node):
+        # The ranges whose preference list includes node.
+        for start, end, pref in self.ranges():
+            if node in pref:
+                yield start, end, pref
 
     def get_replicas(self, key, count=2):
-        if not self.sorted_keys:
+        nodes, tokens, owners, prefs = self._state
+        if not tokens:
             return []
 
-        h = self._hash(key)
-        idx = bisect.bisect(self.sorted_keys, h)
-        replicas = set()
-        active_nodes = set(self.nodes)  
-        attempts = 0  
-        while len(replicas) < min(count, len(active_nodes)) and attempts < len(self.sorted_keys):
-            node = self.ring[self.sorted_keys[idx % len(self.sorted_keys)]]
-            if node in active_nodes:
-                replicas.add(node)
+        idx = bisect.bisect(tokens, ring_hash(key))
+        size = len(tokens)
+        if count <= self.replication_factor:
+            return list(prefs[idx % size][:count])
+
+        # Deeper lists than the precomputed replication factor walk the ring.
+        wanted = min(count, len(nodes))
+        replicas = []
+        attempts = 0
+        while len(replicas) < wanted and attempts < size:
+            node = nodes[owners[idx % size]]
+            if node not in replicas:
+                replicas.append(node)
             idx += 1
             attempts += 1
 
-        return list(replicas)
+        return replicas
+
+
+def moved_ranges(old_ring, new_ring, node):
+    # Token ranges `node` replicates in new_ring, grouped by the node that
+    # owns each range in old_ring: {source: [(start, end), ...]}. Every old
+    # token is also in new_ring, so each new range falls inside a single
+    # old range and one lookup at its start finds the old owners.
+    by_source = {}
+    for start, end, _ in new_ring.ranges_for(node):
+        sources = [n for n in old_ring.replicas_for_hash(start) if n != node]
+        if not sources:
+            continue
+        ranges = by_source.setdefault(sources[0], [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return by_source
 
-    
-        
-    
 
 # if __name__ == "__main__":
 #     import sys
@@ -77,6 +241,5 @@ class ConsistentHashRing:
 #         primary = ring.get_node(key)
 #         replicas = ring.get_replicas(key, REPLICATION_FACTOR)
 #         print(f"Key '{key}' -> Primary: {primary}, Replicas: {replicas}")
-    
-    
+
 
@@ -0,0 +1,54 @@
+# hlc.py
+
+import threading
+import time
+from config import HLC_MAX_DRIFT
+
+# A timestamp is one 64-bit integer: wall-clock milliseconds in the high 48
+# bits and a logical counter in the low 16, so versions compare with plain
+# integer comparison and still fit the wire codec's fixed-size ints.
+LOGICAL_BITS = 16
+
+
+def physical_ms(timestamp):
+    return timestamp >> LOGICAL_BITS
+
+
+class HybridLogicalClock:
+    # Hybrid logical clock (Kulkarni et al.). now() never goes backwards and
+    # stays close to wall-clock time; update() folds in a timestamp seen
+    # elsewhere, so after a restart on a lagging clock new versions still
+    # order after the data the cluster already holds. Remote timestamps more
+    # than max_drift seconds ahead of the local clock are ignored rather than
+    # dragging every later version into the future.
+    def __init__(self, clock=time.time, max_drift=HLC_MAX_DRIFT):
+        self.clock = clock
+        self.max_drift_ms = int(max_drift * 1000)
+        self.lock = threading.Lock()
+        self.last = 0
+
+    def _wall(self):
+        return int(self.clock() * 1000)
+
+    def now(self):
+        wall = self._wall()
+        with self.lock:
+            if wall > physical_ms(self.last):
+                self.last = wall << LOGICAL_BITS
+            else:
+                # Same millisecond (or the clock stepped back): count
+                # logically; a full counter carries into the physical part.
+                self.last += 1
+            return self.last
+
+    def update(self, remote):
+        # Returns False when `remote` was rejected as too far ahead.
+        if not remote:
+            return True
+        wall = self._wall()
+        if physical_ms(remote) > wall + self.max_drift_ms:
+            return False
+        with self.lock:
+            if remote > self.last:
+                self.last = remote
+        return True
@@ -0,0 +1,41 @@
+# latency.py
+
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    # Keeps a sliding window of recent request latencies per node. Percentiles
+    # are recomputed every `refresh` samples rather than on every lookup.
+    def __init__(self, window=256, refresh=32):
+        self.window = window
+        self.refresh = refresh
+        self._samples = {}
+        self._cached = {}
+        self._since_refresh = {}
+        self._lock = threading.Lock()
+
+    def record(self, node, seconds):
+        with self._lock:
+            samples = self._samples.get(node)
+            if samples is None:
+                samples = self._samples[node] = deque(maxlen=self.window)
+                self._since_refresh[node] = 0
+            samples.append(seconds)
+            self._since_refresh[node] += 1
+            if self._since_refresh[node] >= self.refresh:
+                self._since_refresh[node] = 0
+                self._cached.pop(node, None)
+
+    def percentile(self, node, pct, default=None):
+        with self._lock:
+            cached = self._cached.get(node)
+            if cached is not None and cached[0] == pct:
+                return cached[1]
+            samples = self._samples.get(node)
+            if not samples:
+                return default
+            ordered = sorted(samples)
+            value = ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+            self._cached[node] = (pct, value)
+            return value
@@ -0,0 +1,411 @@
+# loadgen.py
+
+import argparse
+import bisect
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from config import PRIMARY_SERVER_PORT, WORKER_NODES, WORKER_PORTS, SERVER_MODE
+from framing import send_message, recv_message
+from codec import open_connection
+from smart_client import SmartClient
+from workload import ZipfGenerator
+
+ACTIONS = ("GET", "SET", "DELETE")
+PRELOAD_BATCH = 1000
+
+
+def parse_mix(text):
+    # "get=0.8,set=0.15,delete=0.05" -> [(action, cumulative weight), ...]
+    weights = {}
+    for part in text.split(","):
+        action, _, weight = part.partition("=")
+        action = action.strip().upper()
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action {action!r} in mix")
+        weights[action] = float(weight)
+    total = sum(weights.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than 0")
+    mix, cumulative = [], 0.0
+    for action, weight in weights.items():
+        cumulative += weight / total
+        mix.append((action, cumulative))
+    return mix
+
+
+def parse_size(text):
+    # "100" or "64-1024" (bytes, drawn uniformly) -> (low, high)
+    low, _, high = text.partition("-")
+    low = int(low)
+    return low, int(high) if high else low
+
+
+class KeyChooser:
+    # Draws key ranks 0..keys-1. "zipf" favours low ranks with exponent
+    # `alpha`; "hotspot" sends `hot_weight` of the draws to the first
+    # `hot_fraction` of the keyspace and spreads the rest uniformly.
+    def __init__(self, dist, keys, seed, alpha=0.99, hot_fraction=0.1, hot_weight=0.9, zipf=None):
+        self.dist = dist
+        self.keys = keys
+        self.random = random.Random(seed)
+        self.hot_keys = max(1, int(keys * hot_fraction))
+        self.hot_weight = hot_weight
+        self.zipf = None
+        if dist == "zipf":
+            # The CDF is shared between threads; only the draws are per thread.
+            self.zipf = zipf or ZipfGenerator(keys, alpha)
+
+    def next(self):
+        if self.dist == "zipf":
+            zipf = self.zipf
+            return min(bisect.bisect(zipf.cdf, self.random.random() * zipf.total), self.keys - 1)
+        if self.dist == "hotspot":
+            if self.random.random() < self.hot_weight or self.hot_keys == self.keys:
+                return self.random.randrange(self.hot_keys)
+            return self.random.randrange(self.hot_keys, self.keys)
+        return self.random.randrange(self.keys)
+
+
+def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("localhost", port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def port_in_use(port):
+    try:
+        with socket.create_connection(("localhost", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+
+class Cluster:
+    # The primary and `workers` workers as local subprocesses. Workers start
+    # first so the primary's startup probe puts them all in the ring. Each
+    # process logs to its own file under log_dir.
+    def __init__(self, workers, log_dir, server_mode=SERVER_MODE):
+        self.nodes = WORKER_NODES[:workers]
+        self.log_dir = log_dir
+        self.server_mode = server_mode
+        self.processes = []
+
+    def spawn(self, args, name):
+        log_file = os.path.join(self.log_dir, f"{name}.log")
+        proc = subprocess.Popen([sys.executable] + args + ["--mode", self.server_mode, "--log-file", log_file],
+                                stdout=subprocess.DEVNULL, stderr=open(os.path.join(self.log_dir, f"{name}.err"), "w"),
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.processes.append(proc)
+
+    def start(self):
+        busy = [port for port in [PRIMARY_SERVER_PORT] + [WORKER_PORTS[n] for n in self.nodes] if port_in_use(port)]
+        if busy:
+            raise RuntimeError(f"Ports {busy} already in use; stop the running cluster or pass --no-start")
+        for node in self.nodes:
+            self.spawn(["worker_node.py", node], node)
+        for node in self.nodes:
+            if not wait_for_port(WORKER_PORTS[node], 10):
+                raise RuntimeError(f"Worker {node} did not start; see {self.log_dir}")
+        self.spawn(["primary_server.py"], "primary")
+        if not wait_for_port(PRIMARY_SERVER_PORT, 10):
+            raise RuntimeError(f"Primary did not start; see {self.log_dir}")
+
+    def stop(self):
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+class PrimaryClient:
+    # One keep-alive connection to the primary per load thread.
+    def __init__(self):
+        self.sock = None
+
+    def request(self, message):
+        if self.sock is None:
+            self.sock, self.codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=10)
+        try:
+            send_message(self.sock, message, self.codec)
+            reply = recv_message(self.sock, self.codec)
+        except Exception:
+            self.close()
+            raise
+        if reply is None:
+            self.close()
+            raise ConnectionError("primary closed the connection")
+        return reply
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class SmartLoadClient:
+    # Adapts the shared SmartClient (thread-safe, pooled) to request().
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, message):
+        action = message["action"]
+        if action == "GET":
+            return self.client.get(message["key"])
+        if action == "SET":
+            return self.client.set(message["key"], message["value"])
+        return self.client.delete(message["key"])
+
+    def close(self):
+        pass
+
+
+def succeeded(action, reply):
+    status = reply.get("status")
+    if action == "SET":
+        return status == "STORED"
+    return status != "ERROR"
+
+
+class LoadThread(threading.Thread):
+    # Issues requests back to back (closed loop) or on a fixed schedule
+    # (open loop). In open loop, latency runs from when a request was due,
+    # not when it was sent: a stall that delays later requests shows up in
+    # their latency instead of being hidden by sending fewer of them
+    # (coordinated omission). `service` keeps send-to-reply times as well.
+    def __init__(self, index, args, client, start_at, warmup_until, end_at, interval, zipf):
+        super().__init__(daemon=True)
+        self.args = args
+        self.client = client
+        self.start_at = start_at
+        self.warmup_until = warmup_until
+        self.end_at = end_at
+        self.interval = interval
+        self.offset = index * interval / args.concurrency if interval else 0
+        # Separate streams for actions and keys, so the two draws are independent.
+        self.random = random.Random(f"{args.seed}:{index}:actions")
+        self.keys = KeyChooser(args.dist, args.keys, f"{args.seed}:{index}:keys", args.alpha,
+                               args.hot_fraction, args.hot_weight, zipf)
+        self.value = "v" * args.value_size[1]
+        # action -> [latencies], [service times], errors, hits
+        self.latency = {action: [] for action in ACTIONS}
+        self.service = {action: [] for action in ACTIONS}
+        self.errors = dict.fromkeys(ACTIONS, 0)
+        self.hits = 0
+        self.finished = warmup_until
+
+    def next_message(self):
+        draw = self.random.random()
+        action = next((a for a, cumulative in self.args.mix if draw < cumulative), self.args.mix[-1][0])
+        message = {"action": action, "key": f"key:{self.keys.next()}"}
+        if action == "SET":
+            low, high = self.args.value_size
+            message["value"] = self.value[:self.random.randint(low, high)] if high > low else self.value
+        return message
+
+    def run(self):
+        now = time.perf_counter
+        due = self.start_at + self.offset
+        sequence = 0
+        while True:
+            if self.interval:
+                due = self.start_at + self.offset + sequence * self.interval
+                if due >= self.end_at:
+                    break
+                delay = due - now()
+                if delay > 0:
+                    time.sleep(delay)
+                sequence += 1
+            message = self.next_message()
+            sent = now()
+            if not self.interval:
+                if sent >= self.end_at:
+                    break
+                due = sent
+            action = message["action"]
+            try:
+                reply = self.client.request(message)
+                ok = succeeded(action, reply)
+            except Exception:
+                reply, ok = None, False
+            done = now()
+            if due < self.warmup_until:
+                continue
+            if not ok:
+                self.errors[action] += 1
+                continue
+            self.finished = done
+            self.latency[action].append(done - due)
+            self.service[action].append(done - sent)
+            if action == "GET" and reply.get("value") is not None:
+                self.hits += 1
+        self.client.close()
+
+
+def summarize(samples):
+    # Exact percentiles from the raw samples, in milliseconds.
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def pct(p):
+        return round(ordered[min(count - 1, int(count * p / 100))] * 1000, 3)
+
+    return {"count": count, "mean": round(sum(ordered) / count * 1000, 3), "p50": pct(50), "p90": pct(90),
+            "p99": pct(99), "p999": pct(99.9), "max": round(ordered[-1] * 1000, 3)}
+
+
+def preload(args):
+    # Writes every key once through the primary's MSET so GETs can hit.
+    client = PrimaryClient()
+    value = "v" * args.value_size[0]
+    for start in range(0, args.keys, PRELOAD_BATCH):
+        items = {f"key:{i}": value for i in range(start, min(start + PRELOAD_BATCH, args.keys))}
+        client.request({"action": "MSET", "items": items})
+    client.close()
+
+
+def cluster_counters():
+    try:
+        return PrimaryClient().request({"action": "STATS"}).get("cluster", {}).get("counters")
+    except Exception:
+        return None
+
+
+def run(args):
+    zipf = ZipfGenerator(args.keys, args.alpha) if args.dist == "zipf" else None
+    smart = SmartClient() if args.client == "smart" else None
+    interval = args.concurrency / args.rate if args.loop == "open" else 0
+
+    start_at = time.perf_counter() + 0.2
+    warmup_until = start_at + args.warmup
+    end_at = warmup_until + args.duration
+    threads = []
+    for i in range(args.concurrency):
+        client = SmartLoadClient(smart) if smart else PrimaryClient()
+        threads.append(LoadThread(i, args, client, start_at, warmup_until, end_at, interval, zipf))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if smart is not None:
+        smart.close()
+
+    latency = {action: [] for action in ACTIONS}
+    service = {action: [] for action in ACTIONS}
+    errors = dict.fromkeys(ACTIONS, 0)
+    hits = 0
+    # Requests due in the window can finish after it when the cluster falls
+    # behind, so throughput is over the time actually taken.
+    elapsed = max(max(thread.finished for thread in threads) - warmup_until, args.duration)
+    for thread in threads:
+        for action in ACTIONS:
+            latency[action].extend(thread.latency[action])
+            service[action].extend(thread.service[action])
+            errors[action] += thread.errors[action]
+        hits += thread.hits
+
+    completed = sum(len(samples) for samples in latency.values())
+    gets = len(latency["GET"])
+    result = {
+        "ops": completed,
+        "errors": sum(errors.values()),
+        "throughput": round(completed / elapsed, 1),
+        "elapsed": round(elapsed, 3),
+        "get_hit_ratio": round(hits / gets, 4) if gets else None,
+        "latency_ms": summarize([t for samples in latency.values() for t in samples]),
+        "service_ms": summarize([t for samples in service.values() for t in samples]),
+        "by_action": {action: {"latency_ms": summarize(latency[action]), "service_ms": summarize(service[action]),
+                               "errors": errors[action]}
+                      for action in ACTIONS if latency[action] or errors[action]},
+    }
+    if args.loop == "open":
+        result["target_rate"] = args.rate
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the cache cluster")
+    parser.add_argument("--workers", type=int, default=len(WORKER_NODES), help="Workers to start")
+    parser.add_argument("--no-start", action="store_true", help="Use the cluster already running")
+    parser.add_argument("--server-mode", choices=["thread", "async"], default=SERVER_MODE)
+    parser.add_argument("--client", choices=["primary", "smart"], default="primary",
+                        help="Send through the primary or route to workers with SmartClient")
+    parser.add_argument("--loop", choices=["closed", "open"], default="closed")
+    parser.add_argument("--rate", type=float, default=1000, help="Open loop: requests per second in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="Load threads, one connection each")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds run before measuring")
+    parser.add_argument("--mix", type=parse_mix, default="get=0.9,set=0.1")
+    parser.add_argument("--keys", type=int, default=100000, help="Keyspace size")
+    parser.add_argument("--dist", choices=["uniform", "zipf", "hotspot"], default="zipf")
+    parser.add_argument("--alpha", type=float, default=0.99, help="Zipf exponent")
+    parser.add_argument("--hot-fraction", type=float, default=0.1, help="Hotspot: share of keys that are hot")
+    parser.add_argument("--hot-weight", type=float, default=0.9, help="Hotspot: share of requests to hot keys")
+    parser.add_argument("--value-size", type=parse_size, default="100", help="Bytes, or a range like 64-1024")
+    parser.add_argument("--no-preload", action="store_true", help="Skip writing every key before the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--label", help="Name stored with the results, for comparing runs")
+    args = parser.parse_args()
+    if args.loop == "open" and args.rate <= 0:
+        parser.error("--rate must be positive in open loop")
+
+    cluster = None
+    log_dir = tempfile.mkdtemp(prefix="loadgen-")
+    try:
+        if not args.no_start:
+            cluster = Cluster(args.workers, log_dir, args.server_mode)
+            print(f"Starting primary and {args.workers} workers (logs in {log_dir})")
+            cluster.start()
+        if not args.no_preload:
+            started = time.perf_counter()
+            preload(args)
+            print(f"Preloaded {args.keys} keys in {time.perf_counter() - started:.1f}s")
+        print(f"{args.loop} loop, {args.concurrency} threads"
+              + (f" at {args.rate:g} req/s" if args.loop == "open" else "")
+              + f", {args.dist} keys over {args.keys}, {args.duration:g}s after {args.warmup:g}s warmup")
+        result = run(args)
+        result["server_counters"] = cluster_counters()
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    result["config"] = {
+        "label": args.label, "workers": None if args.no_start else args.workers, "server_mode": args.server_mode,
+        "client": args.client, "loop": args.loop, "rate": args.rate if args.loop == "open" else None,
+        "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+        "mix": {action: round(cumulative - previous, 6) for (action, cumulative), previous
+                in zip(args.mix, [0.0] + [c for _, c in args.mix])},
+        "keys": args.keys, "dist": args.dist,
+        "alpha": args.alpha, "hot_fraction": args.hot_fraction, "hot_weight": args.hot_weight,
+        "value_size": list(args.value_size), "preload": not args.no_preload, "seed": args.seed,
+    }
+    lat = result["latency_ms"] or {}
+    print(f"{result['ops']} ops, {result['errors']} errors, {result['throughput']:,.0f} ops/s")
+    print(f"latency ms  p50 {lat.get('p50')}  p99 {lat.get('p99')}  p999 {lat.get('p999')}  max {lat.get('max')}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# log.py
+
+import atexit
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_MAX_BYTES, LOG_BACKUPS
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {number: name for name, number in LEVELS.items()}
+
+
+def format_record(record):
+    created, level, name, message, args = record
+    if args:
+        try:
+            message = message % args
+        except (TypeError, ValueError):
+            message = f"{message} {args}"
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+    return f"{stamp}.{int(created * 1000) % 1000:03d} {LEVEL_NAMES[level]:<7} [{name}] {message}\n"
+
+
+class LogWriter:
+    # Moves log I/O off the request path. Callers only append a tuple to a
+    # bounded queue; a background thread formats the records, writes them in
+    # batches with one flush per batch and rotates the file by size. When
+    # the queue is full the record is dropped and counted instead of
+    # blocking the caller, and the next batch reports how many were lost.
+    def __init__(self, path=None, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, queue_size=LOG_QUEUE_SIZE,
+                 batch=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch = batch
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.reported = 0
+        self.written = 0
+        self.file = None
+        self.size = 0
+        threading.Thread(target=self.run, daemon=True, name="log-writer").start()
+
+    def submit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def run(self):
+        while True:
+            records = [self.queue.get()]
+            try:
+                while len(records) < self.batch:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            lines = []
+            with self.lock:
+                lost = self.dropped - self.reported
+                self.reported = self.dropped
+            if lost:
+                lines.append(format_record((time.time(), WARNING, "log", "Dropped %d messages", (lost,))))
+            lines.extend(format_record(record) for record in records)
+            try:
+                self.write("".join(lines))
+            except OSError as e:
+                sys.stderr.write(f"[log] Write failed: {e}\n")
+            self.written += len(records)
+            for _ in records:
+                self.queue.task_done()
+
+    def write(self, text):
+        if self.path is None:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        data = text.encode("utf-8", "replace")
+        if self.file is None:
+            self.file = open(self.path, "ab")
+            self.size = self.file.tell()
+        elif self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        # path -> path.1 -> ... -> path.<backups>; the oldest is overwritten.
+        self.file.close()
+        if self.backups:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+            self.file = open(self.path, "ab")
+        else:
+            self.file = open(self.path, "wb")
+        self.size = 0
+
+    def flush(self, timeout=None):
+        # Waits until every queued record has been written, or `timeout`.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stats(self):
+        return {"dropped": self.dropped, "written": self.written, "queued": self.queue.qsize()}
+
+
+_state = {"level": LEVELS[LOG_LEVEL], "writer": None}
+_state_lock = threading.Lock()
+_loggers = {}
+
+
+def configure(path=None, level=LOG_LEVEL, **kwargs):
+    # Call once at startup, before the first message, to pick the level and
+    # send the log to a size-rotated file instead of stdout.
+    with _state_lock:
+        _state["level"] = LEVELS[level.upper()]
+        _state["writer"] = LogWriter(path, **kwargs)
+
+
+def writer():
+    current = _state["writer"]
+    if current is None:
+        with _state_lock:
+            if _state["writer"] is None:
+                _state["writer"] = LogWriter()
+            current = _state["writer"]
+    return current
+
+
+def stats():
+    current = _state["writer"]
+    return current.stats() if current is not None else {"dropped": 0, "written": 0, "queued": 0}
+
+
+def flush(timeout=None):
+    if _state["writer"] is not None:
+        _state["writer"].flush(timeout)
+
+
+# Give queued messages a moment to reach the log when the process exits.
+atexit.register(flush, 1.0)
+
+
+class Logger:
+    # Messages take %-style arguments that are only formatted by the writer
+    # thread, so a filtered or sampled-out call costs a comparison. `sample`
+    # keeps roughly that fraction of a message's calls, for lines that can
+    # fire on every request.
+    def __init__(self, name):
+        self.name = name
+
+    def log(self, level, message, *args, sample=None):
+        if level < _state["level"]:
+            return
+        if sample is not None and random.random() >= sample:
+            return
+        writer().submit((time.time(), level, self.name, message, args))
+
+    def debug(self, message, *args, sample=None):
+        self.log(DEBUG, message, *args, sample=sample)
+
+    def info(self, message, *args, sample=None):
+        self.log(INFO, message, *args, sample=sample)
+
+    def warning(self, message, *args, sample=None):
+        self.log(WARNING, message, *args, sample=sample)
+
+    def error(self, message, *args, sample=None):
+        self.log(ERROR, message, *args, sample=sample)
+
+
+def get_logger(name):
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, Logger(name))
+    return logger
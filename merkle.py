@@ -0,0 +1,202 @@
+# merkle.py
+
+import bisect
+from hashing_ring import ring_hash
+
+# The tree covers the whole 64-bit token space: ARITY children per node and
+# DEPTH levels below the root, so each of the ARITY ** DEPTH leaves owns an
+# equal slice of the ring. Node `index` at level `level` covers tokens
+# [index << shift, (index + 1) << shift) with shift = 64 - LEVEL_BITS * level.
+ARITY = 16
+DEPTH = 4
+LEVEL_BITS = 4
+LEAF_SHIFT = 64 - LEVEL_BITS * DEPTH
+LEAF_COUNT = ARITY ** DEPTH
+RING_SIZE = 1 << 64
+
+MASK = RING_SIZE - 1
+
+# Salt for the digests of deleted keys, so a tombstone never hashes like a
+# live entry of the same version.
+TOMBSTONE_SALT = 0xD1B54A32D192ED03
+
+
+def key_digest(token, version, salt=0):
+    # Digest of one (key, version) pair from the key's ring token, so no
+    # second hash of the key is needed: the splitmix64 finalizer spreads
+    # every version change over all 64 bits. Replicas holding the same
+    # version of a key produce the same digest.
+    z = (token ^ (version * 0x9E3779B97F4A7C15) ^ salt) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+def node_span(level, index):
+    shift = 64 - LEVEL_BITS * level
+    return index << shift, (index + 1) << shift
+
+
+def range_intervals(ranges):
+    # Token ranges as sorted, merged, non-wrapping [start, end) intervals so
+    # a tree node can be tested against them directly.
+    intervals = []
+    for start, end in ranges:
+        if start < end:
+            intervals.append((start, end))
+        else:
+            intervals.append((start, RING_SIZE))
+            if end:
+                intervals.append((0, end))
+    intervals.sort()
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def coverage(level, index, intervals):
+    # "full" when the node's span lies inside the intervals, "partial" when
+    # it only overlaps them, None when it is disjoint.
+    low, high = node_span(level, index)
+    pos = bisect.bisect_right(intervals, (low, RING_SIZE))
+    if pos:
+        start, end = intervals[pos - 1]
+        if high <= end:
+            return "full"
+        if low < end:
+            return "partial"
+    if pos < len(intervals) and intervals[pos][0] < high:
+        return "partial"
+    return None
+
+
+def in_intervals(h, intervals):
+    pos = bisect.bisect_right(intervals, (h, RING_SIZE))
+    return pos > 0 and h < intervals[pos - 1][1]
+
+
+def merge_pages(pages, count):
+    # Combines SCAN pages from several sources. Each page is (items, next):
+    # items are (token, key) pairs covering every key from the shared cursor
+    # up to `next` (None once the source is exhausted). The merged page
+    # stops at the lowest `next`, and at `count` distinct items, so it is
+    # complete up to the cursor it returns however the sources were cut.
+    # A key several sources hold (replicas) is listed once.
+    bound = min((nxt for _, nxt in pages if nxt is not None), default=None)
+    items = sorted({item for page, _ in pages for item in page if bound is None or item[0] < bound})
+    if len(items) > count:
+        cut = count
+        # Keys sharing a token are never split across pages.
+        while cut < len(items) and items[cut][0] == items[cut - 1][0]:
+            cut += 1
+        if cut < len(items):
+            # Resume at the first key after the last one returned.
+            bound = items[cut][0]
+            items = items[:cut]
+    return items, bound
+
+
+class MerkleTree:
+    # XOR hash tree kept up to date on every write. A node's hash is the XOR
+    # of the digests of every key below it, so adding, replacing or removing
+    # a key updates one node per level in O(DEPTH) without rehashing
+    # siblings. Leaves also index their keys so a divergent leaf can be
+    # listed without a scan. Not thread-safe: each shard owns one tree and
+    # updates it under the shard lock. Trees with different salts combine
+    # by XOR without their entries ever cancelling out.
+    def __init__(self, salt=0):
+        self.salt = salt
+        self.levels = [[0] * (ARITY ** level) for level in range(DEPTH + 1)]
+        # key -> (token, version, digest)
+        self.entries = {}
+        self.leaves = {}
+
+    def _update(self, leaf, delta):
+        for nodes in reversed(self.levels):
+            nodes[leaf] ^= delta
+            leaf >>= LEVEL_BITS
+
+    def add(self, key, version):
+        old = self.entries.get(key)
+        if old is None:
+            h = ring_hash(key)
+            self.leaves.setdefault(h >> LEAF_SHIFT, set()).add(key)
+            digest = delta = key_digest(h, version, self.salt)
+        else:
+            h = old[0]
+            digest = key_digest(h, version, self.salt)
+            delta = digest ^ old[2]
+        self.entries[key] = (h, version, digest)
+        if delta:
+            self._update(h >> LEAF_SHIFT, delta)
+
+    def discard(self, key):
+        old = self.entries.pop(key, None)
+        if old is None:
+            return
+        leaf = old[0] >> LEAF_SHIFT
+        keys = self.leaves[leaf]
+        keys.discard(key)
+        if not keys:
+            del self.leaves[leaf]
+        self._update(leaf, old[2])
+
+    def node_hash(self, level, index, intervals=None):
+        # Hash of a node, restricted to `intervals` for a leaf that straddles
+        # their edge. Partial interior nodes have no restricted hash (None);
+        # callers descend into them instead.
+        if intervals is not None:
+            cover = coverage(level, index, intervals)
+            if cover == "partial" and level == DEPTH:
+                digest = 0
+                for key in self.leaves.get(index, ()):
+                    h, _, key_hash = self.entries[key]
+                    if in_intervals(h, intervals):
+                        digest ^= key_hash
+                return digest
+            if cover != "full":
+                return None
+        return self.levels[level][index]
+
+    def scan(self, cursor, count):
+        # Up to `count` (token, key) pairs with token >= cursor in token
+        # order, plus the cursor that resumes after them (None at the end).
+        # Cursors are ring positions, not offsets, so keys inserted or
+        # evicted between pages never shift other keys in or out of a scan.
+        leaves = self.leaves
+        first = cursor >> LEAF_SHIFT
+        if len(leaves) < LEAF_COUNT // 8:
+            order = sorted(leaf for leaf in leaves if leaf >= first)
+        else:
+            order = range(first, LEAF_COUNT)
+        entries = self.entries
+        found = []
+        for leaf in order:
+            keys = leaves.get(leaf)
+            if not keys:
+                continue
+            if leaf == first:
+                found.extend((entries[key][0], key) for key in keys if entries[key][0] >= cursor)
+            else:
+                found.extend((entries[key][0], key) for key in keys)
+            if len(found) >= count:
+                # Everything before the next leaf has been listed.
+                nxt = (leaf + 1) << LEAF_SHIFT
+                return merge_pages([(found, nxt if nxt < RING_SIZE else None)], count)
+        return merge_pages([(found, None)], count)
+
+    def leaf_versions(self, leaves, intervals):
+        # {key: version} for the keys in the given leaves that fall inside
+        # the intervals.
+        versions = {}
+        for leaf in leaves:
+            for key in self.leaves.get(leaf, ()):
+                h, version, _ = self.entries[key]
+                if in_intervals(h, intervals):
+                    versions[key] = version
+        return versions
@@ -0,0 +1,232 @@
+# metrics.py
+
+import bisect
+import threading
+import time
+
+# Upper bounds, in seconds, of the request latency buckets. Anything slower
+# than the last bound lands in a final overflow bucket.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Counters kept per action and rendered with an "action" label; the rest
+# are plain numbers and carry only "node".
+ACTION_COUNTERS = ("requests", "request_errors")
+
+HELP = {
+    "requests": "Requests handled, by action",
+    "request_errors": "Requests answered with status ERROR, by action",
+    "request_duration_seconds": "Time spent handling a request, by action",
+    "hits": "Reads answered from the cache",
+    "misses": "Reads the cache could not answer",
+    "evictions": "Entries evicted to stay within the memory budget",
+    "expirations": "Entries removed because their TTL ran out",
+    "replication_errors": "Replica writes or deletes that failed or were rejected",
+    "not_admitted": "Replica writes the eviction policy's admission filter turned away",
+    "read_repairs": "Stale replicas rewritten by read repair",
+    "datastore_fallbacks": "Reads served from the DataStore after every replica missed",
+    "bytes_stored": "Bytes of keys and values held, by the memory accounting",
+    "capacity_bytes": "Memory budget in bytes",
+    "entries": "Keys held",
+    "tombstones": "Deleted keys remembered for anti-entropy until their grace period ends",
+    "persistence_errors": "Failed writes or fsyncs of the persistence log",
+    "persistence_healthy": "0 while persistence log writes are failing and being retried",
+    "open_connections": "Client connections currently open",
+    "up": "1 when the node answered STATS",
+    "log_dropped": "Log messages dropped because the log queue was full",
+}
+
+
+class Histogram:
+    # Fixed-bucket histogram: observing a value is one bisect and two
+    # additions, and histograms from different nodes merge by adding counts.
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {"counts": list(self.counts), "sum": self.sum}
+
+
+def percentile(histogram, pct, bounds=LATENCY_BUCKETS):
+    # Upper bound of the bucket holding the pct-th percentile of a histogram
+    # snapshot (None when empty, inf when it falls in the overflow bucket).
+    total = sum(histogram["counts"])
+    if not total:
+        return None
+    rank = total * pct / 100
+    seen = 0
+    for i, count in enumerate(histogram["counts"]):
+        seen += count
+        if seen >= rank:
+            return bounds[i] if i < len(bounds) else float("inf")
+    return float("inf")
+
+
+class Metrics:
+    # Counters, gauges and per-action latency histograms for one server.
+    # Every update is a dict lookup and an add under one uncontended lock,
+    # cheap enough to run on every request. snapshot() returns plain dicts
+    # that travel in a STATS reply and merge across nodes.
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> value, or name -> {action: value} for ACTION_COUNTERS
+        self.counters = {}
+        self.gauges = {}
+        # action -> Histogram
+        self.latency = {}
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge_add(self, name, amount):
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + amount
+
+    def record(self, action, seconds, error=False):
+        # One request: its count, error count and latency, in one lock hold.
+        with self.lock:
+            counters = self.counters
+            requests = counters.get("requests")
+            if requests is None:
+                requests = counters["requests"] = {}
+            requests[action] = requests.get(action, 0) + 1
+            if error:
+                errors = counters.get("request_errors")
+                if errors is None:
+                    errors = counters["request_errors"] = {}
+                errors[action] = errors.get(action, 0) + 1
+            histogram = self.latency.get(action)
+            if histogram is None:
+                histogram = self.latency[action] = Histogram()
+            histogram.observe(seconds)
+
+    def track(self, handler):
+        # Wraps a request handler so every call is recorded under its action.
+        def tracked(request):
+            start = time.perf_counter()
+            response = handler(request)
+            self.record(request.get("action"), time.perf_counter() - start,
+                        response.get("status") == "ERROR")
+            return response
+        return tracked
+
+    def track_async(self, handler):
+        async def tracked(request):
+            start = time.perf_counter()
+            response = await handler(request)
+            self.record(request.get("action"), time.perf_counter() - start,
+                        response.get("status") == "ERROR")
+            return response
+        return tracked
+
+    def serve(self, serve, *args):
+        # Runs a connection loop while counting the connection as open.
+        self.gauge_add("open_connections", 1)
+        try:
+            return serve(*args)
+        finally:
+            self.gauge_add("open_connections", -1)
+
+    async def serve_async(self, serve, *args):
+        self.gauge_add("open_connections", 1)
+        try:
+            return await serve(*args)
+        finally:
+            self.gauge_add("open_connections", -1)
+
+    def snapshot(self, counters=None, **gauges):
+        # Values the server already keeps (evictions, bytes stored and the
+        # like) are passed in at snapshot time rather than recorded twice.
+        with self.lock:
+            series = {name: dict(value) if name in ACTION_COUNTERS else value
+                      for name, value in self.counters.items()}
+            merged_gauges = dict(self.gauges)
+            latency = {action: h.snapshot() for action, h in self.latency.items()}
+        series.update(counters or {})
+        merged_gauges.update(gauges)
+        return {"counters": series, "gauges": merged_gauges, "latency": latency}
+
+
+def merge_snapshots(snapshots):
+    # Cluster totals: counters, gauges and histogram buckets are summed.
+    merged = {"counters": {}, "gauges": {}, "latency": {}}
+    for snapshot in snapshots:
+        for name, value in snapshot.get("counters", {}).items():
+            if name in ACTION_COUNTERS:
+                target = merged["counters"].setdefault(name, {})
+                for action, count in value.items():
+                    target[action] = target.get(action, 0) + count
+            else:
+                merged["counters"][name] = merged["counters"].get(name, 0) + value
+        for name, value in snapshot.get("gauges", {}).items():
+            merged["gauges"][name] = merged["gauges"].get(name, 0) + value
+        for action, histogram in snapshot.get("latency", {}).items():
+            target = merged["latency"].get(action)
+            if target is None:
+                merged["latency"][action] = {"counts": list(histogram["counts"]), "sum": histogram["sum"]}
+            else:
+                target["counts"] = [a + b for a, b in zip(target["counts"], histogram["counts"])]
+                target["sum"] += histogram["sum"]
+    return merged
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(nodes, prefix="cache"):
+    # Renders {node: snapshot} in the Prometheus text exposition format,
+    # one series per node (and per action where the metric has one).
+    # Cluster totals are left to the query side (sum by ...).
+    counters, gauges, latency = {}, {}, {}
+    for node, snapshot in nodes.items():
+        for name, value in snapshot.get("counters", {}).items():
+            if name in ACTION_COUNTERS:
+                for action, count in value.items():
+                    counters.setdefault(name, []).append(({"node": node, "action": action}, count))
+            else:
+                counters.setdefault(name, []).append(({"node": node}, value))
+        for name, value in snapshot.get("gauges", {}).items():
+            gauges.setdefault(name, []).append((node, value))
+        for action, histogram in snapshot.get("latency", {}).items():
+            latency.setdefault(action, []).append((node, histogram))
+
+    lines = []
+    for name in sorted(counters):
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in counters[name]:
+            lines.append(f"{metric}{_labels(**labels)} {_number(value)}")
+    for name in sorted(gauges):
+        metric = f"{prefix}_{name}"
+        lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} gauge")
+        for node, value in gauges[name]:
+            lines.append(f"{metric}{_labels(node=node)} {_number(value)}")
+    if latency:
+        metric = f"{prefix}_request_duration_seconds"
+        lines.append(f"# HELP {metric} {HELP['request_duration_seconds']}")
+        lines.append(f"# TYPE {metric} histogram")
+        for action in sorted(latency):
+            for node, histogram in latency[action]:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram["counts"]):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{_labels(node=node, action=action, le=_number(bound))} {cumulative}")
+                lines.append(f"{metric}_sum{_labels(node=node, action=action)} {_number(histogram['sum'])}")
+                lines.append(f"{metric}_count{_labels(node=node, action=action)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,260 @@
+# persistence.py
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import closing
+from config import PERSIST_GROUP_COMMIT_DELAY, PERSIST_COMPACT_BYTES, PERSIST_RETRY_DELAY
+from codec import encode_value, decode_value, CodecError
+from log import get_logger
+
+log = get_logger("Persistence")
+
+# Every record is a length + CRC32 header followed by an encode_value()
+# payload: ("S", key, value, version, deadline), ("D", key, version) for a
+# delete that leaves a tombstone, or ("D", key). A torn or corrupt tail
+# record ends replay of that file.
+RECORD_HEADER = struct.Struct("!II")
+SNAPSHOT_MAGIC = b"DCSNAP1\n"
+SNAPSHOT_HEADER = struct.Struct("!Q")
+
+
+def encode_record(record):
+    payload = encode_value(record)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_records(buf, pos=0):
+    end = len(buf)
+    while pos + RECORD_HEADER.size <= end:
+        size, crc = RECORD_HEADER.unpack_from(buf, pos)
+        start = pos + RECORD_HEADER.size
+        if start + size > end:
+            return
+        payload = buf[start:start + size]
+        if zlib.crc32(payload) != crc:
+            return
+        try:
+            record, _ = decode_value(payload)
+        except CodecError:
+            return
+        yield record
+        pos = start + size
+
+
+class Persistence:
+    # Durable worker state: an append-only log of writes plus a periodic
+    # snapshot. Writers only queue encoded records; a flusher thread writes
+    # everything queued since its last pass with one write() and one fsync()
+    # (group commit), so a burst of SETs shares a single disk sync. Once the
+    # log passes PERSIST_COMPACT_BYTES it is rotated and a snapshot of the
+    # live data replaces every older log file.
+    def __init__(self, data_dir, snapshot_source, tombstone_source=None,
+                 group_commit_delay=PERSIST_GROUP_COMMIT_DELAY, compact_bytes=PERSIST_COMPACT_BYTES):
+        # snapshot_source yields (key, entry, deadline) for every live entry
+        # and tombstone_source (key, version) for every tombstone.
+        self.data_dir = data_dir
+        self.snapshot_source = snapshot_source
+        self.tombstone_source = tombstone_source
+        self.group_commit_delay = group_commit_delay
+        self.compact_bytes = compact_bytes
+        os.makedirs(data_dir, exist_ok=True)
+        self.cond = threading.Condition()
+        self.pending = []
+        self.log = None
+        self.seq = 0
+        self.log_size = 0
+        self.compacting = False
+        self.synced_records = 0
+        self.fsyncs = 0
+        # False from a failed log write until a retry succeeds; reported in
+        # the worker's STATS.
+        self.healthy = True
+        self.write_errors = 0
+
+    def snapshot_path(self):
+        return os.path.join(self.data_dir, "snapshot.dat")
+
+    def log_path(self, seq):
+        return os.path.join(self.data_dir, f"wal.{seq:06d}.log")
+
+    def log_seqs(self):
+        seqs = []
+        for name in os.listdir(self.data_dir):
+            if name.startswith("wal.") and name.endswith(".log"):
+                seqs.append(int(name[4:-4]))
+        return sorted(seqs)
+
+    def load(self, apply):
+        # Feeds every persisted record to apply(record) in write order: the
+        # snapshot (read through mmap) first, then the log files it does not
+        # cover. Returns (records applied, log files replayed).
+        count = 0
+        first_seq = 0
+        path = self.snapshot_path()
+        if os.path.exists(path) and os.path.getsize(path) > len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size:
+            # Every view of the mapping must be released before it closes,
+            # or closing raises BufferError over whatever apply() raised:
+            # closing the generator drops its slice, then the view goes.
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as buf:
+                    if bytes(buf[:len(SNAPSHOT_MAGIC)]) == SNAPSHOT_MAGIC:
+                        (first_seq,) = SNAPSHOT_HEADER.unpack_from(buf, len(SNAPSHOT_MAGIC))
+                        with closing(iter_records(buf, len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size)) as records:
+                            for record in records:
+                                apply(record)
+                                count += 1
+
+        replayed_logs = 0
+        for seq in self.log_seqs():
+            if seq < first_seq:
+                continue
+            with open(self.log_path(seq), "rb") as f:
+                data = f.read()
+            for record in iter_records(data):
+                apply(record)
+                count += 1
+            replayed_logs += 1
+        self.seq = max([first_seq] + self.log_seqs())
+        return count, replayed_logs
+
+    def start(self, compact_now=False):
+        # Opens a fresh log after whatever load() replayed, so a torn tail in
+        # an older file is never appended to.
+        self.seq += 1
+        self.log = open(self.log_path(self.seq), "ab")
+        threading.Thread(target=self.flush_loop, daemon=True).start()
+        if compact_now:
+            self.compacting = True
+            threading.Thread(target=self.compact, args=(self.seq,), daemon=True).start()
+
+    def record_set(self, key, entry, deadline):
+        self.append(encode_record(("S", key, entry[0], entry[1], deadline)))
+
+    def record_delete(self, key, version=None):
+        self.append(encode_record(("D", key) if version is None else ("D", key, version)))
+
+    def append(self, data):
+        with self.cond:
+            self.pending.append(data)
+            if len(self.pending) == 1:
+                self.cond.notify()
+
+    def flush_loop(self):
+        delay = 0.1
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+            # Let concurrent writers join this batch before paying for fsync.
+            if self.group_commit_delay:
+                time.sleep(self.group_commit_delay)
+            with self.cond:
+                batch, self.pending = self.pending, []
+            try:
+                self.write_batch(batch)
+            except OSError as e:
+                # The batch goes back in front of anything queued since and
+                # is retried with backoff; the store keeps serving meanwhile.
+                self.healthy = False
+                self.write_errors += 1
+                log.error("Log write failed, retrying in %.1fs (%d records pending): %s",
+                          delay, len(batch) + len(self.pending), e)
+                with self.cond:
+                    self.pending[:0] = batch
+                time.sleep(delay)
+                delay = min(delay * 2, PERSIST_RETRY_DELAY)
+                self.reopen()
+                continue
+            if not self.healthy:
+                log.info("Log writes recovered after %d errors", self.write_errors)
+                self.healthy = True
+            delay = 0.1
+            if self.log_size >= self.compact_bytes and not self.compacting:
+                try:
+                    self.rotate()
+                except OSError as e:
+                    log.error("Log rotation failed: %s", e)
+                    self.reopen()
+
+    def write_batch(self, batch):
+        if self.log is None:
+            raise OSError(f"Log {self.log_path(self.seq)} is not open")
+        data = b"".join(batch)
+        self.log.write(data)
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.log_size += len(data)
+        self.synced_records += len(batch)
+        self.fsyncs += 1
+
+    def reopen(self):
+        # A failed write may have left part of a record behind, and replay
+        # stops at a torn record; after a failed fsync the kernel may also
+        # have dropped the unsynced pages. Retries therefore rewrite the
+        # whole batch into a fresh log file.
+        if self.log is not None:
+            try:
+                self.log.close()
+            except OSError:
+                pass
+            self.log = None
+            self.seq += 1
+        try:
+            self.log = open(self.log_path(self.seq), "ab")
+            self.log_size = 0
+        except OSError as e:
+            log.error("Cannot open log %s: %s", self.log_path(self.seq), e)
+
+    def rotate(self):
+        # Runs on the flusher thread between batches: later records go to a
+        # new log while a snapshot covering everything before it is written.
+        self.log.close()
+        self.seq += 1
+        self.log = open(self.log_path(self.seq), "ab")
+        self.log_size = 0
+        self.compacting = True
+        threading.Thread(target=self.compact, args=(self.seq,), daemon=True).start()
+
+    def compact(self, seq):
+        # Every record in logs older than `seq` was applied to the store
+        # before it was queued, so the live data is a superset of them.
+        try:
+            tmp = self.snapshot_path() + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(SNAPSHOT_MAGIC + SNAPSHOT_HEADER.pack(seq))
+                chunk = []
+                for key, entry, deadline in self.snapshot_source():
+                    chunk.append(encode_record(("S", key, entry[0], entry[1], deadline)))
+                    if len(chunk) >= 1024:
+                        f.write(b"".join(chunk))
+                        chunk = []
+                for key, version in self.tombstone_source() if self.tombstone_source else ():
+                    chunk.append(encode_record(("D", key, version)))
+                    if len(chunk) >= 1024:
+                        f.write(b"".join(chunk))
+                        chunk = []
+                f.write(b"".join(chunk))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path())
+            dir_fd = os.open(self.data_dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            for old in self.log_seqs():
+                if old < seq:
+                    os.remove(self.log_path(old))
+        except OSError as e:
+            log.error("Snapshot failed: %s", e)
+        finally:
+            self.compacting = False
+
+    def stats(self):
+        return {"log_seq": self.seq, "log_bytes": self.log_size, "records_synced": self.synced_records,
+                "fsyncs": self.fsyncs, "compacting": self.compacting, "healthy": self.healthy,
+                "write_errors": self.write_errors, "pending": len(self.pending)}
@@ -1,105 +1,111 @@
 import socket
 import threading
-import pickle
 import time
-from config import PRIMARY_SERVER_PORT, REPLICATION_FACTOR, WORKER_PORTS
-from hashing_ring import ConsistentHashRing
-from replicator import replicate
+import asyncio
+import argparse
+import random
+from concurrent.futures import wait, FIRST_COMPLETED, ThreadPoolExecutor
+from config import (
+    PRIMARY_SERVER_PORT, REPLICATION_FACTOR, WRITE_QUORUM, WORKER_PORTS,
+    SERVER_MODE, MAX_INFLIGHT_REQUESTS, READ_STRATEGY, READ_QUORUM, READ_TIMEOUT,
+    HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY, READ_WORKERS, MONITOR_INTERVAL,
+    PROBE_TIMEOUT, PEER_CODEC, ANTI_ENTROPY_INTERVAL, READ_REPAIR_CHANCE, READ_REPAIR_WORKERS,
+    SCAN_COUNT, VALUE_PREVIEW, LOG_LEVEL, LOG_REQUEST_SAMPLE
+)
+from failure_detector import PhiAccrualDetector
+from hlc import HybridLogicalClock
+from hashing_ring import ConsistentHashRing, moved_ranges, ring_hash
+from merkle import merge_pages
+from metrics import Metrics, merge_snapshots
+from rebalancer import MigrationJob, RecoveryJob
+from anti_entropy import AntiEntropyJob
+from replicator import (
+    replicate, replicate_delete, replicate_batch, replicate_delete_batch, worker_pool,
+    replicate_async, replicate_delete_async, async_worker_pool
+)
+from replicator import metrics as replication_metrics
 from datastore import DataStore
-import functools
-print = functools.partial(print, flush=True)
+from codec import serve_connection, serve_stream, open_connection, CodecError
+from framing import send_message, recv_message, FrameError
+from log import get_logger, configure as configure_logging, stats as log_stats, LEVELS
+
+log = get_logger("PrimaryServer")
+monitor_log = get_logger("Monitor")
 
 
 class PrimaryCacheServer:
     def __init__(self):
         self.datastore = DataStore()
+        self.pool = worker_pool
+        self.async_pool = async_worker_pool
+        # Hedged and quorum reads get their own threads: on the pool's
+        # fan-out executor a GET would queue behind a burst of replica writes.
+        self.read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS)
+        self.loop = None
+        self.clock = HybridLogicalClock()
+        self.repair_executor = ThreadPoolExecutor(max_workers=READ_REPAIR_WORKERS)
+        self.read_repairs = 0
+        self.metrics = Metrics()
+        self.tracked_request = self.metrics.track(self.handle_request)
+        self.detector = PhiAccrualDetector()
         self.hash_ring = self.create_hash_ring_with_active_nodes()
+        # A joining node receives its token ranges before it enters the ring;
+        # join_ring is the ring as it will look afterwards. Migration copies
+        # only overwrite older versions, so data a node restored from disk
+        # and writes made during the join both survive.
+        self.joining = None
+        self.join_ring = None
+        self.jobs = []
+        self.repair_job = None
         threading.Thread(target=self.node_monitor_loop, daemon=True).start()
+        if ANTI_ENTROPY_INTERVAL:
+            threading.Thread(target=self.anti_entropy_loop, daemon=True).start()
 
     def create_hash_ring_with_active_nodes(self):
-        active_nodes = []
-        for node, port in WORKER_PORTS.items():
-            if self.is_node_active(port):
-                active_nodes.append(node)
-        print(f"Active nodes detected: {active_nodes}")
-        return ConsistentHashRing(active_nodes)
-
-    def is_node_active(self, port):
+        # One parallel round of short PING probes seeds the ring; from then
+        # on membership follows the workers' heartbeats. The epoch starts
+        # past any a worker has seen, so it keeps increasing across primary
+        # restarts and smart clients holding an older ring are still refused.
+        with ThreadPoolExecutor(max_workers=len(WORKER_PORTS)) as executor:
+            epochs = dict(zip(WORKER_PORTS, executor.map(self.probe_node, WORKER_PORTS.values())))
+        active_nodes = [node for node, epoch in epochs.items() if epoch is not None]
+        for node in active_nodes:
+            self.detector.heartbeat(node)
+        log.info("Active nodes detected: %s", active_nodes)
+        ring = ConsistentHashRing(active_nodes)
+        ring.epoch = max([epochs[node] for node in active_nodes], default=0) + 1
+        return ring
+
+    def probe_node(self, port):
+        # The worker's epoch, or None when it does not answer.
         try:
-            with socket.create_connection(("localhost", port), timeout=10):
-                return True
-        except (socket.timeout, ConnectionRefusedError):
-            return False
+            sock, codec = open_connection("localhost", port, timeout=PROBE_TIMEOUT, codec_name=PEER_CODEC)
+            with sock:
+                send_message(sock, {"action": "PING"}, codec)
+                reply = recv_message(sock, codec)
+        except (OSError, FrameError, CodecError):
+            return None
+        return reply.get("epoch", 0) if reply else None
 
     def forward_request(self, node, message):
-        port = WORKER_PORTS[node]
         try:
-            with socket.create_connection(("localhost", port)) as sock:
-                sock.sendall(pickle.dumps(message))
-                data = sock.recv(4096)
-                return pickle.loads(data)
+            return self.pool.request(node, message)
         except Exception as e:
-            print(f"[PrimaryServer] Error contacting {node}: {e}")
+            log.warning("Error contacting %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
             return {"status": "ERROR"}
 
-    def fetch_value_from_node(self, node, key):
-        port = WORKER_PORTS[node]
-        with socket.create_connection(("localhost", port)) as s:
-            s.sendall(pickle.dumps({"action": "GET", "key": key}))
-            response = pickle.loads(s.recv(4096))
-            if response["status"] == "OK":
-                return response["value"]
-            raise Exception("Fetch failed")
-
-    def redistribute_keys_from_failed_node(self, failed_node):
-        print(f"\n[Redistribution] Starting for failed node {failed_node}")
-
-        affected_keys = [
-            key for key in self.datastore.store.keys()
-            if self.hash_ring.get_node(key) == failed_node
-        ]
-    
-        if not affected_keys:
-            #print("No keys need redistribution")
-            return
-    
-        #print(f"Affected keys: {len(affected_keys)}")
-    
-        for key in affected_keys:
-            try:
-                replicas = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                live_replicas = [
-                    node for node in replicas 
-                    if node != failed_node and self.is_node_active(WORKER_PORTS[node])
-                ]
-            
-                if not live_replicas:
-                    print(f" No live replicas for key: {key}, checking if value exists in local DataStore")
-                    value = self.datastore.get(key)
-                    if value:
-                        new_replicas = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                        replicate(key, value, new_replicas)
-                        print(f" {key} redistributed from local -> {new_replicas}")
-                    else:
-                        print(f" No live replicas or local value for key: {key}")
-                    continue
-                
-                source_node = live_replicas[0]
-                value = self.fetch_value_from_node(source_node, key)
-                new_replicas = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                self.datastore.set(key, value)
-                replicate(key, value, new_replicas)
-                print(f"{key} redistributed via {source_node} -> {new_replicas}")
-            
-            except Exception as e:
-                pass
+    def redistribute_keys_from_failed_node(self, failed_node, old_ring):
+        # Runs as a background job so the monitor keeps detecting failures
+        # while keys are re-replicated.
+        monitor_log.info("Redistribution starting for failed node %s", failed_node)
+        new_ring = ConsistentHashRing(self.hash_ring.nodes)
+        job = RecoveryJob(failed_node, old_ring, new_ring, self.datastore, self.pool, REPLICATION_FACTOR)
+        self.jobs = self.jobs[-19:] + [job]
+        threading.Thread(target=job.run, daemon=True).start()
 
     def node_monitor_loop(self):
         while True:
-            alive_nodes = []
-            for node in WORKER_PORTS.keys():
-                if self.is_node_active(WORKER_PORTS[node]):
-                    alive_nodes.append(node)
+            alive_nodes = [node for node in WORKER_PORTS if self.detector.is_available(node)]
 
             current_nodes = set(self.hash_ring.nodes)
             detected_nodes = set(alive_nodes)
@@ -108,109 +114,669 @@ class PrimaryCacheServer:
             added = detected_nodes - current_nodes
 
             for node in removed:
-                print(f"[Monitor] Detected failure of node: {node}")
+                monitor_log.warning("Detected failure of node: %s (phi %.1f)", node, self.detector.phi(node))
+                old_ring = ConsistentHashRing(self.hash_ring.nodes)
                 self.hash_ring.remove_node(node)
-                self.redistribute_keys_from_failed_node(node)
+                # Drop the outage from the arrival history; the node rejoins
+                # on its next heartbeat.
+                self.detector.forget(node)
+                self.pool.close_node(node)
+                if self.loop is not None:
+                    self.loop.call_soon_threadsafe(self.async_pool.close_node, node)
+                self.redistribute_keys_from_failed_node(node, old_ring)
 
             for node in added:
-                print(f"[Monitor] Detected recovered/new node: {node}")
-                self.hash_ring.add_node(node)
+                if self.joining is None:
+                    monitor_log.info("Detected recovered/new node: %s", node)
+                    self.start_join(node)
+
+            time.sleep(MONITOR_INTERVAL)
+
+    def anti_entropy_loop(self):
+        # Passes are skipped while keys are being moved for a membership
+        # change; replicas are expected to differ until that finishes.
+        while True:
+            time.sleep(ANTI_ENTROPY_INTERVAL)
+            if self.joining is not None or any(job.state == "running" for job in self.jobs):
+                continue
+            job = AntiEntropyJob(ConsistentHashRing(self.hash_ring.nodes), self.pool)
+            self.repair_job = job
+            job.run()
+
+    def start_join(self, node):
+        new_ring = ConsistentHashRing(self.hash_ring.nodes + [node])
+        ranges = moved_ranges(self.hash_ring, new_ring, node)
+        if not ranges:
+            self.hash_ring.add_node(node)
+            return
+        job = MigrationJob(node, ranges, self.pool)
+        self.jobs = self.jobs[-19:] + [job]
+        self.join_ring = new_ring
+        self.joining = node
+        # Smart clients must start writing to the joining node as well.
+        self.hash_ring.epoch += 1
+        threading.Thread(target=self.finish_join, args=(job,), daemon=True).start()
+
+    def finish_join(self, job):
+        try:
+            job.run()
+        finally:
+            # If the node died during the transfer, the monitor's next pass
+            # takes it back out of the ring.
+            self.hash_ring.add_node(job.node)
+            self.joining = None
+            self.join_ring = None
+
+    def heartbeat(self, request):
+        node = request.get("node")
+        if node in WORKER_PORTS:
+            self.detector.heartbeat(node)
+            self.observe_version(node, request.get("version"))
+            # A worker that was unreachable at startup may have seen a later
+            # epoch than the one this primary started from.
+            epoch = request.get("epoch")
+            if epoch is not None and epoch > self.hash_ring.epoch:
+                self.hash_ring.epoch = epoch + 1
+        return {"status": "OK", "epoch": self.hash_ring.epoch, "nodes": self.hash_ring.nodes}
 
-            time.sleep(3)
+    def topology(self):
+        # Everything a smart client needs to place keys itself. The version
+        # seeds its clock so its writes order after the primary's.
+        return {
+            "status": "OK",
+            "epoch": self.hash_ring.epoch,
+            "nodes": self.hash_ring.nodes,
+            "joining": self.joining,
+            "ports": {node: WORKER_PORTS[node] for node in WORKER_PORTS},
+            "vnodes": self.hash_ring.vnodes,
+            "replication_factor": REPLICATION_FACTOR,
+            "write_quorum": WRITE_QUORUM,
+            "version": self.next_version(),
+        }
+
+    def membership(self):
+        # Cached view built from heartbeat state; nothing here touches the network.
+        ring_nodes = set(self.hash_ring.nodes)
+        members = {}
+        for node in WORKER_PORTS:
+            phi = self.detector.phi(node)
+            members[node] = {
+                "active": node in ring_nodes,
+                "joining": node == self.joining,
+                "phi": round(phi, 2) if phi != float("inf") else None,
+            }
+        return {"status": "OK", "epoch": self.hash_ring.epoch, "nodes": self.hash_ring.nodes, "members": members}
+
+    def scan(self, cursor, count, match=None):
+        # Cluster-wide SCAN: the DataStore and every worker page from the
+        # same ring-position cursor and the pages are merged, so the result
+        # is complete up to the returned cursor. Replicated keys are
+        # reported once. A worker that fails to answer is left out of the
+        # page rather than failing the scan.
+        nodes = self.hash_ring.nodes
+        message = {"action": "SCAN", "cursor": cursor, "count": count}
+        if match:
+            message["match"] = match
+        pages = [self.datastore.scan(cursor, count, match)]
+        for node, reply in self.pool.request_many({node: message for node in nodes}).items():
+            if isinstance(reply, Exception) or reply.get("status") != "OK":
+                log.warning("SCAN skipped %s: %s", node, reply)
+                continue
+            pages.append(([(ring_hash(key), key) for key in reply["keys"]], reply["cursor"] or None))
+        items, nxt = merge_pages(pages, count)
+        keys = [key for _, key in items]
+        return {"status": "OK", "keys": keys, "cursor": nxt or 0, "active_nodes": nodes}
+
+    def keys_metadata(self, request):
+        # Placement, hash and value preview for a page of keys in one reply:
+        # either the listed `keys` or the SCAN page at `cursor`. Every key is
+        # hashed once and placed with one batched ring lookup; values missing
+        # from the DataStore are peeked at with one MGET per worker, which
+        # leaves the workers' eviction state and hit/miss counts alone.
+        # "total" is the DataStore's size, the cluster's key count without a
+        # scan.
+        if "keys" in request:
+            keys = list(dict.fromkeys(request["keys"]))
+            page = {"cursor": 0, "active_nodes": self.hash_ring.nodes}
+        else:
+            page = self.scan(request.get("cursor", 0), request.get("count", SCAN_COUNT), request.get("match"))
+            keys = page["keys"]
+        preview = request.get("preview", VALUE_PREVIEW)
+
+        hashes = [ring_hash(key) for key in keys]
+        replicas = self.hash_ring.replicas_for_hashes(hashes, REPLICATION_FACTOR)
+        values = {}
+        for key in keys:
+            value = self.datastore.get(key)
+            if value is not None:
+                values[key] = value
+        missing = [key for key in keys if key not in values]
+        if missing:
+            values.update(self.mget(missing, touch=False)["values"])
+
+        metadata = []
+        for key, h, nodes in zip(keys, hashes, replicas):
+            value = values.get(key)
+            metadata.append({
+                "key": key,
+                "hash": f"{h:016x}",
+                "primary": nodes[0] if nodes else None,
+                "replicas": nodes,
+                "value": None if value is None else str(value)[:preview],
+            })
+        return {"status": "OK", "keys": metadata, "cursor": page["cursor"], "active_nodes": page["active_nodes"],
+                "total": len(self.datastore.store)}
+
+    def write_replicas(self, key):
+        # Replicas a write must reach: the key's current replicas plus a
+        # joining node taking over its range, so writes made during a
+        # transfer are already there when the node enters the ring.
+        nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+        join_ring = self.join_ring
+        if join_ring is not None:
+            for node in join_ring.get_replicas(key, REPLICATION_FACTOR):
+                if node not in nodes:
+                    nodes.append(node)
+        return nodes
 
     def handle_client(self, conn):
+        self.metrics.serve(serve_connection, conn, self.tracked_request, "PrimaryServer")
+
+    def stats(self):
+        # This server's own counters plus the replicator's error count.
+        return merge_snapshots([
+            self.metrics.snapshot(counters={"read_repairs": self.read_repairs, "log_dropped": log_stats()["dropped"]},
+                                  entries=len(self.datastore.store)),
+            replication_metrics.snapshot()])
+
+    def cluster_stats(self):
+        # STATS from the primary and every worker in (or joining) the ring.
+        # "cluster" sums the workers only: the primary's requests fan out
+        # into worker requests, so adding both would count them twice.
+        nodes = list(self.hash_ring.nodes)
+        if self.joining and self.joining not in nodes:
+            nodes.append(self.joining)
+        replies = self.pool.request_many({node: {"action": "STATS"} for node in nodes})
+        workers = {}
+        for node in WORKER_PORTS:
+            reply = replies.get(node)
+            if reply is None or isinstance(reply, Exception) or reply.get("status") != "OK":
+                workers[node] = {"gauges": {"up": 0}}
+            else:
+                workers[node] = reply["stats"]
+                workers[node]["gauges"]["up"] = 1
+        return {"status": "OK", "nodes": {"primary": self.stats(), **workers},
+                "cluster": merge_snapshots(workers.values())}
+
+    def handle_request(self, request):
+        action = request.get("action")
+        if action in ("GET", "SET", "KEY_METADATA", "DELETE"):
+            key = request.get("key")
+
+        if request.get("datastore_only"):
+            return self.store_only(request)
+
+        if action == "DELETE":
+            version = self.next_version()
+            removed = self.datastore.delete(key, version)
+            replicas = self.write_replicas(key)
+            replicate_delete(key, replicas, version)
+
+            status = "DELETED" if removed else "MISS"
+            return {"status": status, "message": removed and "" or "Key not found"}
+
+        if action == "GET":
+            nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+            node, response = self.read_replicas(key, nodes)
+            if response is not None:
+                self.metrics.incr("hits")
+                if READ_STRATEGY != "quorum" and random.random() < READ_REPAIR_CHANCE:
+                    self.schedule_read_repair(key, nodes, {node: response})
+                return response
+
+            # Fallback: check original DataStore
+            self.metrics.incr("misses")
+            value = self.datastore.get(key)
+            if value:
+                self.metrics.incr("datastore_fallbacks")
+                replicate(key, value, nodes, quorum=0, version=self.datastore.version(key),
+                          ttl=self.datastore.ttl(key))
+                return {"status": "OK", "value": value}
+            else:
+                return {"status": "MISS"}
+
+        elif action == "SET":
+            ttl = request.get("ttl")
+            version = self.next_version()
+            self.datastore.set(key, request["value"], ttl, version)
+            nodes = self.write_replicas(key)
+            acks = replicate(key, request["value"], nodes, version=version, ttl=ttl)
+            return self.write_response(acks, len(nodes))
+
+        elif action == "MGET":
+            return self.mget(request.get("keys", []))
+
+        elif action == "MSET":
+            return self.mset(request.get("items", {}), request.get("ttl"))
+
+        elif action == "MDEL":
+            return self.mdel(request.get("keys", []))
+
+        elif action == "SCAN":
+            return self.scan(request.get("cursor", 0), request.get("count", SCAN_COUNT), request.get("match"))
+
+        elif action == "STATS":
+            return self.cluster_stats()
+
+        elif action == "KEYS_METADATA":
+            return self.keys_metadata(request)
+
+        elif action == "HEARTBEAT":
+            return self.heartbeat(request)
+
+        elif action == "MEMBERSHIP":
+            return self.membership()
+
+        elif action == "TOPOLOGY":
+            return self.topology()
+
+        elif action == "REBALANCE_STATUS":
+            repair = self.repair_job.status() if self.repair_job is not None else None
+            return {"status": "OK", "joining": self.joining, "jobs": [job.status() for job in self.jobs],
+                    "anti_entropy": repair, "read_repairs": self.read_repairs}
+
+        elif action == "KEY_METADATA":
+            key = request["key"]
+            nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+            primary = nodes[0] if nodes else "None"
+            return {
+                "status": "OK",
+                "primary": primary,
+                "replicas": nodes,
+                "value": self.datastore.get(key) or "In worker cache"
+            }
+
+        else:
+            return {"status": "ERROR", "message": "Unknown action"}
+
+    def store_only(self, request):
+        # A write a smart client already sent to the cache replicas: only
+        # the DataStore is updated, under the client's version, so reads
+        # that fall back to it and recovery see the write (or the delete).
+        action = request.get("action")
+        version = request.get("version", 0)
+        self.observe_version("a smart client", version)
+        if action == "SET":
+            self.datastore.set(request["key"], request["value"], request.get("ttl"), version)
+            return {"status": "STORED"}
+        if action == "DELETE":
+            removed = self.datastore.delete(request["key"], version)
+            return {"status": "DELETED" if removed else "MISS"}
+        if action == "MSET":
+            items = request.get("items", {})
+            for key, value in items.items():
+                self.datastore.set(key, value, request.get("ttl"), version)
+            return {"status": "STORED", "count": len(items)}
+        return {"status": "ERROR", "message": f"{action} cannot be applied to the DataStore only"}
+
+    def next_version(self):
+        # Write versions come from a hybrid logical clock: strictly
+        # increasing, close to wall-clock time, and never behind a version
+        # a worker reported holding.
+        return self.clock.now()
+
+    def observe_version(self, node, version):
+        if not self.clock.update(version):
+            log.warning("Ignoring version %d from %s: too far ahead of the local clock", version, node)
+
+    def hedge_delay(self, node, pool=None):
+        pool = pool or self.pool
+        delay = pool.latency.percentile(node, HEDGE_PERCENTILE, HEDGE_MAX_DELAY)
+        return min(max(delay, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def submit_read(self, node, message):
+        return self.read_executor.submit(self.pool.request, node, message)
+
+    def read_replicas(self, key, nodes):
+        # Returns (node, response) for the replica reply to use, or
+        # (None, None) when no replica had the key in time.
+        if not nodes:
+            return None, None
+        if READ_STRATEGY == "quorum":
+            return self.quorum_read(key, nodes)
+        return self.hedged_read(key, nodes)
+
+    def hedged_read(self, key, nodes):
+        message = {"action": "GET", "key": key}
+        deadline = time.monotonic() + READ_TIMEOUT
+        remaining = list(nodes)
+        pending = {}
+
+        def launch():
+            node = remaining.pop(0)
+            pending[self.submit_read(node, message)] = node
+            return node
+
+        last = launch()
+        try:
+            while pending:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                # Wait for the outstanding replica up to its recent latency
+                # percentile, then hedge to the next replica as well.
+                timeout = min(self.hedge_delay(last), left) if remaining else left
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    if remaining:
+                        last = launch()
+                    continue
+                for future in done:
+                    node = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        log.warning("Error contacting %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
+                        continue
+                    if response.get("value") is not None:
+                        return node, response
+                # Every finished replica missed: move on to the next one now.
+                if remaining and not pending:
+                    last = launch()
+        finally:
+            for future in pending:
+                future.cancel()
+        return None, None
+
+    def quorum_read(self, key, nodes):
+        message = {"action": "GET", "key": key}
+        needed = min(READ_QUORUM, len(nodes))
+        pending = {self.submit_read(node, message): node for node in nodes}
+        deadline = time.monotonic() + READ_TIMEOUT
+        replies = []
+        try:
+            while pending and len(replies) < needed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                done, _ = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    try:
+                        replies.append((node, future.result()))
+                    except Exception as e:
+                        log.warning("Error contacting %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
+        finally:
+            # Replies still in flight go to the read repair rather than
+            # being cancelled; the GET itself returns now.
+            self.schedule_read_repair(key, nodes, dict(replies), pending)
+        return self.newest_reply(replies)
+
+    def schedule_read_repair(self, key, nodes, replies, pending=None):
+        if len(nodes) > 1:
+            self.repair_executor.submit(self.read_repair, key, nodes, replies, pending or {})
+
+    def read_repair(self, key, nodes, replies, pending):
+        # Runs off the request path. Gathers every replica's reply (those the
+        # GET saw, those still in flight, fresh reads for the rest) and
+        # copies the newest entry to replicas missing it or holding an older
+        # version. Replicas that fail to answer are left alone.
         try:
-            data = conn.recv(4096)
-            if not data:
+            message = {"action": "GET", "key": key}
+            asked = set(replies) | set(pending.values())
+            for node in nodes:
+                if node not in asked:
+                    pending[self.pool.submit(node, message)] = node
+            done, _ = wait(pending, timeout=READ_TIMEOUT)
+            for future in done:
+                if future.exception() is None:
+                    replies[pending[future]] = future.result()
+
+            newest, best = self.newest_reply(replies.items())
+            if newest is None:
+                return
+            version = best.get("version") or 0
+            stale = [node for node, reply in replies.items()
+                     if reply.get("value") is None or (reply.get("version") or 0) < version]
+            if not stale:
                 return
-            try:
-                request = pickle.loads(data)
-            except pickle.UnpicklingError:
+            # MGET also carries the remaining TTL, which GET replies do not.
+            source = self.pool.request(newest, {"action": "MGET", "keys": [key]})
+            if key not in source.get("values", {}):
                 return
-            action = request.get("action")
-            if action in ("GET", "SET", "KEY_METADATA", "DELETE"):
-                key = request.get("key")
+            repair = {"action": "MSET", "items": source["values"], "versions": source.get("versions", {}),
+                      "ttls": source.get("ttls", {})}
+            for node in stale:
+                self.pool.submit(node, repair)
+            self.read_repairs += len(stale)
+            log.info("Read repair of %r from %s to %s", key, newest, stale, sample=LOG_REQUEST_SAMPLE)
+        except Exception as e:
+            log.warning("Read repair of %r failed: %s", key, e, sample=LOG_REQUEST_SAMPLE)
 
-            if action == "DELETE":
-                removed = self.datastore.store.pop(key, None) is not None
-                replicas = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+    def newest_reply(self, replies):
+        best = (None, None)
+        for node, response in replies:
+            if response.get("value") is None:
+                continue
+            if best[1] is None or (response.get("version") or 0) > (best[1].get("version") or 0):
+                best = (node, response)
+        return best
 
-                for node in replicas:
+    def write_response(self, acks, replicas):
+        # The DataStore already holds the value; this reports how many cache
+        # replicas confirmed the write against the configured quorum.
+        if acks >= WRITE_QUORUM:
+            return {"status": "STORED", "acks": acks, "replicas": replicas}
+        return {"status": "ERROR", "message": f"Write quorum not met ({acks}/{WRITE_QUORUM} acks)",
+                "acks": acks, "replicas": replicas}
 
-                    try:
+    def group_by_replica(self, keys, position):
+        # Groups keys by the node at `position` in each key's replica list.
+        groups = {}
+        for key, nodes in keys.items():
+            if position < len(nodes):
+                groups.setdefault(nodes[position], []).append(key)
+        return groups
 
-                        with socket.create_connection(("localhost", WORKER_PORTS[node])) as sock:
-                            sock.sendall(pickle.dumps({"action": "DELETE", "key": key}))
-                    except:
-                        pass
-                
-                status = "DELETED" if removed else "MISS"
-                conn.sendall(pickle.dumps({"status": status, "message": removed and "" or "Key not found"}))
-                return
+    def mget(self, keys, touch=True):
+        # touch=False only peeks at the replicas: no hit/miss counts and no
+        # DataStore fallback.
+        replicas = {key: self.hash_ring.get_replicas(key, REPLICATION_FACTOR) for key in dict.fromkeys(keys)}
+        values = {}
+        pending = dict(replicas)
+
+        # Each round asks the next replica of every still-missing key, one
+        # batched MGET per node, all nodes in parallel.
+        for position in range(REPLICATION_FACTOR):
+            groups = self.group_by_replica(pending, position)
+            if not groups:
+                break
+            message = {"action": "MGET"} if touch else {"action": "MGET", "touch": False}
+            results = self.pool.request_many(
+                {node: {**message, "keys": node_keys} for node, node_keys in groups.items()})
+            for node, response in results.items():
+                if isinstance(response, Exception):
+                    log.warning("Error contacting %s: %s", node, response, sample=LOG_REQUEST_SAMPLE)
+                    continue
+                for key, value in response.get("values", {}).items():
+                    if value is not None and key in pending:
+                        values[key] = value
+                        del pending[key]
+            if not pending:
+                break
+        if not touch:
+            return {"status": "OK", "values": values, "misses": list(pending)}
+        self.metrics.incr("hits", len(values))
+        self.metrics.incr("misses", len(pending))
 
-            if action == "GET":
-                nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                print(f"[PrimaryServer]  GET request for '{key}' -> checking replicas: {nodes}")
-               
+        # Fallback: check original DataStore and refill the replicas in bulk
+        refill = {}
+        for key, nodes in pending.items():
+            value = self.datastore.get(key)
+            if value:
+                values[key] = value
                 for node in nodes:
-                    print(f"[PrimaryServer] -> Trying {node}...")
-                    response = self.forward_request(node, request)
-                    if response.get("value") is not None:
-                        print(f"[PrimaryServer]  Found value in {node}: {response['value']}")
-                        conn.sendall(pickle.dumps(response))
-                        return
-                    else:
-                        print(f"[PrimaryServer]  {node} did not return value.")
-
-                # Fallback: check original DataStore
-                value = self.datastore.get(key)
-                if value:
-                    print(f"[PrimaryServer] Cache miss  found in DataStore. Replicating to {nodes}")
-                    replicate(key, value, nodes)
-                    conn.sendall(pickle.dumps({"status": "OK", "value": value}))
-                else:
-                    print(f"[PrimaryServer] Key '{key}' not found anywhere.")
-                    conn.sendall(pickle.dumps({"status": "MISS"}))
-            elif action == "SET":
-                self.datastore.set(key, request["value"])
-                nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                replicate(key, request["value"], nodes)
-                conn.sendall(pickle.dumps({"status": "STORED"}))
-
-            elif action == "LIST_KEYS":
-                all_keys = list(self.datastore.store.keys())
-                active_nodes = list(self.hash_ring.nodes)
-                for node in self.hash_ring.nodes:
+                    refill.setdefault(node, {})[key] = value
+        if refill:
+            # Each key keeps the version it has in the DataStore, so a replica
+            # holding a newer write or delete turns the refill away.
+            replicate_batch(refill, ttls={key: self.datastore.ttl(key) for key in values if key in self.datastore.expiry},
+                            versions={key: self.datastore.version(key) for key in values if key in pending})
+
+        misses = [key for key in pending if key not in values]
+        self.metrics.incr("datastore_fallbacks", len(pending) - len(misses))
+        return {"status": "OK", "values": values, "misses": misses}
+
+    def mset(self, items, ttl=None):
+        version = self.next_version()
+        by_node = {}
+        for key, value in items.items():
+            self.datastore.set(key, value, ttl, version)
+            for node in self.write_replicas(key):
+                by_node.setdefault(node, {})[key] = value
+        results = replicate_batch(by_node, version=version, ttl=ttl)
+
+        acks = dict.fromkeys(items, 0)
+        for node, response in results.items():
+            if isinstance(response, dict) and response.get("status") == "STORED":
+                rejected = set(response.get("rejected", ())) | set(response.get("not_admitted", ()))
+                for key in by_node[node]:
+                    if key not in rejected:
+                        acks[key] += 1
+        under_replicated = [key for key, count in acks.items() if count < WRITE_QUORUM]
+        if under_replicated:
+            return {"status": "ERROR", "message": f"Write quorum not met for {len(under_replicated)} keys",
+                    "count": len(items), "under_replicated": under_replicated}
+        return {"status": "STORED", "count": len(items)}
+
+    def mdel(self, keys):
+        version = self.next_version()
+        deleted = []
+        by_node = {}
+        for key in dict.fromkeys(keys):
+            if self.datastore.delete(key, version):
+                deleted.append(key)
+            for node in self.write_replicas(key):
+                by_node.setdefault(node, []).append(key)
+        replicate_delete_batch(by_node, version)
+        return {"status": "OK", "deleted": deleted}
+
+    async def forward_request_async(self, node, message):
+        try:
+            return await self.async_pool.request(node, message)
+        except Exception as e:
+            log.warning("Error contacting %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
+            return {"status": "ERROR"}
+
+    async def read_replicas_async(self, key, nodes):
+        # asyncio version of read_replicas; losing requests are cancelled
+        # outright, which makes the pool drop their connections.
+        if not nodes:
+            return None, None
+        message = {"action": "GET", "key": key}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + READ_TIMEOUT
+        quorum = READ_STRATEGY == "quorum"
+        remaining = list(nodes)
+        pending = {}
+        replies = []
+
+        def launch():
+            node = remaining.pop(0)
+            pending[asyncio.ensure_future(self.async_pool.request(node, message))] = node
+            return node
+
+        last = launch()
+        if quorum:
+            while remaining:
+                launch()
+        needed = min(READ_QUORUM, len(nodes))
+        try:
+            while pending:
+                left = deadline - loop.time()
+                if left <= 0:
+                    break
+                timeout = min(self.hedge_delay(last, self.async_pool), left) if remaining else left
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if remaining:
+                        last = launch()
+                    continue
+                for task in done:
+                    node = pending.pop(task)
                     try:
-                        with socket.create_connection(("localhost", WORKER_PORTS[node])) as sock:
-                            sock.sendall(pickle.dumps({"action": "LIST_KEYS"}))
-                            data = sock.recv(4096)
-                            if data:
-                                worker_keys = pickle.loads(data).get("keys", [])
-                                all_keys.extend(worker_keys)
-                    except:
+                        response = task.result()
+                    except Exception as e:
+                        log.warning("Error contacting %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
                         continue
-                conn.sendall(pickle.dumps({"status": "OK", "keys": list(set(all_keys)), "active_nodes": active_nodes}))
-
-            elif action == "KEY_METADATA":
-                key = request["key"]
-                nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
-                primary = nodes[0] if nodes else "None"
-                conn.sendall(pickle.dumps({
-                    "status": "OK",
-                    "primary": primary,
-                    "replicas": nodes,
-                    "value": self.datastore.get(key) or "In worker cache"
-                }))
-
-            else:
-                conn.sendall(pickle.dumps({"status": "ERROR", "message": "Unknown action"}))
+                    if quorum:
+                        replies.append((node, response))
+                    elif response.get("value") is not None:
+                        return node, response
+                if quorum:
+                    if len(replies) >= needed:
+                        break
+                elif remaining and not pending:
+                    last = launch()
         finally:
-            conn.close()
+            for task in pending:
+                task.cancel()
+            if quorum:
+                self.schedule_read_repair(key, nodes, dict(replies))
+        return self.newest_reply(replies) if quorum else (None, None)
+
+    async def handle_request_async(self, request):
+        # The hot single-key actions talk to workers over the async pool;
+        # everything else reuses the threaded handler off the event loop.
+        action = request.get("action")
+        key = request.get("key")
+
+        if request.get("datastore_only"):
+            return self.store_only(request)
+
+        if action == "GET":
+            nodes = self.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+            node, response = await self.read_replicas_async(key, nodes)
+            if response is not None:
+                self.metrics.incr("hits")
+                if READ_STRATEGY != "quorum" and random.random() < READ_REPAIR_CHANCE:
+                    self.schedule_read_repair(key, nodes, {node: response})
+                return response
+
+            self.metrics.incr("misses")
+            value = self.datastore.get(key)
+            if value:
+                self.metrics.incr("datastore_fallbacks")
+                await replicate_async(key, value, nodes, quorum=0, version=self.datastore.version(key),
+                                      ttl=self.datastore.ttl(key))
+                return {"status": "OK", "value": value}
+            return {"status": "MISS"}
+
+        if action == "SET":
+            ttl = request.get("ttl")
+            version = self.next_version()
+            self.datastore.set(key, request["value"], ttl, version)
+            nodes = self.write_replicas(key)
+            acks = await replicate_async(key, request["value"], nodes, version=version, ttl=ttl)
+            return self.write_response(acks, len(nodes))
+
+        if action == "DELETE":
+            version = self.next_version()
+            removed = self.datastore.delete(key, version)
+            replicas = self.write_replicas(key)
+            await replicate_delete_async(key, replicas, version)
+            status = "DELETED" if removed else "MISS"
+            return {"status": status, "message": removed and "" or "Key not found"}
+
+        if action == "HEARTBEAT":
+            return self.heartbeat(request)
+
+        return await asyncio.get_running_loop().run_in_executor(None, self.handle_request, request)
 
     def start(self):
-        print("[PrimaryServer] Starting on port", PRIMARY_SERVER_PORT)
+        log.info("Starting on port %d", PRIMARY_SERVER_PORT)
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind(("localhost", PRIMARY_SERVER_PORT))
         server.listen()
 
@@ -218,6 +784,32 @@ class PrimaryCacheServer:
             conn, _ = server.accept()
             threading.Thread(target=self.handle_client, args=(conn,), daemon=True).start()
 
+    async def serve_async(self):
+        self.loop = asyncio.get_running_loop()
+        limiter = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+        handler = self.metrics.track_async(self.handle_request_async)
+
+        async def on_connect(reader, writer):
+            await self.metrics.serve_async(serve_stream, reader, writer, handler, "PrimaryServer", limiter)
+
+        server = await asyncio.start_server(on_connect, "localhost", PRIMARY_SERVER_PORT, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+    def start_async(self):
+        log.info("Starting (async) on port %d", PRIMARY_SERVER_PORT)
+        asyncio.run(self.serve_async())
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["thread", "async"], default=SERVER_MODE)
+    parser.add_argument("--log-file", help="Write the log here, rotated by size, instead of to stdout")
+    parser.add_argument("--log-level", choices=list(LEVELS), default=LOG_LEVEL)
+    args = parser.parse_args()
+    configure_logging(args.log_file, args.log_level)
+
     primary_server = PrimaryCacheServer()
-    primary_server.start()
+    if args.mode == "async":
+        primary_server.start_async()
+    else:
+        primary_server.start()
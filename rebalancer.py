@@ -0,0 +1,255 @@
+# rebalancer.py
+
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from config import MIGRATION_BATCH_SIZE, MIGRATION_RATE, RECOVERY_WORKERS
+from log import get_logger
+
+log = get_logger("Rebalance")
+
+
+class RateLimiter:
+    # Token bucket: `rate` units per second with bursts up to `burst`. A rate
+    # of 0 disables throttling.
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class RebalanceJob(ABC):
+    # Shared bookkeeping for background key movement; subclasses implement
+    # execute() and update the counters as they go.
+    kind = "rebalance"
+
+    def __init__(self, node, pool, batch_size=MIGRATION_BATCH_SIZE, rate=MIGRATION_RATE):
+        self.id = uuid.uuid4().hex[:8]
+        self.node = node
+        self.pool = pool
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self.lock = threading.Lock()
+        self.state = "pending"
+        self.keys_total = 0
+        self.keys_moved = 0
+        self.batches = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        self.state = "running"
+        self.started = time.time()
+        try:
+            self.execute()
+        except Exception as e:
+            self.errors += 1
+            log.error("Job %s aborted: %s", self.id, e)
+        self.state = "failed" if self.errors else "done"
+        self.finished = time.time()
+        log.info("%s job %s for %s %s: %d/%d keys in %.2fs", self.kind, self.id, self.node, self.state,
+                 self.keys_moved, self.keys_total, self.finished - self.started)
+
+    @abstractmethod
+    def execute(self):
+        pass
+
+    def moved(self, count):
+        with self.lock:
+            self.keys_moved += count
+            self.batches += 1
+
+    def failed(self, count=1):
+        with self.lock:
+            self.errors += count
+
+    def status(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "node": self.node,
+            "state": self.state,
+            "keys_total": self.keys_total,
+            "keys_moved": self.keys_moved,
+            "batches": self.batches,
+            "errors": self.errors,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class MigrationJob(RebalanceJob):
+    # Streams every key in the given token ranges from their current owners
+    # to a joining node, one RANGE_ITEMS page and one MSET per batch.
+    kind = "join"
+
+    def __init__(self, node, ranges_by_source, pool, **kwargs):
+        super().__init__(node, pool, **kwargs)
+        self.ranges_by_source = ranges_by_source
+        self.sources_done = 0
+        self.pruned = 0
+
+    def execute(self):
+        log.info("Job %s: moving %d token ranges to %s from %s", self.id,
+                 sum(len(r) for r in self.ranges_by_source.values()), self.node, sorted(self.ranges_by_source))
+        # The node tracks every key written from here on. A node restarted
+        # from disk may hold keys deleted while it was down; once all ranges
+        # arrived intact, anything not rewritten during the join is dropped.
+        self.pool.request(self.node, {"action": "JOIN_BEGIN"})
+        for source, ranges in self.ranges_by_source.items():
+            try:
+                self.copy_from(source, ranges)
+            except Exception as e:
+                self.failed()
+                log.error("Job %s: copy from %s failed: %s", self.id, source, e)
+            self.sources_done += 1
+        reply = self.pool.request(self.node, {"action": "JOIN_END", "prune": not self.errors})
+        self.pruned = reply.get("pruned", 0)
+
+    def copy_from(self, source, ranges):
+        # The source snapshots the matching keys on the first page; later
+        # pages walk that snapshot by offset.
+        session = f"{self.id}-{source}"
+        offset = 0
+        while offset is not None:
+            page = self.pool.request(source, {
+                "action": "RANGE_ITEMS", "ranges": ranges, "session": session,
+                "offset": offset, "count": self.batch_size})
+            if page.get("status") != "OK":
+                raise Exception(page.get("message", "range scan failed"))
+            if offset == 0:
+                self.keys_total += page.get("total", 0)
+            items = page.get("items", {})
+            if items:
+                self.limiter.acquire(len(items))
+                # Workers merge on version, so writes that reached the node
+                # while the transfer ran, or data it restored from disk that
+                # is already current, are not overwritten by an older copy.
+                reply = self.pool.request(self.node, {
+                    "action": "MSET", "items": items, "versions": page.get("versions", {}),
+                    "ttls": page.get("ttls", {})})
+                if reply.get("status") != "STORED":
+                    raise Exception(reply.get("message", "write rejected"))
+                self.moved(len(items))
+            tombstones = page.get("tombstones")
+            if tombstones:
+                # Deletes move too, so an older copy of the key arriving from
+                # another replica cannot recreate it on the new node.
+                self.pool.request(self.node, {"action": "MDEL", "keys": list(tombstones), "versions": tombstones})
+            offset = page.get("next")
+
+    def status(self):
+        status = super().status()
+        status["sources"] = len(self.ranges_by_source)
+        status["sources_done"] = self.sources_done
+        status["pruned"] = self.pruned
+        return status
+
+
+class RecoveryJob(RebalanceJob):
+    # Restores the replication factor after `node` failed. Each affected key
+    # is copied from a surviving replica (or the DataStore when none has it)
+    # to the nodes that took over its range. Keys are grouped by
+    # (source, target) and each group moves in MGET/MSET batches on a
+    # bounded thread pool.
+    kind = "recovery"
+
+    def __init__(self, node, old_ring, new_ring, datastore, pool, replication_factor,
+                 workers=RECOVERY_WORKERS, **kwargs):
+        super().__init__(node, pool, **kwargs)
+        self.old_ring = old_ring
+        self.new_ring = new_ring
+        self.datastore = datastore
+        self.replication_factor = replication_factor
+        self.workers = workers
+        self.unrecovered = 0
+
+    def plan(self):
+        groups = {}
+        for key in list(self.datastore.store.keys()):
+            old = self.old_ring.get_replicas(key, self.replication_factor)
+            if self.node not in old:
+                continue
+            survivors = [n for n in old if n != self.node]
+            source = survivors[0] if survivors else None
+            for target in self.new_ring.get_replicas(key, self.replication_factor):
+                if target not in old:
+                    groups.setdefault((source, target), []).append(key)
+        return groups
+
+    def execute(self):
+        groups = self.plan()
+        self.keys_total = sum(len(keys) for keys in groups.values())
+        if not groups:
+            return
+        log.info("Job %s: re-replicating %d keys from failed %s in %d source/target groups",
+                 self.id, self.keys_total, self.node, len(groups))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (source, target), keys in groups.items():
+                for i in range(0, len(keys), self.batch_size):
+                    executor.submit(self.copy_batch, source, target, keys[i:i + self.batch_size])
+
+    def copy_batch(self, source, target, keys):
+        values = {}
+        versions = {}
+        ttls = {}
+        if source is not None:
+            try:
+                # Peek: a recovery copy is not a client access.
+                reply = self.pool.request(source, {"action": "MGET", "keys": keys, "touch": False})
+                values = {k: v for k, v in reply.get("values", {}).items() if v is not None}
+                versions = reply.get("versions", {})
+                ttls = reply.get("ttls", {})
+            except Exception as e:
+                log.warning("Job %s: read from %s failed, using DataStore: %s", self.id, source, e)
+
+        missing = 0
+        for key in keys:
+            if key not in values:
+                value = self.datastore.get(key)
+                if value:
+                    values[key] = value
+                    versions[key] = self.datastore.version(key) or 0
+                    ttl = self.datastore.ttl(key)
+                    if ttl:
+                        ttls[key] = ttl
+                else:
+                    missing += 1
+        if missing:
+            with self.lock:
+                self.unrecovered += missing
+
+        if not values:
+            return
+        self.limiter.acquire(len(values))
+        try:
+            reply = self.pool.request(target, {
+                "action": "MSET", "items": values, "versions": versions, "ttls": ttls})
+            if reply.get("status") != "STORED":
+                raise Exception(reply.get("message", "write rejected"))
+            self.moved(len(values))
+        except Exception as e:
+            self.failed(len(values))
+            log.error("Job %s: write of %d keys to %s failed: %s", self.id, len(values), target, e)
+
+    def status(self):
+        status = super().status()
+        status["unrecovered"] = self.unrecovered
+        return status
@@ -1,27 +1,162 @@
 # replicator.py
 
-import socket
-import pickle
-from config import WORKER_PORTS
+import asyncio
+import functools
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from config import WRITE_QUORUM, WRITE_TIMEOUT, LOG_REQUEST_SAMPLE
+from connection_pool import ConnectionPool, AsyncConnectionPool
+from metrics import Metrics
+from log import get_logger
 
-def replicate(key, value, nodes):
-    for node in nodes:
-        port = WORKER_PORTS[node]
-        try:
-            with socket.create_connection(("localhost", port)) as sock:
-                msg = {"action": "SET", "key": key, "value": value}
-                sock.sendall(pickle.dumps(msg))
-        except Exception as e:
-            print(f"[Replicator] Failed to replicate to {node}: {e}")
-
-def replicate_delete(key, nodes):
+# Shared by the primary server so replication and request forwarding reuse
+# the same keep-alive connections to each worker.
+worker_pool = ConnectionPool()
+async_worker_pool = AsyncConnectionPool()
+# Failed or rejected replica writes, reported in the primary's STATS.
+metrics = Metrics()
+# Failures can repeat on every request while a worker is down, so they are
+# sampled; replication_errors keeps the exact count.
+log = get_logger("Replicator")
+
+def _acked(response):
+    return isinstance(response, dict) and response.get("status") == "STORED"
+
+def _not_admitted(response):
+    # The replica is healthy but its eviction policy turned the key away:
+    # no ack towards the quorum, and not an error either.
+    if isinstance(response, dict) and response.get("status") == "NOT_ADMITTED":
+        metrics.incr("not_admitted")
+        return True
+    return False
+
+def _log_write(node, future):
+    try:
+        response = future.result()
+        if not _acked(response) and not _not_admitted(response):
+            metrics.incr("replication_errors")
+            log.warning("%s rejected write: %s", node, response, sample=LOG_REQUEST_SAMPLE)
+    except Exception as e:
+        metrics.incr("replication_errors")
+        log.warning("Failed to replicate to %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
+
+def _set_message(key, value, version, ttl=None):
+    message = {"action": "SET", "key": key, "value": value}
+    if version is not None:
+        message["version"] = version
+    if ttl:
+        message["ttl"] = ttl
+    return message
+
+def replicate(key, value, nodes, quorum=WRITE_QUORUM, timeout=WRITE_TIMEOUT, version=None, ttl=None):
+    # Writes to all replicas concurrently and returns the number of acks seen
+    # once `quorum` of them arrived (or the timeout passed). The remaining
+    # writes keep running in the background.
+    message = _set_message(key, value, version, ttl)
+    futures = set()
     for node in nodes:
-        port = WORKER_PORTS[node]
-        
-        try:
-            with socket.create_connection(("localhost", port)) as sock:
-                sock.sendall(pickle.dumps({"action": "DELETE", "key": key}))
+        future = worker_pool.submit(node, message)
+        future.add_done_callback(functools.partial(_log_write, node))
+        futures.add(future)
+
+    acks = 0
+    deadline = time.monotonic() + timeout
+    while futures and acks < quorum:
+        done, futures = wait(futures, timeout=max(0, deadline - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        acks += sum(1 for f in done if f.exception() is None and _acked(f.result()))
+    return acks
+
+def _delete_message(key, version):
+    message = {"action": "DELETE", "key": key}
+    if version is not None:
+        message["version"] = version
+    return message
+
+def replicate_delete(key, nodes, version=None):
+    message = _delete_message(key, version)
+    results = worker_pool.request_many({node: message for node in nodes})
+    for node, result in results.items():
+        if isinstance(result, Exception):
+            metrics.incr("replication_errors")
+            log.warning("Failed to delete on %s: %s", node, result, sample=LOG_REQUEST_SAMPLE)
+
+def replicate_batch(items_by_node, version=None, ttl=None, ttls=None, versions=None):
+    # items_by_node maps each worker to the {key: value} items it should hold.
+    # ttl applies to every item; ttls gives per-key TTLs that override it,
+    # and versions per-key versions that override version.
+    messages = {}
+    for node, items in items_by_node.items():
+        if items:
+            messages[node] = {"action": "MSET", "items": items}
+            if version is not None:
+                messages[node]["version"] = version
+            if ttl:
+                messages[node]["ttl"] = ttl
+            if ttls:
+                node_ttls = {key: ttls[key] for key in items if key in ttls}
+                if node_ttls:
+                    messages[node]["ttls"] = node_ttls
+            if versions:
+                node_versions = {key: versions[key] for key in items if versions.get(key) is not None}
+                if node_versions:
+                    messages[node]["versions"] = node_versions
+    results = worker_pool.request_many(messages)
+    for node, result in results.items():
+        if isinstance(result, Exception):
+            metrics.incr("replication_errors")
+            log.warning("Failed to replicate batch to %s: %s", node, result, sample=LOG_REQUEST_SAMPLE)
+    return results
+
+def replicate_delete_batch(keys_by_node, version=None):
+    results = worker_pool.request_many(
+        {node: {"action": "MDEL", "keys": keys, "version": version} for node, keys in keys_by_node.items() if keys})
+    for node, result in results.items():
+        if isinstance(result, Exception):
+            metrics.incr("replication_errors")
+            log.warning("Failed to delete batch on %s: %s", node, result, sample=LOG_REQUEST_SAMPLE)
+
+_background_writes = set()
+
+async def _write_async(node, message):
+    try:
+        response = await async_worker_pool.request(node, message)
+    except Exception as e:
+        metrics.incr("replication_errors")
+        log.warning("Failed to replicate to %s: %s", node, e, sample=LOG_REQUEST_SAMPLE)
+        return False
+    if not _acked(response):
+        if not _not_admitted(response):
+            metrics.incr("replication_errors")
+            log.warning("%s rejected write: %s", node, response, sample=LOG_REQUEST_SAMPLE)
+        return False
+    return True
 
-        except Exception as e:
-            print(f"[Replicator] Failed to delete on {node}: {e}")
+async def replicate_async(key, value, nodes, quorum=WRITE_QUORUM, timeout=WRITE_TIMEOUT, version=None, ttl=None):
+    message = _set_message(key, value, version, ttl)
+    pending = {asyncio.ensure_future(_write_async(node, message)) for node in nodes}
+    acks = 0
+    deadline = time.monotonic() + timeout
+    while pending and acks < quorum:
+        done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        acks += sum(1 for task in done if task.result())
+    # Keep references so the slower writes finish instead of being collected.
+    _background_writes.update(pending)
+    for task in pending:
+        task.add_done_callback(_background_writes.discard)
+    return acks
 
+async def replicate_delete_async(key, nodes, version=None):
+    message = _delete_message(key, version)
+    results = await asyncio.gather(
+        *(async_worker_pool.request(node, message) for node in nodes),
+        return_exceptions=True)
+    for node, result in zip(nodes, results):
+        if isinstance(result, Exception):
+            metrics.incr("replication_errors")
+            log.warning("Failed to delete on %s: %s", node, result, sample=LOG_REQUEST_SAMPLE)
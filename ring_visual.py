@@ -1,28 +1,36 @@
 # ring_visual.py
 
-import hashlib
-from config import WORKER_NODES, VIRTUAL_NODES
-from hashing_ring import ConsistentHashRing
-import socket
-import pickle
+from config import WORKER_NODES, VIRTUAL_NODES, SCAN_COUNT
+from hashing_ring import ConsistentHashRing, ring_hash
+from framing import send_message, recv_message
+from codec import open_connection
 
 PRIMARY_HOST = "localhost"
 PRIMARY_PORT = 4001
 
 def fetch_system_state():
+    # Counts the keys page by page with SCAN; the active nodes come with
+    # every page.
+    key_count = 0
+    active_nodes = []
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((PRIMARY_HOST, PRIMARY_PORT))
-            sock.sendall(pickle.dumps({"action": "LIST_KEYS"}))
-            data = sock.recv(4096)
-            response = pickle.loads(data)
-            return response.get("keys", []), response.get("active_nodes", [])
+        sock, codec = open_connection(PRIMARY_HOST, PRIMARY_PORT)
+        with sock:
+            cursor = 0
+            while True:
+                send_message(sock, {"action": "SCAN", "cursor": cursor, "count": SCAN_COUNT}, codec)
+                response = recv_message(sock, codec)
+                key_count += len(response.get("keys", []))
+                active_nodes = response.get("active_nodes", [])
+                cursor = response.get("cursor", 0)
+                if not cursor:
+                    return key_count, active_nodes
     except Exception as e:
         print(f"[Error] Could not fetch system state from primary server: {e}")
-        return [], []
+        return key_count, active_nodes
 
 def hash_key(key):
-    return int(hashlib.md5(key.encode()).hexdigest(), 16)
+    return ring_hash(key)
 
 def get_virtual_nodes_map(nodes, vnodes):
     ring_map = {}
@@ -46,11 +54,12 @@ def show_ring_adj_list(nodes):
 
 
 if __name__ == "__main__":
-    keys, active_nodes = fetch_system_state()
+    key_count, active_nodes = fetch_system_state()
 
     if not active_nodes:
         print(" No active nodes found. Is the primary server running?")
     else:
+        print(f" {key_count} keys across {len(active_nodes)} active nodes")
         show_ring_adj_list(active_nodes)
 
 
@@ -0,0 +1,393 @@
+# sharded_store.py
+
+import threading
+import time
+from config import WORKER_MEMORY_BYTES, WORKER_SHARDS, EVICTION_POLICY, TOMBSTONE_GRACE
+from eviction import make_cache, count_sizer, Budget
+from timing_wheel import TimingWheel, expiry_loop
+from merkle import MerkleTree, merge_pages, TOMBSTONE_SALT
+
+# Outcomes of a write. NOT_ADMITTED means the eviction policy dropped the
+# entry as it went in: W-TinyLFU's admission filter judged it less popular
+# than the entry it would have displaced.
+STORED = "STORED"
+TOO_LARGE = "TOO_LARGE"
+NOT_ADMITTED = "NOT_ADMITTED"
+
+
+class Shard:
+    # One independently locked slice of the store: its own eviction policy,
+    # TTL table, timing wheel and Merkle tree for anti-entropy. Methods other
+    # than the constructor expect the caller to hold `lock`.
+    def __init__(self, capacity, policy, sizer, on_evict, budget=None):
+        self.lock = threading.Lock()
+        self.on_evict = on_evict
+        self.cache = make_cache(policy, capacity, sizer, self._evicted, budget)
+        self.expiry = {}
+        self.wheel = TimingWheel()
+        self.tree = MerkleTree()
+        # Keys removed by a versioned delete, with the delete's version, kept
+        # for TOMBSTONE_GRACE seconds so anti-entropy propagates the delete
+        # instead of copying the key back from a replica that missed it. It
+        # is a salted Merkle tree, so tombstones count in the node hashes
+        # replicas compare. Tombstones are not charged to the memory budget.
+        self.tombstones = MerkleTree(TOMBSTONE_SALT)
+        self.tombstone_wheel = TimingWheel()
+        self.expirations = 0
+        # Optional write journal (persistence.Persistence), called under the
+        # lock so its record order matches the order writes were applied.
+        self.journal = None
+
+    def _evicted(self, key, entry):
+        self.expiry.pop(key, None)
+        self.tree.discard(key)
+        if self.on_evict is not None:
+            self.on_evict(key, entry)
+
+    def superseded(self, key, version):
+        # True when the live entry or the tombstone for key is at least as
+        # new as `version`, so a write carrying it must be dropped.
+        current = self.lookup(key, touch=False)
+        if current is not None:
+            return current[1] >= version
+        deleted = self.tombstone(key)
+        return deleted is not None and deleted >= version
+
+    def lookup(self, key, touch=True):
+        # The live entry for key or None. An entry found past its deadline is
+        # expired on the spot. touch=False reads without updating the
+        # eviction policy, for scans and metadata.
+        deadline = self.expiry.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.expire((key, deadline))
+            return None
+        if touch:
+            return self.cache.get(key)
+        return self.cache[key] if key in self.cache else None
+
+    def store(self, key, entry, ttl=None):
+        # Only admitted writes are journaled. An overwrite that is not
+        # admitted has also evicted the older value, so the journal records
+        # a delete to keep replay from restoring it.
+        existed = key in self.cache
+        if not self.cache.put(key, entry):
+            return TOO_LARGE
+        if key not in self.cache:
+            if existed and self.journal is not None:
+                self.journal.record_delete(key)
+            return NOT_ADMITTED
+        self.tree.add(key, entry[1])
+        self.tombstones.discard(key)
+        deadline = None
+        if ttl:
+            deadline = time.time() + ttl
+            self.expiry[key] = deadline
+            self.wheel.schedule((key, deadline), deadline)
+        else:
+            self.expiry.pop(key, None)
+        if self.journal is not None:
+            self.journal.record_set(key, entry, deadline)
+        return STORED
+
+    def remove(self, key, version=None):
+        # With a version, an entry written after the delete is kept, and the
+        # delete leaves a tombstone whether or not the key was here.
+        # Unversioned removals (pruning) leave none.
+        entry = self.lookup(key, touch=False)
+        if entry is not None and version is not None and entry[1] > version:
+            return False
+        buried = version is not None and self.bury(key, version)
+        if entry is not None:
+            self.expiry.pop(key, None)
+            self.cache.pop(key)
+            self.tree.discard(key)
+        if self.journal is not None and (buried or entry is not None):
+            self.journal.record_delete(key, version)
+        return entry is not None
+
+    def bury(self, key, version):
+        # Records or advances the tombstone for key; False when one at least
+        # as new is already there.
+        current = self.tombstones.entries.get(key)
+        if current is not None and current[1] >= version:
+            return False
+        self.tombstones.add(key, version)
+        deadline = time.time() + TOMBSTONE_GRACE
+        self.tombstone_wheel.schedule((key, version), deadline)
+        return True
+
+    def tombstone(self, key):
+        # Version of the delete that removed key, or None.
+        current = self.tombstones.entries.get(key)
+        return None if current is None else current[1]
+
+    def collect(self, item):
+        # Drops a tombstone once its grace period has passed, unless a later
+        # delete replaced it.
+        key, version = item
+        if self.tombstone(key) == version:
+            self.tombstones.discard(key)
+
+    def expire(self, item):
+        key, deadline = item
+        if self.expiry.get(key) == deadline:
+            del self.expiry[key]
+            self.cache.pop(key)
+            self.tree.discard(key)
+            self.expirations += 1
+
+
+class ShardedStore:
+    # Thread-safe worker storage split into shards by key hash, so requests
+    # for different keys rarely wait on the same lock. Batch operations take
+    # each shard's lock once for all of their keys.
+    #
+    # The shards share one memory budget: any value up to the whole budget
+    # fits, and a shard holding hot or skewed keys can grow past an even
+    # split while the budget has room. Each shard's capacity is its even
+    # share: a write that takes the store over budget evicts from its own
+    # shard, under the lock it already holds, only while that shard is above
+    # its share. Whatever that leaves over is reclaimed after the lock is
+    # released, first from the shards above their share.
+    def __init__(self, capacity=WORKER_MEMORY_BYTES, shards=WORKER_SHARDS, policy=EVICTION_POLICY,
+                 sizer=count_sizer, on_evict=None):
+        shards = max(1, shards)
+        self.policy = policy
+        self.budget = Budget(capacity, shared=True)
+        self.shards = [Shard(max(capacity // shards, 1), policy, sizer, on_evict, self.budget)
+                       for _ in range(shards)]
+        self.capacity = capacity
+        self.next_victim = 0
+        targets = [(shard.wheel, shard.lock, shard.expire) for shard in self.shards]
+        targets += [(shard.tombstone_wheel, shard.lock, shard.collect) for shard in self.shards]
+        threading.Thread(target=expiry_loop, args=(targets,), daemon=True).start()
+
+    def shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def group(self, keys):
+        groups = {}
+        count = len(self.shards)
+        for key in keys:
+            groups.setdefault(hash(key) % count, []).append(key)
+        return ((self.shards[idx], shard_keys) for idx, shard_keys in groups.items())
+
+    def get(self, key):
+        shard = self.shard(key)
+        with shard.lock:
+            return shard.lookup(key)
+
+    def peek(self, key):
+        shard = self.shard(key)
+        with shard.lock:
+            return shard.lookup(key, touch=False)
+
+    def put(self, key, entry, ttl=None, if_newer=False):
+        # STORED, TOO_LARGE when the entry is larger than the whole budget,
+        # or NOT_ADMITTED. With if_newer an entry no newer than the stored
+        # one, or than the delete that removed the key, is dropped (and
+        # reported as stored: the newer write already superseded it).
+        shard = self.shard(key)
+        with shard.lock:
+            if if_newer and shard.superseded(key, entry[1]):
+                return STORED
+            outcome = shard.store(key, entry, ttl)
+        if self.budget.over():
+            self.reclaim()
+        return outcome
+
+    def delete(self, key, version=None):
+        shard = self.shard(key)
+        with shard.lock:
+            return shard.remove(key, version)
+
+    def get_many(self, keys, touch=True):
+        found = {}
+        for shard, shard_keys in self.group(keys):
+            with shard.lock:
+                for key in shard_keys:
+                    entry = shard.lookup(key, touch)
+                    if entry is not None:
+                        found[key] = entry
+        return found
+
+    def put_many(self, entries, ttls=None, if_newer=False):
+        # entries maps key -> (value, version); returns {key: outcome} for
+        # the keys that were not stored (TOO_LARGE or NOT_ADMITTED). With
+        # if_newer, a key is only written by an entry with a higher version
+        # than the one stored or the tombstone left by its delete.
+        ttls = ttls or {}
+        failed = {}
+        for shard, shard_keys in self.group(entries):
+            with shard.lock:
+                for key in shard_keys:
+                    if if_newer and shard.superseded(key, entries[key][1]):
+                        continue
+                    outcome = shard.store(key, entries[key], ttls.get(key))
+                    if outcome is not STORED:
+                        failed[key] = outcome
+        if self.budget.over():
+            self.reclaim()
+        return failed
+
+    def reclaim(self):
+        # Evicts one entry at a time until the store is back within budget,
+        # taking turns among the shards above their share (or among all of
+        # them when none is). Called with no shard lock held.
+        budget = self.budget
+        count = len(self.shards)
+        idle = 0
+        while budget.over() and idle < count:
+            candidates = [s for s in self.shards if s.cache.used > s.cache.capacity] or self.shards
+            shard = candidates[self.next_victim % len(candidates)]
+            self.next_victim += 1
+            with shard.lock:
+                if len(shard.cache):
+                    shard.cache.evict()
+                    idle = 0
+                else:
+                    idle += 1
+
+    def delete_many(self, keys, version=None, versions=None):
+        # versions gives per-key delete versions that override `version`.
+        versions = versions or {}
+        deleted = []
+        for shard, shard_keys in self.group(keys):
+            with shard.lock:
+                for key in shard_keys:
+                    if shard.remove(key, versions.get(key, version)):
+                        deleted.append(key)
+        return deleted
+
+    def retain(self, keep):
+        # Deletes every key not in `keep`; returns how many were removed.
+        removed = 0
+        for shard in self.shards:
+            with shard.lock:
+                for key in shard.cache.keys():
+                    if key not in keep and shard.remove(key):
+                        removed += 1
+        return removed
+
+    def items(self):
+        # (key, entry, deadline) for every live entry, copied one shard at a
+        # time so no lock is held while the caller consumes them.
+        now = time.time()
+        for shard in self.shards:
+            with shard.lock:
+                expiry = shard.expiry
+                batch = [(key, shard.cache[key], expiry.get(key)) for key in shard.cache.keys()
+                         if expiry.get(key, now + 1) > now]
+            yield from batch
+
+    def tombstone_items(self):
+        # (key, delete version) for every tombstone, for snapshots.
+        for shard in self.shards:
+            with shard.lock:
+                batch = [(key, entry[1]) for key, entry in shard.tombstones.entries.items()]
+            yield from batch
+
+    def tombstone_keys(self):
+        keys = []
+        for shard in self.shards:
+            with shard.lock:
+                keys.extend(shard.tombstones.entries)
+        return keys
+
+    def tombstone_versions(self, keys):
+        # {key: delete version} for the given keys that have a tombstone.
+        found = {}
+        for shard, shard_keys in self.group(keys):
+            with shard.lock:
+                for key in shard_keys:
+                    version = shard.tombstone(key)
+                    if version is not None:
+                        found[key] = version
+        return found
+
+    def tree_hashes(self, level, indices, intervals):
+        # Merkle node hashes combined across shards, live entries and
+        # tombstones alike; XOR trees merge by XOR-ing their nodes.
+        hashes = [0] * len(indices)
+        for shard in self.shards:
+            with shard.lock:
+                for tree in (shard.tree, shard.tombstones):
+                    node_hash = tree.node_hash
+                    for i, index in enumerate(indices):
+                        h = node_hash(level, index, intervals)
+                        hashes[i] = None if h is None else hashes[i] ^ h
+        return hashes
+
+    def leaf_versions(self, leaves, intervals):
+        # ({key: version} of live entries, {key: delete version} of
+        # tombstones) in the given leaves.
+        versions = {}
+        tombstones = {}
+        for shard in self.shards:
+            with shard.lock:
+                versions.update(shard.tree.leaf_versions(leaves, intervals))
+                tombstones.update(shard.tombstones.leaf_versions(leaves, intervals))
+        return versions, tombstones
+
+    def scan(self, cursor, count, match=None):
+        # One page of live keys in ring-token order: (keys, next cursor or
+        # None). `match` filters by key prefix after the page is cut, so a
+        # page may come back short or empty while the scan continues.
+        now = time.time()
+        pages = []
+        for shard in self.shards:
+            with shard.lock:
+                items, nxt = shard.tree.scan(cursor, count)
+                expiry = shard.expiry
+                if expiry:
+                    items = [item for item in items if expiry.get(item[1], now + 1) > now]
+            pages.append((items, nxt))
+        items, nxt = merge_pages(pages, count)
+        keys = [key for _, key in items]
+        if match:
+            keys = [key for key in keys if key.startswith(match)]
+        return keys, nxt
+
+    def set_journal(self, journal):
+        for shard in self.shards:
+            shard.journal = journal
+
+    def keys(self):
+        keys = []
+        now = time.time()
+        for shard in self.shards:
+            with shard.lock:
+                expiry = shard.expiry
+                if expiry:
+                    keys.extend(k for k in shard.cache.keys() if expiry.get(k, now + 1) > now)
+                else:
+                    keys.extend(shard.cache.keys())
+        return keys
+
+    def ttls(self, keys):
+        # Remaining seconds for the given keys that carry a TTL.
+        now = time.time()
+        ttls = {}
+        for shard, shard_keys in self.group(keys):
+            with shard.lock:
+                for key in shard_keys:
+                    deadline = shard.expiry.get(key)
+                    if deadline is not None:
+                        ttls[key] = deadline - now
+        return ttls
+
+    def __len__(self):
+        return sum(len(shard.cache) for shard in self.shards)
+
+    def stats(self):
+        used = entries = evictions = expirations = tombstones = 0
+        for shard in self.shards:
+            with shard.lock:
+                used += shard.cache.used
+                entries += len(shard.cache)
+                evictions += shard.cache.evictions
+                expirations += shard.expirations
+                tombstones += len(shard.tombstones.entries)
+        return {"policy": self.policy, "shards": len(self.shards), "used_bytes": used,
+                "capacity_bytes": self.capacity, "entries": entries, "evictions": evictions,
+                "expirations": expirations, "tombstones": tombstones}
@@ -0,0 +1,289 @@
+# smart_client.py
+
+import argparse
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from config import PRIMARY_SERVER_PORT, WRITE_TIMEOUT, TOPOLOGY_REFRESH, WIRE_CODEC
+from framing import send_message, recv_message
+from codec import open_connection
+from connection_pool import ConnectionPool
+from hashing_ring import ConsistentHashRing
+from hlc import HybridLogicalClock
+
+
+# Pool name of the primary's connection, next to the workers'.
+PRIMARY = "primary"
+
+
+class WrongEpoch(Exception):
+    pass
+
+
+class SmartClient:
+    # Client that places keys itself and talks to the workers directly over
+    # pooled connections, so a request costs one hop and the primary is off
+    # the data path. The topology (nodes, vnodes, replication factor, ports
+    # and epoch) comes from the primary's TOPOLOGY action and is rebuilt
+    # into a local ConsistentHashRing. Every worker request carries the
+    # epoch; a worker that has seen a newer one answers WRONG_EPOCH, and the
+    # client refetches the topology and retries once. It also refetches
+    # after a connection error and every `refresh_interval` seconds.
+    #
+    # Writes get versions from the client's own hybrid logical clock, seeded
+    # from the primary's on every refresh. They go to the cache replicas
+    # and, in parallel, to the primary, which applies them to its DataStore
+    # under the same version without relaying them; a write is only
+    # acknowledged once the DataStore has it. Reads that miss every replica
+    # fall back to the primary, which never brings back a key whose delete
+    # is newer than the value it holds.
+    def __init__(self, host="localhost", primary_port=PRIMARY_SERVER_PORT, refresh_interval=TOPOLOGY_REFRESH):
+        self.host = host
+        self.primary_port = primary_port
+        self.refresh_interval = refresh_interval
+        self.clock = HybridLogicalClock()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.fetched = 0
+        self.stale = False
+        self.refresh()
+
+    def primary_request(self, message):
+        sock, codec = open_connection(self.host, self.primary_port)
+        with sock:
+            send_message(sock, message, codec)
+            return recv_message(sock, codec)
+
+    def refresh(self):
+        topology = self.primary_request({"action": "TOPOLOGY"})
+        vnodes = topology["vnodes"]
+        replication_factor = topology["replication_factor"]
+        ring = ConsistentHashRing(topology["nodes"], vnodes, replication_factor)
+        join_ring = None
+        if topology.get("joining"):
+            join_ring = ConsistentHashRing(topology["nodes"] + [topology["joining"]], vnodes, replication_factor)
+        self.clock.update(topology.get("version"))
+        with self.lock:
+            if self.pool is None:
+                # A client, not a cluster member: use the client codec
+                # rather than the pickle-by-default peer codec.
+                self.pool = ConnectionPool({**topology["ports"], PRIMARY: self.primary_port}, self.host,
+                                           codec_name=WIRE_CODEC)
+            else:
+                self.pool.ports.update(topology["ports"])
+            self.epoch = topology["epoch"]
+            self.ring = ring
+            self.join_ring = join_ring
+            self.replication_factor = replication_factor
+            self.write_quorum = topology["write_quorum"]
+            self.fetched = time.monotonic()
+            self.stale = False
+
+    def maybe_refresh(self):
+        if self.stale or time.monotonic() - self.fetched > self.refresh_interval:
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"[SmartClient] Topology refresh failed, keeping epoch {self.epoch}: {e}")
+
+    def request(self, node, message):
+        try:
+            reply = self.pool.request(node, {**message, "epoch": self.epoch})
+        except Exception:
+            self.stale = True
+            raise
+        if reply.get("status") == "WRONG_EPOCH":
+            raise WrongEpoch(f"{node} is at epoch {reply.get('epoch')}, client at {self.epoch}")
+        return reply
+
+    def retry(self, operation, *args):
+        self.maybe_refresh()
+        try:
+            return operation(*args)
+        except WrongEpoch:
+            self.refresh()
+            return operation(*args)
+
+    def replicas(self, key):
+        return self.ring.get_replicas(key, self.replication_factor)
+
+    def write_replicas(self, key):
+        # Same rule as the primary: a joining node also receives writes for
+        # the ranges it is taking over.
+        nodes = self.replicas(key)
+        if self.join_ring is not None:
+            for node in self.join_ring.get_replicas(key, self.replication_factor):
+                if node not in nodes:
+                    nodes.append(node)
+        return nodes
+
+    def get(self, key):
+        return self.retry(self._get, key)
+
+    def _get(self, key):
+        for node in self.replicas(key):
+            try:
+                reply = self.request(node, {"action": "GET", "key": key})
+            except WrongEpoch:
+                raise
+            except Exception as e:
+                print(f"[SmartClient] Error contacting {node}: {e}")
+                continue
+            if reply.get("value") is not None:
+                return reply
+        # Every replica missed: the primary also checks its DataStore.
+        return self.primary_request({"action": "GET", "key": key})
+
+    def set(self, key, value, ttl=None):
+        message = {"action": "SET", "key": key, "value": value, "version": self.clock.now()}
+        if ttl:
+            message["ttl"] = ttl
+        # The version is fixed before any attempt, so a retry after
+        # WRONG_EPOCH is idempotent on replicas that already applied it.
+        return self.retry(self._write, key, message)
+
+    def delete(self, key):
+        message = {"action": "DELETE", "key": key, "version": self.clock.now()}
+        return self.retry(self._write, key, message)
+
+    def _write(self, key, message):
+        nodes = self.write_replicas(key)
+        store = self.pool.submit(PRIMARY, {**message, "datastore_only": True})
+        futures = {self.pool.submit(node, {**message, "epoch": self.epoch}): node for node in nodes}
+        acks = deleted = 0
+        deadline = time.monotonic() + WRITE_TIMEOUT
+        pending = set(futures)
+        # Deletes hear from every replica so the reply says whether any held the key.
+        wait_all = message["action"] == "DELETE"
+        while pending and (wait_all or acks < self.write_quorum):
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                node = futures[future]
+                error = future.exception()
+                if error is not None:
+                    self.stale = True
+                    print(f"[SmartClient] Write to {node} failed: {error}")
+                    continue
+                status = future.result().get("status")
+                if status == "WRONG_EPOCH":
+                    raise WrongEpoch(f"{node} is at epoch {future.result().get('epoch')}")
+                if status in ("STORED", "DELETED", "NOT_FOUND"):
+                    acks += 1
+                    deleted += status == "DELETED"
+        error = self.store_error(store, deadline)
+        if error is not None:
+            return {"status": "ERROR", "message": error, "acks": acks, "replicas": len(nodes)}
+        if message["action"] == "DELETE":
+            return {"status": "DELETED" if deleted else "MISS", "acks": acks, "replicas": len(nodes)}
+        if acks >= self.write_quorum:
+            return {"status": "STORED", "acks": acks, "replicas": len(nodes)}
+        return {"status": "ERROR", "message": f"Write quorum not met ({acks}/{self.write_quorum} acks)",
+                "acks": acks, "replicas": len(nodes)}
+
+    def store_error(self, store, deadline):
+        # Waits for the primary's DataStore write; an error message, or None.
+        try:
+            reply = store.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            return f"DataStore write failed: {e or 'timed out'}"
+        if reply.get("status") == "ERROR":
+            return f"DataStore write failed: {reply.get('message')}"
+        return None
+
+    def mget(self, keys):
+        return self.retry(self._mget, list(keys))
+
+    def _mget(self, keys):
+        by_node = {}
+        for key in keys:
+            by_node.setdefault(self.replicas(key)[0], []).append(key)
+        values = {}
+        for node, reply in self.pool.request_many(
+                {node: {"action": "MGET", "keys": node_keys, "epoch": self.epoch}
+                 for node, node_keys in by_node.items()}).items():
+            if isinstance(reply, Exception):
+                self.stale = True
+                continue
+            if reply.get("status") == "WRONG_EPOCH":
+                raise WrongEpoch(f"{node} is at epoch {reply.get('epoch')}")
+            values.update((k, v) for k, v in reply.get("values", {}).items() if v is not None)
+        misses = [key for key in keys if key not in values]
+        if misses:
+            # The primary retries the other replicas and its DataStore.
+            reply = self.primary_request({"action": "MGET", "keys": misses})
+            values.update(reply.get("values", {}))
+            misses = reply.get("misses", [])
+        return {"status": "OK", "values": values, "misses": misses}
+
+    def mset(self, items, ttl=None):
+        version = self.clock.now()
+        return self.retry(self._mset, dict(items), version, ttl)
+
+    def _mset(self, items, version, ttl):
+        by_node = {}
+        for key, value in items.items():
+            for node in self.write_replicas(key):
+                by_node.setdefault(node, {})[key] = value
+        store = {"action": "MSET", "items": items, "version": version, "datastore_only": True}
+        if ttl:
+            store["ttl"] = ttl
+        store = self.pool.submit(PRIMARY, store)
+        messages = {}
+        for node, node_items in by_node.items():
+            messages[node] = {"action": "MSET", "items": node_items, "version": version, "epoch": self.epoch}
+            if ttl:
+                messages[node]["ttl"] = ttl
+        stored = set()
+        for node, reply in self.pool.request_many(messages).items():
+            if isinstance(reply, Exception):
+                self.stale = True
+                print(f"[SmartClient] MSET to {node} failed: {reply}")
+                continue
+            if reply.get("status") == "WRONG_EPOCH":
+                raise WrongEpoch(f"{node} is at epoch {reply.get('epoch')}")
+            rejected = set(reply.get("rejected", [])) | set(reply.get("not_admitted", []))
+            stored.update(k for k in messages[node]["items"] if k not in rejected)
+        error = self.store_error(store, time.monotonic() + WRITE_TIMEOUT)
+        if error is not None:
+            return {"status": "ERROR", "message": error, "count": len(stored)}
+        return {"status": "STORED", "count": len(stored)}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["GET", "SET", "DELETE", "MGET", "MSET"])
+    parser.add_argument("args", nargs="+",
+                        help="GET key | SET key value | DELETE key | MGET key... | MSET key=value...")
+    parser.add_argument("--ttl", type=float, help="Seconds until SET/MSET keys expire")
+    args = parser.parse_args()
+
+    client = SmartClient()
+    if args.action == "GET":
+        response = client.get(args.args[0])
+    elif args.action == "SET":
+        if len(args.args) < 2:
+            print("SET requires a value.")
+            return
+        response = client.set(args.args[0], args.args[1], args.ttl)
+    elif args.action == "DELETE":
+        response = client.delete(args.args[0])
+    elif args.action == "MGET":
+        response = client.mget(args.args)
+    else:
+        if not all("=" in arg for arg in args.args):
+            print("MSET requires key=value pairs.")
+            return
+        response = client.mset(dict(arg.split("=", 1) for arg in args.args), args.ttl)
+    print("Response:", response)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# conftest.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import replicator
+from datastore import DataStore
+from hashing_ring import ConsistentHashRing
+from hlc import HybridLogicalClock
+from metrics import Metrics
+from primary_server import PrimaryCacheServer
+
+
+class FakeWorkers:
+    # Stands in for the primary's worker pool. Each node keeps
+    # {key: (value, version)} in memory, where a write only replaces an
+    # older version, and answers after its delay; a node
+    # given a fixed reply answers every request with it instead, raising it
+    # when it is an exception. `sent` records every (node, message) in
+    # arrival order, and every node's latency percentile is `hedge_delay`.
+    def __init__(self, delays, replies=None, hedge_delay=0.05):
+        self.delays = delays
+        self.replies = replies or {}
+        self.data = {node: {} for node in delays}
+        self.sent = []
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.async_pool = AsyncFakeWorkers(self)
+        self.latency = self
+        self.hedge_delay = hedge_delay
+
+    def percentile(self, node, pct, default):
+        return self.hedge_delay
+
+    def answer(self, node, message):
+        self.sent.append((node, message))
+        time.sleep(self.delays[node])
+        return self.reply(node, message)
+
+    def reply(self, node, message):
+        reply = self.replies.get(node)
+        if isinstance(reply, Exception):
+            raise reply
+        if reply is not None:
+            return reply
+        return self.apply(self.data[node], message)
+
+    def apply(self, data, message):
+        action = message["action"]
+        if action == "GET":
+            if message["key"] not in data:
+                return {"status": "OK", "value": None}
+            value, version = data[message["key"]]
+            return {"status": "OK", "value": value, "version": version}
+        if action == "SET":
+            self.store(data, message["key"], message["value"], message.get("version", 0))
+            return {"status": "STORED"}
+        if action == "DELETE":
+            data.pop(message["key"], None)
+            return {"status": "DELETED"}
+        if action == "MGET":
+            found = {k: data[k] for k in message["keys"] if k in data}
+            return {"status": "OK", "values": {k: entry[0] for k, entry in found.items()},
+                    "versions": {k: entry[1] for k, entry in found.items()}}
+        if action == "MSET":
+            versions = message.get("versions") or {}
+            for k, value in message["items"].items():
+                self.store(data, k, value, versions.get(k, message.get("version", 0)))
+            return {"status": "STORED", "count": len(message["items"])}
+        if action == "MDEL":
+            deleted = [k for k in message["keys"] if data.pop(k, None) is not None]
+            return {"status": "OK", "deleted": deleted}
+        raise AssertionError(f"Unexpected action {action}")
+
+    def store(self, data, key, value, version):
+        if key not in data or data[key][1] < version:
+            data[key] = (value, version)
+
+    def request(self, node, message):
+        return self.answer(node, message)
+
+    def submit(self, node, message):
+        return self.executor.submit(self.answer, node, message)
+
+    def request_many(self, messages):
+        futures = {node: self.submit(node, message) for node, message in messages.items()}
+        results = {}
+        for node, future in futures.items():
+            try:
+                results[node] = future.result()
+            except Exception as e:
+                results[node] = e
+        return results
+
+    def actions(self, action):
+        # {node: [message, ...]} for the messages of one action.
+        sent = {}
+        for node, message in self.sent:
+            if message["action"] == action:
+                sent.setdefault(node, []).append(message)
+        return sent
+
+
+class AsyncFakeWorkers:
+    # The same workers behind the AsyncConnectionPool interface.
+    def __init__(self, workers):
+        self.workers = workers
+
+    async def request(self, node, message):
+        self.workers.sent.append((node, message))
+        await asyncio.sleep(self.workers.delays[node])
+        return self.workers.reply(node, message)
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    # Returns a factory that installs FakeWorkers as the replicator's pools.
+    def install(delays, replies=None, hedge_delay=0.05):
+        fake = FakeWorkers(delays, replies, hedge_delay)
+        monkeypatch.setattr(replicator, "worker_pool", fake)
+        monkeypatch.setattr(replicator, "async_worker_pool", fake.async_pool)
+        return fake
+    return install
+
+
+@pytest.fixture
+def primary(workers):
+    # Returns a factory for a primary on top of FakeWorkers, with a DataStore
+    # and a ring over the given nodes but no monitor thread or sockets.
+    def build(delays, replies=None, hedge_delay=0.05):
+        server = PrimaryCacheServer.__new__(PrimaryCacheServer)
+        server.pool = workers(delays, replies, hedge_delay)
+        server.read_executor = ThreadPoolExecutor(max_workers=4)
+        server.datastore = DataStore()
+        server.hash_ring = ConsistentHashRing(list(delays))
+        server.joining = None
+        server.join_ring = None
+        server.jobs = []
+        server.clock = HybridLogicalClock()
+        server.repair_executor = ThreadPoolExecutor(max_workers=2)
+        server.read_repairs = 0
+        server.metrics = Metrics()
+        return server
+    return build
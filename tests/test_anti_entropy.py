@@ -0,0 +1,116 @@
+# test_anti_entropy.py
+
+import pytest
+from anti_entropy import AntiEntropyJob
+from datastore import DataStore
+from hashing_ring import ConsistentHashRing
+from rebalancer import RecoveryJob
+from worker_node import WorkerNode
+
+KEYS = [f"key:{i}" for i in range(600)]
+
+
+class LocalPool:
+    # Routes pool requests straight to in-process workers.
+    def __init__(self, workers):
+        self.workers = workers
+        self.sent = []
+
+    def request(self, node, message):
+        self.sent.append((node, message))
+        return self.workers[node].handle_command(message)
+
+    def request_many(self, messages):
+        return {node: self.request(node, message) for node, message in messages.items()}
+
+
+def contents(worker):
+    return {key: entry for key, entry, _ in worker.cache.items()}
+
+
+@pytest.fixture
+def cluster():
+    workers = {node: WorkerNode(node) for node in ("node1", "node2")}
+    for worker in workers.values():
+        worker.handle_command({"action": "MSET", "items": {key: "v1" for key in KEYS}, "version": 10})
+    return workers
+
+
+def repair(workers, pool=None):
+    pool = pool or LocalPool(workers)
+    job = AntiEntropyJob(ConsistentHashRing(list(workers), replication_factor=2), pool, rate=0)
+    job.run()
+    assert job.state == "done"
+    return job
+
+
+def test_replicas_converge(cluster):
+    node1, node2 = cluster["node1"], cluster["node2"]
+    node1.handle_command({"action": "MDEL", "keys": KEYS[:50]})
+    node2.handle_command({"action": "MSET", "items": {key: "v2" for key in KEYS[50:70]}, "version": 20})
+    node1.handle_command({"action": "MSET", "items": {"extra": "x"}, "version": 15})
+    repair(cluster)
+    assert contents(node1) == contents(node2)
+    assert contents(node1)[KEYS[0]] == ("v1", 10)
+    assert contents(node1)[KEYS[60]] == ("v2", 20)
+    assert contents(node2)["extra"] == ("x", 15)
+
+
+def test_versioned_delete_is_not_resurrected(cluster):
+    # The delete reached node1 only; node2 still holds the older value.
+    node1, node2 = cluster["node1"], cluster["node2"]
+    deleted = KEYS[:40]
+    node1.handle_command({"action": "MDEL", "keys": deleted, "version": 30})
+    repair(cluster)
+    for worker in (node1, node2):
+        assert not set(deleted) & set(contents(worker))
+        assert worker.cache.tombstone_versions(deleted) == dict.fromkeys(deleted, 30)
+    # A late copy of the old value is refused by the tombstone.
+    node1.handle_command({"action": "SET", "key": deleted[0], "value": "v1", "version": 10})
+    assert deleted[0] not in contents(node1)
+
+
+def test_write_newer_than_a_delete_survives(cluster):
+    node1, node2 = cluster["node1"], cluster["node2"]
+    node1.handle_command({"action": "DELETE", "key": KEYS[0], "version": 30})
+    node2.handle_command({"action": "SET", "key": KEYS[0], "value": "v3", "version": 40})
+    repair(cluster)
+    assert contents(node1)[KEYS[0]] == ("v3", 40)
+    assert contents(node2)[KEYS[0]] == ("v3", 40)
+
+
+def test_converged_replicas_compare_equal(cluster):
+    job = repair(cluster)
+    assert job.keys_total == 0
+    assert job.leaves_compared == 0
+
+
+def test_repair_copies_do_not_touch_the_eviction_order(cluster):
+    node1, node2 = cluster["node1"], cluster["node2"]
+    node1.handle_command({"action": "MDEL", "keys": KEYS[:50]})
+    pool = LocalPool(cluster)
+    repair(cluster, pool)
+    reads = [message for _, message in pool.sent if message["action"] == "MGET"]
+    assert reads and all(message["touch"] is False for message in reads)
+    assert contents(node1) == contents(node2)
+
+
+def test_recovery_copies_do_not_touch_the_eviction_order():
+    workers = {node: WorkerNode(node) for node in ("node1", "node2", "node3")}
+    old_ring = ConsistentHashRing(list(workers), replication_factor=2)
+    new_ring = ConsistentHashRing(["node2", "node3"], replication_factor=2)
+    datastore = DataStore()
+    for key in KEYS:
+        datastore.set(key, "v1")
+        for node in old_ring.get_replicas(key, 2):
+            workers[node].handle_command({"action": "SET", "key": key, "value": "v1", "version": 10})
+    del workers["node1"]
+    pool = LocalPool(workers)
+    job = RecoveryJob("node1", old_ring, new_ring, datastore, pool, 2, rate=0)
+    job.run()
+    assert job.state == "done" and job.keys_moved == job.keys_total > 0
+    reads = [message for _, message in pool.sent if message["action"] == "MGET"]
+    assert reads and all(message["touch"] is False for message in reads)
+    for key in KEYS:
+        for node in new_ring.get_replicas(key, 2):
+            assert contents(workers[node])[key] == ("v1", 10)
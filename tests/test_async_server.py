@@ -0,0 +1,111 @@
+# test_async_server.py
+
+import asyncio
+import pytest
+from codec import serve_stream, HELLO_MAGIC
+from connection_pool import AsyncConnectionPool
+from framing import read_frame, write_frame
+
+
+async def start(handler, limiter=None):
+    server = await asyncio.start_server(
+        lambda reader, writer: serve_stream(reader, writer, handler, limiter=limiter), "localhost", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def echo(request):
+    return {"status": "OK", "value": request["key"]}
+
+
+async def slow_echo(request):
+    await asyncio.sleep(0.01)
+    return echo(request)
+
+
+@pytest.mark.parametrize("handler", [echo, slow_echo])
+def test_pool_requests_share_one_connection(handler):
+    async def run():
+        server, port = await start(handler)
+        connections = []
+        async with server:
+            pool = AsyncConnectionPool(ports={"node1": port})
+            original = pool._connect
+
+            async def connect(node):
+                connections.append(node)
+                return await original(node)
+            pool._connect = connect
+            for key in "abc":
+                assert await pool.request("node1", {"action": "GET", "key": key}) == {"status": "OK", "value": key}
+            pool.close_node("node1")
+        return connections
+    assert asyncio.run(run()) == ["node1"]
+
+
+def test_handler_errors_are_answered():
+    def fail(request):
+        raise ValueError("boom")
+
+    async def run():
+        server, port = await start(fail)
+        async with server:
+            pool = AsyncConnectionPool(ports={"node1": port})
+            reply = await pool.request("node1", {"action": "GET", "key": "k"})
+            pool.close_node("node1")
+            return reply
+    assert asyncio.run(run()) == {"status": "ERROR", "message": "boom"}
+
+
+def test_limiter_bounds_requests_in_flight():
+    in_flight = []
+    peak = []
+
+    async def handler(request):
+        in_flight.append(request)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.02)
+        in_flight.remove(request)
+        return echo(request)
+
+    async def run():
+        server, port = await start(handler, limiter=asyncio.Semaphore(2))
+        async with server:
+            pool = AsyncConnectionPool(ports={"node1": port})
+            replies = await asyncio.gather(*(pool.request("node1", {"action": "GET", "key": str(i)})
+                                             for i in range(6)))
+            pool.close_node("node1")
+            return replies
+    replies = asyncio.run(run())
+    assert [reply["value"] for reply in replies] == [str(i) for i in range(6)]
+    assert max(peak) == 2
+
+
+def test_cancelled_request_discards_its_connection():
+    async def run():
+        server, port = await start(slow_echo)
+        async with server:
+            pool = AsyncConnectionPool(ports={"node1": port})
+            task = asyncio.ensure_future(pool.request("node1", {"action": "GET", "key": "a"}))
+            await asyncio.sleep(0.005)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            _, idle = pool._node_state("node1")
+            assert not idle
+            assert (await pool.request("node1", {"action": "GET", "key": "b"}))["value"] == "b"
+            pool.close_node("node1")
+    asyncio.run(run())
+
+
+def test_unknown_codec_is_refused():
+    async def run():
+        server, port = await start(echo)
+        async with server:
+            reader, writer = await asyncio.open_connection("localhost", port)
+            write_frame(writer, HELLO_MAGIC + b"json")
+            await writer.drain()
+            reply = await read_frame(reader)
+            assert reply.startswith(HELLO_MAGIC) and reply[4:] != b"json"
+            assert await read_frame(reader) is None
+            writer.close()
+    asyncio.run(run())
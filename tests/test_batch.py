@@ -0,0 +1,86 @@
+# test_batch.py
+
+from config import REPLICATION_FACTOR
+
+NODES = {"node1": 0, "node2": 0, "node3": 0}
+KEYS = [f"key:{i}" for i in range(30)]
+
+
+def replicas(server, key):
+    return server.hash_ring.get_replicas(key, REPLICATION_FACTOR)
+
+
+def test_mset_sends_one_batch_per_replica(primary):
+    server = primary(NODES)
+    items = {key: f"v{key}" for key in KEYS}
+    assert server.handle_request({"action": "MSET", "items": items}) == {"status": "STORED", "count": len(KEYS)}
+    sent = server.pool.actions("MSET")
+    assert all(len(messages) == 1 for messages in sent.values())
+    for node, data in server.pool.data.items():
+        assert sorted(data) == sorted(key for key in KEYS if node in replicas(server, key))
+    assert all(server.datastore.get(key) == f"v{key}" for key in KEYS)
+
+
+def test_mget_asks_each_first_replica_once(primary):
+    server = primary(NODES)
+    server.handle_request({"action": "MSET", "items": {key: "v" for key in KEYS}})
+    server.pool.sent.clear()
+    reply = server.handle_request({"action": "MGET", "keys": KEYS + KEYS[:5]})
+    assert reply == {"status": "OK", "values": {key: "v" for key in KEYS}, "misses": []}
+    sent = server.pool.actions("MGET")
+    assert all(len(messages) == 1 for messages in sent.values())
+    for node, (message,) in sent.items():
+        assert sorted(message["keys"]) == sorted(key for key in KEYS if replicas(server, key)[0] == node)
+
+
+def test_mget_retries_only_missing_keys_on_the_next_replica(primary):
+    server = primary(NODES, replies={"node1": ConnectionError("down")})
+    for key in KEYS:
+        for node in replicas(server, key):
+            server.pool.data[node][key] = ("v", 1)
+    reply = server.handle_request({"action": "MGET", "keys": KEYS})
+    assert reply["values"] == {key: "v" for key in KEYS}
+    sent = server.pool.actions("MGET")
+    for key in KEYS:
+        first, second = replicas(server, key)
+        retried = any(key in message["keys"] for message in sent.get(second, []))
+        assert retried == (first == "node1")
+
+
+def test_mget_falls_back_to_the_datastore_and_refills(primary):
+    server = primary(NODES)
+    server.datastore.store["lost"] = "found"
+    reply = server.handle_request({"action": "MGET", "keys": ["lost", "nowhere"]})
+    assert reply == {"status": "OK", "values": {"lost": "found"}, "misses": ["nowhere"]}
+    refilled = sorted(node for node, data in server.pool.data.items() if "lost" in data)
+    assert refilled == sorted(replicas(server, "lost"))
+
+
+def test_mdel_sends_one_batch_per_replica(primary):
+    server = primary(NODES)
+    server.handle_request({"action": "MSET", "items": {key: "v" for key in KEYS}})
+    reply = server.handle_request({"action": "MDEL", "keys": KEYS[:10] + ["never-set"]})
+    assert sorted(reply["deleted"]) == sorted(KEYS[:10])
+    assert all(len(messages) == 1 for messages in server.pool.actions("MDEL").values())
+    for data in server.pool.data.values():
+        assert not set(data) & set(KEYS[:10])
+    assert all(server.datastore.get(key) is None for key in KEYS[:10])
+
+
+def test_keys_metadata_peeks_at_values_missing_from_the_datastore(primary):
+    server = primary(NODES)
+    server.handle_request({"action": "MSET", "items": {key: "v" for key in KEYS}})
+    for key in KEYS[:10]:
+        server.datastore.delete(key)
+    server.pool.sent.clear()
+    reply = server.handle_request({"action": "KEYS_METADATA", "keys": KEYS[5:15] + KEYS[5:7], "preview": 1})
+    assert [entry["key"] for entry in reply["keys"]] == KEYS[5:15]
+    for entry in reply["keys"]:
+        assert entry["replicas"] == replicas(server, entry["key"])
+        assert entry["primary"] == entry["replicas"][0] and entry["value"] == "v"
+    # Only the five keys the DataStore lost are fetched, without touching.
+    sent = server.pool.actions("MGET")
+    assert sorted(key for messages in sent.values() for m in messages for key in m["keys"]) == sorted(KEYS[5:10])
+    assert all(m["touch"] is False for messages in sent.values() for m in messages)
+    assert reply["total"] == len(server.datastore.store)
+
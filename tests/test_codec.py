@@ -0,0 +1,89 @@
+# test_codec.py
+
+import socket
+import threading
+import pytest
+from codec import (BinaryCodec, PickleCodec, CodecError, HELLO_MAGIC, encode_value, decode_value,
+                   client_handshake, serve_connection)
+from framing import send_message, recv_message, send_frame, recv_frame
+
+MESSAGES = [
+    {"action": "GET", "key": "k"},
+    {"action": "SET", "key": "k", "value": "v"},
+    {"action": "SET", "key": "k", "value": b"\x00\xffbytes"},
+    {"action": "SET", "key": "k", "value": {"nested": [1, 2.5, None], "big": 2 ** 64 - 1}},
+    {"action": "DELETE", "key": "k"},
+    {"action": "LIST_KEYS"},
+    {"status": "OK", "value": "v"},
+    {"status": "STORED"},
+    {"status": "MISS"},
+    {"status": "OK", "keys": ["a", "b\x00c", ""], "active_nodes": ["node1", "node2"]},
+    {"status": "ERROR", "message": "Key not found"},
+]
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_binary_round_trip(message):
+    codec = BinaryCodec()
+    assert codec.decode(codec.encode(message)) == message
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_pickle_round_trip(message):
+    codec = PickleCodec()
+    assert codec.decode(codec.encode(message)) == message
+
+
+def test_values_keep_their_types():
+    value = {"t": (1, "x"), "l": [1, 2.5, None, True, False], "big": -(2 ** 70), "nested": {"k": ["a", "b"]}}
+    decoded, pos = decode_value(encode_value(value))
+    assert decoded == value
+    assert type(decoded["t"]) is tuple
+    assert decoded["l"][3] is True and decoded["l"][4] is False
+
+
+def test_binary_is_smaller_than_pickle():
+    message = {"action": "SET", "key": "user:42", "value": "x" * 20}
+    assert len(BinaryCodec().encode(message)) < len(PickleCodec().encode(message))
+
+
+def test_non_string_key_is_rejected():
+    with pytest.raises(CodecError):
+        BinaryCodec().encode({"action": "GET", "key": 5})
+
+
+def test_unencodable_value_is_rejected():
+    with pytest.raises(CodecError):
+        BinaryCodec().encode({"action": "SET", "key": "k", "value": object()})
+
+
+@pytest.mark.parametrize("cut", [1, 3, 7])
+def test_truncated_message_is_rejected(cut):
+    data = BinaryCodec().encode({"action": "SET", "key": "key", "value": "value"})
+    with pytest.raises(CodecError):
+        BinaryCodec().decode(data[:cut])
+
+
+def test_handshake_then_requests_over_one_connection():
+    client, server = socket.socketpair()
+    thread = threading.Thread(target=serve_connection,
+                              args=(server, lambda request: {"status": "OK", "value": request.get("key")}))
+    thread.start()
+    with client:
+        codec = client_handshake(client, "binary")
+        for key in ("a", "b"):
+            send_message(client, {"action": "GET", "key": key}, codec)
+            assert recv_message(client, codec) == {"status": "OK", "value": key}
+    thread.join()
+
+
+def test_unknown_codec_is_refused():
+    client, server = socket.socketpair()
+    thread = threading.Thread(target=serve_connection, args=(server, lambda request: {"status": "OK"}))
+    thread.start()
+    with client:
+        # client_handshake only offers codecs it knows, so send the HELLO by hand.
+        send_frame(client, HELLO_MAGIC + b"json")
+        reply = bytes(recv_frame(client))
+        assert reply.startswith(HELLO_MAGIC) and reply[4:] != b"json"
+        assert recv_frame(client) is None
+    thread.join()
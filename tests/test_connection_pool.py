@@ -0,0 +1,134 @@
+# test_connection_pool.py
+
+import socket
+import threading
+import time
+import pytest
+from codec import server_handshake
+from connection_pool import ConnectionPool, PoolExhausted
+from framing import send_message, recv_message, send_frame, recv_frame
+
+
+class EchoWorker:
+    # A worker stand-in on an ephemeral port: after the codec handshake it
+    # answers each GET with the key it asked for, and hangs up after
+    # `per_connection` replies (never when None).
+    def __init__(self, per_connection=None):
+        self.per_connection = per_connection
+        self.connections = 0
+        self.server = socket.create_server(("localhost", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        with conn:
+            codec, _ = server_handshake(conn, recv_frame(conn))
+            replies = 0
+            while self.per_connection is None or replies < self.per_connection:
+                frame = recv_frame(conn)
+                if frame is None:
+                    return
+                request = codec.decode(frame)
+                send_frame(conn, codec.encode({"status": "OK", "value": request["key"]}))
+                replies += 1
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def worker():
+    workers = []
+
+    def start(per_connection=None):
+        workers.append(EchoWorker(per_connection))
+        return workers[-1]
+    yield start
+    for w in workers:
+        w.close()
+
+
+def pool_for(worker, **options):
+    return ConnectionPool(ports={"node1": worker.port}, **options)
+
+
+def get(key):
+    return {"action": "GET", "key": key}
+
+
+def test_requests_reuse_one_connection(worker):
+    w = worker()
+    pool = pool_for(w)
+    for key in "abcde":
+        assert pool.request("node1", get(key)) == {"status": "OK", "value": key}
+    assert w.connections == 1
+    pool.close_all()
+
+
+def test_stale_socket_is_retried_on_a_fresh_connection(worker, monkeypatch):
+    # The worker hangs up after every reply; with the health check blind to
+    # it, the reused socket fails and the request is sent again.
+    w = worker(per_connection=1)
+    pool = pool_for(w)
+    monkeypatch.setattr(pool, "_is_healthy", lambda sock, last_used: True)
+    assert pool.request("node1", get("a"))["value"] == "a"
+    time.sleep(0.05)
+    assert pool.request("node1", get("b"))["value"] == "b"
+    assert w.connections == 2
+    pool.close_all()
+
+
+def test_fresh_connection_failure_is_not_retried(worker):
+    w = worker(per_connection=0)
+    pool = pool_for(w)
+    with pytest.raises(ConnectionError):
+        pool.request("node1", get("a"))
+    assert w.connections == 1
+
+
+def test_health_check_drops_closed_and_expired_sockets(worker):
+    w = worker(per_connection=1)
+    pool = pool_for(w, idle_timeout=60)
+    sock, reused = pool.acquire("node1")
+    assert not reused
+    assert pool._is_healthy(sock, time.monotonic())
+    send_message(sock, get("a"), pool.codec)
+    recv_message(sock, pool.codec)
+    time.sleep(0.05)
+    # The worker hung up, so the idle socket reads EOF.
+    assert not pool._is_healthy(sock, time.monotonic())
+    assert not pool._is_healthy(sock, time.monotonic() - 120)
+    pool.discard("node1", sock)
+
+
+def test_checkout_skips_a_closed_idle_socket(worker):
+    w = worker(per_connection=1)
+    pool = pool_for(w)
+    assert pool.request("node1", get("a"))["value"] == "a"
+    time.sleep(0.05)
+    sock, reused = pool.acquire("node1")
+    assert not reused
+    pool.release("node1", sock)
+
+
+def test_pool_limits_open_connections_per_node(worker):
+    w = worker()
+    pool = pool_for(w, max_size=1, checkout_timeout=0.05)
+    sock, _ = pool.acquire("node1")
+    with pytest.raises(PoolExhausted):
+        pool.acquire("node1")
+    pool.release("node1", sock)
+    again, reused = pool.acquire("node1")
+    assert reused and again is sock
+    pool.discard("node1", again)
+    _, reused = pool.acquire("node1")
+    assert not reused
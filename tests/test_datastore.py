@@ -0,0 +1,90 @@
+# test_datastore.py
+
+import time
+import pytest
+from datastore import DataStore
+
+
+def test_seed_data_is_version_zero():
+    store = DataStore()
+    assert store.get("hello") == "world"
+    assert store.version("hello") == 0
+
+
+def test_older_write_is_ignored():
+    store = DataStore()
+    assert store.set("k", "new", version=5)
+    assert not store.set("k", "old", version=4)
+    assert (store.get("k"), store.version("k")) == ("new", 5)
+
+
+def test_older_delete_is_ignored():
+    store = DataStore()
+    store.set("k", "v", version=5)
+    assert not store.delete("k", version=4)
+    assert store.get("k") == "v"
+
+
+def test_delete_tombstone_blocks_older_writes():
+    store = DataStore()
+    store.set("k", "v", version=5)
+    assert store.delete("k", version=6)
+    assert not store.set("k", "late", version=5)
+    assert store.get("k") is None
+    assert store.set("k", "again", version=7)
+    assert store.get("k") == "again"
+
+
+def test_tombstones_are_collected():
+    store = DataStore()
+    store.delete("k", version=6)
+    store._collect(("k", 6))
+    assert store.tombstones == {}
+    assert store.set("k", "v", version=1)
+
+
+@pytest.fixture
+def server(primary):
+    # A primary whose replicas start empty, so every read falls back to the
+    # DataStore.
+    return primary({"node1": 0, "node2": 0})
+
+
+def refills(server, key):
+    time.sleep(0.05)
+    return [message for _, message in server.pool.sent
+            if message["action"] == "SET" and message.get("key") == key]
+
+
+def test_smart_client_delete_is_not_revived_by_the_fallback(server):
+    # The key was set through the primary, then set and deleted by a smart
+    # client; every replica has since lost it.
+    server.handle_request({"action": "SET", "key": "k", "value": "old"})
+    version = server.clock.now()
+    server.handle_request({"action": "SET", "key": "k", "value": "new", "version": version + 1,
+                           "datastore_only": True})
+    assert server.datastore.get("k") == "new"
+    server.handle_request({"action": "DELETE", "key": "k", "version": version + 2, "datastore_only": True})
+    time.sleep(0.05)
+    for data in server.pool.data.values():
+        data.clear()
+    server.pool.sent.clear()
+    assert server.handle_request({"action": "GET", "key": "k"}) == {"status": "MISS"}
+    assert refills(server, "k") == []
+
+
+def test_smart_client_writes_reach_the_datastore(server):
+    server.handle_request({"action": "MSET", "items": {"a": "1", "b": "2"}, "version": 50,
+                           "datastore_only": True})
+    assert server.datastore.version("a") == 50
+    assert server.pool.sent == []
+    # A later primary write orders after the client's version.
+    server.handle_request({"action": "SET", "key": "a", "value": "3"})
+    assert server.datastore.version("a") > 50
+
+
+def test_fallback_refills_with_the_datastore_version(server):
+    server.datastore.set("k", "v", version=77)
+    assert server.handle_request({"action": "GET", "key": "k"}) == {"status": "OK", "value": "v"}
+    writes = refills(server, "k")
+    assert writes and all(message["version"] == 77 for message in writes)
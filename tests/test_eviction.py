@@ -0,0 +1,156 @@
+# test_eviction.py
+
+import pytest
+from eviction import make_cache, POLICIES, ARCCache, ClockCache, TinyLFUCache, CountMinSketch
+
+
+@pytest.mark.parametrize("policy", sorted(POLICIES))
+def test_budget_is_respected(policy):
+    evicted = []
+    cache = make_cache(policy, 100, sizer=lambda key, value: len(value), on_evict=lambda k, v: evicted.append(k))
+    for i in range(200):
+        assert cache.put(f"k{i}", "x" * (i % 7 + 1))
+        assert cache.used == sum(len(cache[k]) for k in cache.keys()) <= 100
+    assert cache.evictions == len(evicted) == 200 - len(cache)
+    assert not cache.put("huge", "x" * 101)
+    assert "huge" not in cache
+    key = cache.keys()[0]
+    assert cache.pop(key) == "x" * (int(key[1:]) % 7 + 1)
+    assert cache.pop(key) is None
+    assert cache.used == sum(len(cache[k]) for k in cache.keys())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        make_cache("fifo", 10)
+
+
+def test_lru_hit_refreshes_recency():
+    cache = make_cache("lru", 3)
+    for key in "abc":
+        cache.put(key, key)
+    cache.get("a")
+    cache.put("d", "d")
+    assert sorted(cache.keys()) == ["a", "c", "d"]
+
+
+def test_clock_gives_referenced_entries_a_second_chance():
+    cache = ClockCache(3)
+    for key in "abc":
+        cache.put(key, key)
+    cache.get("a")
+    cache.put("d", "d")
+    # The hand clears a's bit and sends it round again, then evicts b.
+    assert sorted(cache.keys()) == ["a", "c", "d"]
+    assert cache.referenced["a"] is False
+    cache.put("e", "e")
+    assert sorted(cache.keys()) == ["a", "d", "e"]
+
+
+def test_arc_promotes_repeat_hits_to_t2():
+    cache = ARCCache(4)
+    for key in "abc":
+        cache.put(key, key)
+    cache.get("a")
+    assert list(cache.t1) == ["b", "c"] and list(cache.t2) == ["a"]
+    assert cache.t1_bytes == 2
+
+
+def test_arc_ghost_hits_adapt_the_target():
+    cache = ARCCache(4)
+    for key in "abcd":
+        cache.put(key, key)
+    cache.get("a")
+    cache.put("e", "e")
+    # b was the oldest entry in T1, so it is remembered in B1.
+    assert "b" not in cache and list(cache.b1) == ["b"]
+    cache.put("b", "b")
+    # Re-inserting a B1 ghost grows T1's target and lands in T2.
+    assert cache.p == 1
+    assert "b" in cache.t2 and "b" not in cache.b1
+    assert "c" in cache.b1 and "c" not in cache
+
+    cache = ARCCache(2)
+    cache.put("a", "a")
+    cache.get("a")
+    cache.put("b", "b")
+    cache.get("b")
+    cache.put("c", "c")
+    assert "c" not in cache and list(cache.b1) == ["c"]
+    cache.put("c", "c")
+    assert cache.p == 1 and list(cache.t2) == ["b", "c"]
+    # T1 is empty, so T2's oldest entry goes to B2; a B2 ghost hit shrinks p.
+    assert list(cache.b2) == ["a"]
+    cache.put("a", "a")
+    assert cache.p == 0 and list(cache.t2) == ["c", "a"] and list(cache.b2) == ["b"]
+
+
+def test_arc_scan_does_not_flush_the_hot_set():
+    cache = ARCCache(10)
+    hot = [f"hot{i}" for i in range(5)]
+    for key in hot:
+        cache.put(key, key)
+        cache.get(key)
+    for i in range(100):
+        cache.put(f"scan{i}", i)
+    assert all(key in cache for key in hot)
+    assert len(cache.b1) + len(cache.b2) <= len(cache)
+
+
+def test_tinylfu_rejects_cold_candidates():
+    evicted = []
+    cache = TinyLFUCache(10, on_evict=lambda k, v: evicted.append(k))
+    for i in range(10):
+        cache.put(f"k{i}", i)
+    assert list(cache.window) == ["k9"] and len(cache.probation) == 9
+    for _ in range(5):
+        cache.get("warm")
+    cache.put("warm", "w")
+    # k9 and the probation victim k0 were each seen once: k9 loses the tie.
+    assert evicted == ["k9"]
+    cache.put("x", "x")
+    # warm has been seen six times, so it displaces k0 from the main space.
+    assert evicted == ["k9", "k0"]
+    assert "warm" in cache.probation
+
+
+def test_tinylfu_scan_does_not_flush_the_hot_set():
+    # A wide sketch keeps a scan key from colliding with a hot key in every
+    # row, which would legitimately admit it.
+    cache = TinyLFUCache(20, sketch_width=1 << 16)
+    hot = [f"hot{i}" for i in range(15)]
+    for key in hot:
+        cache.put(key, key)
+    for _ in range(3):
+        for key in hot:
+            cache.get(key)
+    for i in range(200):
+        cache.put(f"scan{i}", i)
+    assert all(key in cache for key in hot)
+    assert cache.protected_bytes <= cache.protected_cap
+
+
+def test_count_min_sketch_counts_and_caps():
+    sketch = CountMinSketch(100)
+    assert sketch.mask == 127
+    for i in range(50):
+        for _ in range(i % 10):
+            sketch.increment(f"k{i}")
+    assert all(sketch.estimate(f"k{i}") >= i % 10 for i in range(50))
+    for _ in range(20):
+        sketch.increment("hot")
+    assert sketch.estimate("hot") == 15
+
+
+def test_count_min_sketch_ages():
+    sketch = CountMinSketch(16)
+    for _ in range(10):
+        sketch.increment("a")
+    assert sketch.estimate("a") == 10
+    sketch.reset()
+    assert sketch.estimate("a") == 5 and sketch.additions == 5
+    # Every sample_size increments the counters halve on their own.
+    for _ in range(sketch.sample_size - sketch.additions):
+        sketch.increment("b")
+    assert sketch.additions == sketch.sample_size // 2
+    assert max(sketch.table) <= 7
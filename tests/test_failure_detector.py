@@ -0,0 +1,67 @@
+# test_failure_detector.py
+
+import math
+from failure_detector import PhiAccrualDetector
+
+
+def detector_with_history(intervals, **kwargs):
+    # Feeds heartbeats at fixed timestamps so phi is computed from a known
+    # history instead of wall-clock timing.
+    detector = PhiAccrualDetector(threshold=8, expected_interval=1.0, **kwargs)
+    now = 0.0
+    detector.heartbeat("node1", now)
+    for interval in intervals:
+        now += interval
+        detector.heartbeat("node1", now)
+    return detector, now
+
+
+def test_unknown_node_is_unavailable():
+    detector = PhiAccrualDetector()
+    assert detector.phi("node1") == math.inf
+    assert not detector.is_available("node1")
+    assert detector.last_heartbeat("node1") is None
+
+
+def test_phi_grows_with_silence():
+    detector, last = detector_with_history([1.0] * 20)
+    values = [detector.phi("node1", last + elapsed) for elapsed in (0.0, 1.0, 2.0, 3.0, 5.0)]
+    assert values == sorted(values)
+    assert values[0] < 0.1
+    # A heartbeat exactly one mean interval late is a coin flip.
+    assert abs(values[1] - math.log10(2)) < 1e-9
+
+
+def test_threshold_crossing():
+    detector, last = detector_with_history([1.0] * 20)
+    assert detector.is_available("node1", last + 1.5)
+    assert not detector.is_available("node1", last + 10.0)
+    detector.heartbeat("node1", last + 10.0)
+    assert detector.is_available("node1", last + 10.5)
+
+
+def test_jittery_node_is_given_more_slack():
+    steady, steady_last = detector_with_history([1.0] * 20, min_std=0.05)
+    jittery, jittery_last = detector_with_history([0.2, 1.8] * 10, min_std=0.05)
+    assert not steady.is_available("node1", steady_last + 2.0)
+    assert jittery.is_available("node1", jittery_last + 2.0)
+
+
+def test_bootstrap_uses_the_expected_interval():
+    # After a single heartbeat the history holds only the configured interval,
+    # so the node is not suspected the moment it has joined.
+    detector = PhiAccrualDetector(threshold=8, expected_interval=1.0)
+    detector.heartbeat("node1", 100.0)
+    assert detector.is_available("node1", 101.0)
+    assert not detector.is_available("node1", 110.0)
+
+
+def test_window_drops_old_intervals():
+    detector, last = detector_with_history([10.0] * 5 + [1.0] * 4, window=4)
+    assert not detector.is_available("node1", last + 8.0)
+
+
+def test_forget():
+    detector, last = detector_with_history([1.0] * 3)
+    detector.forget("node1")
+    assert detector.phi("node1", last) == math.inf
@@ -0,0 +1,118 @@
+# test_framing.py
+
+import asyncio
+import socket
+import threading
+import pytest
+from framing import (send_frame, recv_frame, send_message, recv_message, read_frame, write_frame,
+                     FrameError, HEADER)
+from codec import BinaryCodec
+
+
+def trickle(sock, data, chunk=1):
+    # Sends data a few bytes at a time so the reader sees partial reads.
+    def run():
+        for i in range(0, len(data), chunk):
+            sock.sendall(data[i:i + chunk])
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_frame_survives_byte_by_byte_delivery():
+    a, b = socket.socketpair()
+    with a, b:
+        payload = bytes(range(256)) * 4
+        thread = trickle(a, HEADER.pack(len(payload)) + payload)
+        assert bytes(recv_frame(b)) == payload
+        thread.join()
+
+
+def test_frames_back_to_back_in_one_write():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(HEADER.pack(3) + b"one" + HEADER.pack(0) + HEADER.pack(3) + b"two")
+        assert bytes(recv_frame(b)) == b"one"
+        assert bytes(recv_frame(b)) == b""
+        assert bytes(recv_frame(b)) == b"two"
+
+
+def test_large_message_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        message = {"action": "SET", "key": "big", "value": "x" * 1_000_000}
+        thread = threading.Thread(target=send_message, args=(a, message, BinaryCodec()))
+        thread.start()
+        assert recv_message(b, BinaryCodec()) == message
+        thread.join()
+
+
+def test_clean_close_returns_none():
+    a, b = socket.socketpair()
+    a.close()
+    with b:
+        assert recv_frame(b) is None
+
+
+def test_close_mid_frame_raises():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(HEADER.pack(10) + b"abc")
+        a.close()
+        with pytest.raises(ConnectionError):
+            recv_frame(b)
+
+
+def test_close_mid_header_raises():
+    a, b = socket.socketpair()
+    with b:
+        a.sendall(HEADER.pack(10)[:2])
+        a.close()
+        with pytest.raises(ConnectionError):
+            recv_frame(b)
+
+
+def test_oversized_frames_are_refused():
+    a, b = socket.socketpair()
+    with a, b:
+        with pytest.raises(FrameError):
+            send_frame(a, b"x" * 11, max_size=10)
+        a.sendall(HEADER.pack(11))
+        with pytest.raises(FrameError):
+            recv_frame(b, max_size=10)
+
+
+def test_async_frame_from_partial_reads():
+    async def run():
+        reader = asyncio.StreamReader()
+        payload = b"hello, world"
+        data = HEADER.pack(len(payload)) + payload
+        task = asyncio.ensure_future(read_frame(reader))
+        for i in range(len(data)):
+            reader.feed_data(data[i:i + 1])
+            await asyncio.sleep(0)
+        assert await task == payload
+
+        reader = asyncio.StreamReader()
+        reader.feed_data(HEADER.pack(5) + b"ab")
+        reader.feed_eof()
+        with pytest.raises(ConnectionError):
+            await read_frame(reader)
+
+        reader = asyncio.StreamReader()
+        reader.feed_eof()
+        assert await read_frame(reader) is None
+    asyncio.run(run())
+
+
+def test_write_frame_matches_send_frame():
+    class Writer:
+        def __init__(self):
+            self.data = b""
+
+        def write(self, data):
+            self.data += data
+
+    writer = Writer()
+    write_frame(writer, b"payload")
+    assert writer.data == HEADER.pack(7) + b"payload"
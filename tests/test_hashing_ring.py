@@ -0,0 +1,135 @@
+# test_hashing_ring.py
+
+import bisect
+import pytest
+import hashing_ring
+from hashing_ring import ConsistentHashRing, moved_ranges, ring_hash, in_ranges
+
+NODES = ["node1", "node2", "node3"]
+KEYS = [f"key:{i}" for i in range(3000)]
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def lookups(request, monkeypatch):
+    # Runs a test once with numpy's vectorized search and once with the
+    # bisect fallback used when numpy is not installed.
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(hashing_ring, "np", None)
+    return request.param
+
+
+def preference_list(ring, key, count):
+    # Reference walk: the distinct owners of the tokens clockwise from the
+    # key's hash, found by brute force over every vnode.
+    owners = sorted((ring_hash(f"{node}-vn{i}"), node) for node in ring.nodes for i in range(ring.vnodes))
+    start = bisect.bisect([token for token, _ in owners], ring_hash(key))
+    replicas = []
+    for i in range(len(owners)):
+        node = owners[(start + i) % len(owners)][1]
+        if node not in replicas:
+            replicas.append(node)
+        if len(replicas) == count:
+            break
+    return replicas
+
+
+def test_get_nodes_matches_get_node(lookups):
+    ring = ConsistentHashRing(NODES, vnodes=50)
+    assert ring.get_nodes(KEYS) == [ring.get_node(key) for key in KEYS]
+
+
+def test_replicas_follow_the_ring_order():
+    ring = ConsistentHashRing(NODES, vnodes=50)
+    for key in KEYS[:300]:
+        for count in (1, 2, 3):
+            assert ring.get_replicas(key, count) == preference_list(ring, key, count)
+        assert ring.get_replicas(key, 1) == [ring.get_node(key)]
+    assert ring.get_replicas("k", 5) == preference_list(ring, "k", 3)
+
+
+@pytest.mark.parametrize("rf", [1, 2, 3])
+def test_precomputed_lists_match_the_ring_walk(rf):
+    # Counts up to the replication factor come from the per-token table;
+    # deeper counts walk the ring. Both must give the same clockwise order.
+    ring = ConsistentHashRing(NODES + ["node4"], vnodes=50, replication_factor=rf)
+    for key in KEYS[:300]:
+        for count in range(1, 5):
+            assert ring.get_replicas(key, count) == preference_list(ring, key, count)
+
+
+def test_preference_lists_follow_topology_changes():
+    ring = ConsistentHashRing(NODES, vnodes=50, replication_factor=2)
+    ring.add_node("node4")
+    assert all(ring.get_replicas(key, 2) == preference_list(ring, key, 2) for key in KEYS[:300])
+    ring.remove_node("node1")
+    assert all(ring.get_replicas(key, 2) == preference_list(ring, key, 2) for key in KEYS[:300])
+    assert ConsistentHashRing(["node1"], replication_factor=3).get_replicas("k", 3) == ["node1"]
+
+
+def test_add_and_remove_match_a_fresh_ring():
+    ring = ConsistentHashRing(NODES, vnodes=50)
+    ring.add_node("node4")
+    fresh = ConsistentHashRing(NODES + ["node4"], vnodes=50)
+    assert list(ring.tokens) == list(fresh.tokens)
+    assert all(ring.get_replicas(key, 2) == fresh.get_replicas(key, 2) for key in KEYS)
+    ring.remove_node("node4")
+    fresh = ConsistentHashRing(NODES, vnodes=50)
+    assert all(ring.get_replicas(key, 2) == fresh.get_replicas(key, 2) for key in KEYS)
+
+
+def test_join_only_moves_keys_to_the_new_node():
+    old = ConsistentHashRing(NODES, vnodes=50)
+    new = ConsistentHashRing(NODES + ["node4"], vnodes=50)
+    for key in KEYS:
+        before, after = old.get_node(key), new.get_node(key)
+        assert after == before or after == "node4"
+
+
+def test_empty_ring(lookups):
+    ring = ConsistentHashRing([])
+    assert ring.get_node("k") is None
+    assert ring.get_nodes(["a", "b"]) == [None, None]
+    assert ring.get_replicas("k", 2) == []
+
+
+@pytest.fixture(params=[1, 2, 3])
+def rings(request):
+    rf = request.param
+    old = ConsistentHashRing(NODES, vnodes=50, replication_factor=rf)
+    new = ConsistentHashRing(NODES + ["node4"], vnodes=50, replication_factor=rf)
+    return old, new, rf
+
+
+def test_moved_ranges_cover_exactly_the_joining_nodes_keys(rings):
+    old, new, rf = rings
+    moved = moved_ranges(old, new, "node4")
+    for key in KEYS:
+        h = ring_hash(key)
+        sources = [source for source, ranges in moved.items() if in_ranges(h, ranges)]
+        if "node4" in new.get_replicas(key, rf):
+            # Exactly one source streams the key, and it held the key before.
+            assert len(sources) == 1
+            assert sources[0] in old.get_replicas(key, rf)
+        else:
+            assert sources == []
+
+
+def test_moved_ranges_merge_adjacent_ranges(rings):
+    old, new, _ = rings
+    for source, ranges in moved_ranges(old, new, "node4").items():
+        assert source != "node4"
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            assert end != start
+
+
+def test_replicas_for_hashes_match_get_replicas(lookups):
+    ring = ConsistentHashRing(NODES + ["node4"], vnodes=50, replication_factor=3)
+    hashes = [ring_hash(key) for key in KEYS]
+    for count in (None, 1, 2, 3):
+        expected = [ring.get_replicas(key, count or 3) for key in KEYS]
+        assert ring.replicas_for_hashes(hashes, count) == expected
+    assert [ring.replicas_for_hash(h) for h in hashes[:100]] == ring.replicas_for_hashes(hashes[:100])
+    assert ConsistentHashRing([]).replicas_for_hashes(hashes[:3]) == [[], [], []]
+
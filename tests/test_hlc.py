@@ -0,0 +1,62 @@
+# test_hlc.py
+
+from hlc import HybridLogicalClock, LOGICAL_BITS, physical_ms
+
+
+class FakeTime:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_versions_strictly_increase_within_a_millisecond():
+    clock = HybridLogicalClock(FakeTime(1000.0))
+    versions = [clock.now() for _ in range(100)]
+    assert versions == sorted(set(versions))
+    assert all(physical_ms(v) == 1_000_000 for v in versions)
+
+
+def test_versions_follow_wall_clock():
+    time = FakeTime(1000.0)
+    clock = HybridLogicalClock(time)
+    first = clock.now()
+    time.now = 1000.5
+    second = clock.now()
+    assert second == 1_000_500 << LOGICAL_BITS
+    assert second > first
+
+
+def test_clock_stepping_back_never_reorders():
+    time = FakeTime(1000.0)
+    clock = HybridLogicalClock(time)
+    before = clock.now()
+    time.now = 990.0
+    after = clock.now()
+    assert after > before
+    assert physical_ms(after) == physical_ms(before)
+
+
+def test_logical_overflow_carries_into_physical():
+    clock = HybridLogicalClock(FakeTime(1000.0))
+    clock.last = (1_000_000 << LOGICAL_BITS) | ((1 << LOGICAL_BITS) - 1)
+    assert clock.now() == 1_000_001 << LOGICAL_BITS
+
+
+def test_update_orders_after_remote_versions():
+    # A node restarted on a lagging clock still issues versions above the
+    # data the cluster holds.
+    behind = HybridLogicalClock(FakeTime(1000.0))
+    ahead = HybridLogicalClock(FakeTime(1002.0))
+    remote = ahead.now()
+    assert behind.update(remote)
+    assert behind.now() > remote
+
+
+def test_update_rejects_versions_too_far_ahead():
+    clock = HybridLogicalClock(FakeTime(1000.0), max_drift=5)
+    far = HybridLogicalClock(FakeTime(1010.0)).now()
+    assert not clock.update(far)
+    assert clock.now() < far
+    assert clock.update(None) and clock.update(0)
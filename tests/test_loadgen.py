@@ -0,0 +1,56 @@
+# test_loadgen.py
+
+import argparse
+import pytest
+from loadgen import KeyChooser, parse_mix, parse_size, summarize
+
+
+def test_parse_mix_normalizes_to_cumulative_weights():
+    mix = parse_mix("get=8, set=1.5,delete=0.5")
+    assert [action for action, _ in mix] == ["GET", "SET", "DELETE"]
+    assert [round(weight, 6) for _, weight in mix] == [0.8, 0.95, 1.0]
+    assert parse_mix("set=1") == [("SET", 1.0)]
+
+
+@pytest.mark.parametrize("text", ["get=1,scan=1", "get=0", "get=0,set=0"])
+def test_parse_mix_rejects_bad_input(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix(text)
+
+
+def test_parse_size():
+    assert parse_size("100") == (100, 100)
+    assert parse_size("64-1024") == (64, 1024)
+
+
+def test_summarize_reports_exact_percentiles_in_ms():
+    samples = [i / 1000 for i in range(1, 1001)]
+    summary = summarize(list(reversed(samples)))
+    assert summary == {"count": 1000, "mean": 500.5, "p50": 501.0, "p90": 901.0, "p99": 991.0,
+                       "p999": 1000.0, "max": 1000.0}
+    assert summarize([0.002]) == {"count": 1, "mean": 2.0, "p50": 2.0, "p90": 2.0, "p99": 2.0,
+                                  "p999": 2.0, "max": 2.0}
+    assert summarize([]) is None
+
+
+@pytest.mark.parametrize("dist", ["uniform", "zipf", "hotspot"])
+def test_key_chooser_stays_in_range(dist):
+    chooser = KeyChooser(dist, 1000, seed=1)
+    ranks = [chooser.next() for _ in range(5000)]
+    assert min(ranks) >= 0 and max(ranks) < 1000
+    # The same seed replays the same keys.
+    again = KeyChooser(dist, 1000, seed=1)
+    assert [again.next() for _ in range(5000)] == ranks
+
+
+def test_zipf_favours_low_ranks():
+    chooser = KeyChooser("zipf", 1000, seed=3)
+    ranks = [chooser.next() for _ in range(10000)]
+    assert ranks.count(0) > ranks.count(1) > ranks.count(100)
+
+
+def test_hotspot_sends_most_draws_to_the_hot_keys():
+    chooser = KeyChooser("hotspot", 1000, seed=2, hot_fraction=0.1, hot_weight=0.9)
+    ranks = [chooser.next() for _ in range(10000)]
+    hot = sum(rank < 100 for rank in ranks) / len(ranks)
+    assert 0.88 < hot < 0.92
@@ -0,0 +1,92 @@
+# test_log.py
+
+import threading
+import log
+from log import LogWriter, format_record, get_logger, INFO, WARNING
+
+
+class Collector:
+    # Stands in for the LogWriter: keeps submitted records in a list.
+    def __init__(self):
+        self.records = []
+
+    def submit(self, record):
+        self.records.append(record)
+
+
+def install(monkeypatch, level=INFO):
+    collector = Collector()
+    monkeypatch.setitem(log._state, "writer", collector)
+    monkeypatch.setitem(log._state, "level", level)
+    return collector
+
+
+def test_format_record():
+    line = format_record((0.5, WARNING, "node1", "Evicted %s after %d ms", ("k", 12)))
+    assert line.endswith(" WARNING [node1] Evicted k after 12 ms\n")
+    assert format_record((0, INFO, "x", "bad %d", ("arg",))).endswith("bad %d ('arg',)\n")
+
+
+def test_level_filters_before_formatting(monkeypatch):
+    collector = install(monkeypatch, level=WARNING)
+    logger = get_logger("test")
+    logger.info("hidden %s", "x")
+    logger.warning("shown %s", "y")
+    assert [record[3] for record in collector.records] == ["shown %s"]
+    assert collector.records[0][4] == ("y",)
+    assert get_logger("test") is logger
+
+
+def test_sampling_keeps_a_fraction(monkeypatch):
+    collector = install(monkeypatch)
+    rolls = iter([0.05, 0.5, 0.09, 0.95])
+    monkeypatch.setattr(log.random, "random", lambda: next(rolls))
+    logger = get_logger("test")
+    for i in range(4):
+        logger.info("request %d", i, sample=0.1)
+    assert [record[4] for record in collector.records] == [(0,), (2,)]
+    logger.info("always")
+    assert len(collector.records) == 3
+
+
+def test_rotation_keeps_the_configured_backups(tmp_path):
+    path = tmp_path / "node.log"
+    writer = LogWriter(str(path), max_bytes=200, backups=2, batch=1)
+    for i in range(40):
+        writer.submit((0, INFO, "test", "line %02d", (i,)))
+    assert writer.flush(timeout=5)
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["node.log", "node.log.1", "node.log.2"]
+    assert all(p.stat().st_size <= 200 for p in tmp_path.iterdir())
+    newest = path.read_text().splitlines()
+    assert newest[-1].endswith("line 39")
+    older = (tmp_path / "node.log.1").read_text().splitlines()
+    assert int(older[-1][-2:]) == int(newest[0][-2:]) - 1
+    assert writer.stats() == {"dropped": 0, "written": 40, "queued": 0}
+
+
+def test_full_queue_drops_and_reports(tmp_path, monkeypatch):
+    path = tmp_path / "node.log"
+    release = threading.Event()
+    writing = threading.Event()
+    original = LogWriter.write
+
+    def blocked(self, text):
+        writing.set()
+        release.wait(5)
+        original(self, text)
+
+    monkeypatch.setattr(LogWriter, "write", blocked)
+    writer = LogWriter(str(path), queue_size=3, batch=1)
+    writer.submit((0, INFO, "test", "first", ()))
+    assert writing.wait(5)
+    # The writer thread is stuck on "first": three records fit in the
+    # queue and the other five are dropped without blocking.
+    for i in range(8):
+        writer.submit((0, INFO, "test", "queued %d", (i,)))
+    assert writer.stats()["dropped"] == 5
+    release.set()
+    assert writer.flush(timeout=5)
+    lines = path.read_text().splitlines()
+    assert sum("Dropped 5 messages" in line for line in lines) == 1
+    assert sum("queued" in line for line in lines) == 3
@@ -0,0 +1,101 @@
+# test_merkle.py
+
+import random
+from hashing_ring import ring_hash
+from merkle import (MerkleTree, ARITY, DEPTH, LEAF_SHIFT, RING_SIZE, TOMBSTONE_SALT, coverage,
+                    range_intervals)
+
+KEYS = [f"key:{i}" for i in range(2000)]
+
+
+def tree_of(versions, salt=0):
+    tree = MerkleTree(salt)
+    for key, version in versions.items():
+        tree.add(key, version)
+    return tree
+
+
+def differing_leaves(a, b, intervals=None):
+    # The top-down comparison anti-entropy runs over MERKLE_HASHES: only
+    # nodes whose hashes differ are expanded.
+    level, nodes = 0, [0]
+    while True:
+        differing = [node for node in nodes
+                     if a.node_hash(level, node, intervals) != b.node_hash(level, node, intervals)
+                     or a.node_hash(level, node, intervals) is None]
+        if level == DEPTH or not differing:
+            return set(differing) if level == DEPTH else set()
+        level += 1
+        nodes = [child for node in differing for child in range(node * ARITY, (node + 1) * ARITY)
+                 if intervals is None or coverage(level, child, intervals)]
+
+
+def leaf(key):
+    return ring_hash(key) >> LEAF_SHIFT
+
+
+def test_identical_trees_have_no_diff():
+    versions = {key: 1 for key in KEYS}
+    assert differing_leaves(tree_of(versions), tree_of(versions)) == set()
+
+
+def test_diff_finds_exactly_the_divergent_leaves():
+    versions = {key: 1 for key in KEYS}
+    a = tree_of(versions)
+    b = tree_of(versions)
+    b.add(KEYS[3], 2)            # newer version
+    b.discard(KEYS[10])          # missing key
+    b.add("only-on-b", 1)        # extra key
+    expected = {leaf(KEYS[3]), leaf(KEYS[10]), leaf("only-on-b")}
+    assert differing_leaves(a, b) == expected
+    found = {key for key in set(a.entries) | set(b.entries)
+             if leaf(key) in expected and a.entries.get(key, (0, None))[1] != b.entries.get(key, (0, None))[1]}
+    assert found == {KEYS[3], KEYS[10], "only-on-b"}
+
+
+def test_diff_restricted_to_ranges():
+    versions = {key: 1 for key in KEYS}
+    a = tree_of(versions)
+    b = tree_of(versions)
+    inside, outside = KEYS[0], KEYS[1]
+    h = ring_hash(inside)
+    intervals = range_intervals([(h, (h + 1) % RING_SIZE)])
+    if ring_hash(outside) == h:
+        outside = KEYS[2]
+    b.add(inside, 2)
+    b.add(outside, 2)
+    assert differing_leaves(a, b, intervals) == {leaf(inside)}
+
+
+def test_hash_does_not_depend_on_insertion_order():
+    versions = {key: i % 7 for i, key in enumerate(KEYS)}
+    shuffled = list(versions.items())
+    random.Random(1).shuffle(shuffled)
+    assert tree_of(versions).levels == tree_of(dict(shuffled)).levels
+
+
+def test_removing_every_key_empties_the_tree():
+    tree = tree_of({key: 3 for key in KEYS})
+    for key in KEYS:
+        tree.discard(key)
+    assert all(not any(nodes) for nodes in tree.levels)
+    assert tree.entries == {} and tree.leaves == {}
+
+
+def test_tombstones_do_not_cancel_live_entries():
+    # Live and tombstone trees are XOR-ed together when replicas compare:
+    # a key deleted on one replica and live at the same version on the
+    # other must still differ.
+    live = tree_of({"k": 5})
+    dead = tree_of({"k": 5}, TOMBSTONE_SALT)
+    assert live.levels[0][0] ^ dead.levels[0][0] != 0
+    assert live.levels[0][0] != dead.levels[0][0]
+
+
+def test_leaf_versions_lists_keys_in_ranges():
+    tree = tree_of({key: i for i, key in enumerate(KEYS)})
+    everything = range_intervals([(0, 0)])
+    key = KEYS[5]
+    versions = tree.leaf_versions([leaf(key)], everything)
+    assert versions[key] == 5
+    assert all(leaf(k) == leaf(key) for k in versions)
@@ -0,0 +1,77 @@
+# test_metrics.py
+
+import math
+from metrics import Metrics, Histogram, LATENCY_BUCKETS, merge_snapshots, percentile, prometheus_text
+
+
+def sample(hits, actions):
+    metrics = Metrics()
+    metrics.incr("hits", hits)
+    for action, seconds in actions:
+        metrics.record(action, seconds, error=seconds > 1)
+    return metrics.snapshot({"evictions": 2}, bytes_stored=100)
+
+
+def test_snapshot_shapes():
+    metrics = Metrics()
+    metrics.incr("hits")
+    metrics.incr("hits", 3)
+    metrics.record("GET", 0.002)
+    metrics.record("GET", 2.0, error=True)
+    metrics.gauge_add("open_connections", 1)
+    snapshot = metrics.snapshot({"evictions": 5}, entries=7)
+    # Plain counters are numbers; only the per-action ones are keyed.
+    assert snapshot["counters"] == {"hits": 4, "requests": {"GET": 2}, "request_errors": {"GET": 1},
+                                    "evictions": 5}
+    assert snapshot["gauges"] == {"open_connections": 1, "entries": 7}
+    assert sum(snapshot["latency"]["GET"]["counts"]) == 2
+
+
+def test_track_records_status_errors():
+    metrics = Metrics()
+    handler = metrics.track(lambda request: {"status": "ERROR" if request.get("bad") else "OK"})
+    handler({"action": "SET"})
+    handler({"action": "SET", "bad": True})
+    counters = metrics.snapshot()["counters"]
+    assert counters["requests"] == {"SET": 2} and counters["request_errors"] == {"SET": 1}
+
+
+def test_histogram_and_percentile():
+    histogram = Histogram()
+    for value in (0.00005, 0.001, 0.001, 0.02, 50.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["counts"][0] == 1 and snapshot["counts"][-1] == 1
+    assert percentile(snapshot, 50) == 0.001
+    assert percentile(snapshot, 80) == 0.025
+    assert percentile(snapshot, 100) == math.inf
+    assert percentile(Histogram().snapshot(), 50) is None
+
+
+def test_merge_snapshots_sums_every_series():
+    merged = merge_snapshots([sample(1, [("GET", 0.001)]), sample(2, [("GET", 0.001), ("SET", 5.0)])])
+    assert merged["counters"]["hits"] == 3 and merged["counters"]["evictions"] == 4
+    assert merged["counters"]["requests"] == {"GET": 2, "SET": 1}
+    assert merged["counters"]["request_errors"] == {"SET": 1}
+    assert merged["gauges"]["bytes_stored"] == 200
+    assert sum(merged["latency"]["GET"]["counts"]) == 2
+    assert merged["latency"]["SET"]["sum"] == 5.0
+
+
+def test_prometheus_text():
+    text = prometheus_text({"node1": sample(4, [("GET", 0.001)]), "node2": sample(1, [])})
+    lines = text.splitlines()
+    assert "# TYPE cache_hits_total counter" in lines
+    assert 'cache_hits_total{node="node1"} 4' in lines
+    assert 'cache_hits_total{node="node2"} 1' in lines
+    assert 'cache_requests_total{node="node1",action="GET"} 1' in lines
+    assert 'cache_bytes_stored{node="node2"} 100' in lines
+    assert 'cache_request_duration_seconds_bucket{node="node1",action="GET",le="0.001"} 1' in lines
+    assert 'cache_request_duration_seconds_bucket{node="node1",action="GET",le="+Inf"} 1' in lines
+    assert 'cache_request_duration_seconds_count{node="node1",action="GET"} 1' in lines
+    # Every sample line has a label set with a node, never an empty label.
+    samples = [line for line in lines if not line.startswith("#")]
+    assert all('{node="' in line for line in samples)
+    assert '=""' not in text
+    buckets = [line for line in samples if line.startswith("cache_request_duration_seconds_bucket")]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
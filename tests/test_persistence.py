@@ -0,0 +1,112 @@
+# test_persistence.py
+
+import os
+import time
+import pytest
+from persistence import Persistence, encode_record, iter_records
+from worker_node import WorkerNode
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def opened(path, source=lambda: [], **kwargs):
+    return Persistence(str(path), source, group_commit_delay=0, **kwargs)
+
+
+def load(path):
+    records = []
+    count, logs = opened(path).load(records.append)
+    assert count == len(records)
+    return records, logs
+
+
+def test_replay_in_write_order(tmp_path):
+    p = opened(tmp_path)
+    p.load(lambda record: None)
+    p.start()
+    p.record_set("a", ("1", 1), None)
+    p.record_set("b", ("2", 2), 123.0)
+    p.record_delete("a")
+    wait_for(lambda: p.synced_records == 3)
+    records, logs = load(tmp_path)
+    assert records == [("S", "a", "1", 1, None), ("S", "b", "2", 2, 123.0), ("D", "a")]
+    assert logs == 1
+
+
+def test_torn_or_corrupt_tail_ends_replay(tmp_path):
+    good = encode_record(("S", "a", "1", 1, None)) + encode_record(("D", "b"))
+    torn = encode_record(("S", "c", "3", 3, None))
+    with open(tmp_path / "wal.000001.log", "wb") as f:
+        f.write(good + torn[:-2])
+    assert load(tmp_path)[0] == [("S", "a", "1", 1, None), ("D", "b")]
+
+    corrupt = bytearray(torn)
+    corrupt[-1] ^= 0xFF
+    assert list(iter_records(good + bytes(corrupt) + good)) == list(iter_records(good))
+
+    # A restart never appends after the torn record.
+    p = opened(tmp_path)
+    p.load(lambda record: None)
+    p.start()
+    assert p.seq == 2 and os.path.exists(p.log_path(2))
+
+
+def test_compaction_replaces_old_logs_with_a_snapshot(tmp_path):
+    live = {}
+    source = lambda: [(key, entry, None) for key, entry in live.items()]
+    p = opened(tmp_path, source, compact_bytes=200)
+    p.load(lambda record: None)
+    p.start()
+    for i in range(20):
+        live[f"k{i}"] = (f"v{i}", i)
+        p.record_set(f"k{i}", live[f"k{i}"], None)
+    wait_for(lambda: p.synced_records == 20 and os.path.exists(p.snapshot_path()) and not p.compacting)
+    assert p.log_seqs()[0] > 1
+    del live["k0"]
+    p.record_delete("k0")
+    wait_for(lambda: p.synced_records == 21)
+
+    records, logs = load(tmp_path)
+    store = {}
+    for record in records:
+        if record[0] == "S":
+            store[record[1]] = (record[2], record[3])
+        else:
+            store.pop(record[1], None)
+    assert store == live
+    assert logs == len(p.log_seqs())
+
+
+def test_snapshot_reload_survives_apply_errors(tmp_path):
+    live = {"a": ("1", 1), "b": ("2", 2)}
+    p = opened(tmp_path, lambda: [(key, entry, None) for key, entry in live.items()])
+    p.compact(1)
+    assert load(tmp_path) == ([("S", "a", "1", 1, None), ("S", "b", "2", 2, None)], 0)
+
+    def fail(record):
+        raise KeyError(record[1])
+
+    # The mapping's views are released before it closes, so the caller sees
+    # apply's own error rather than a BufferError.
+    with pytest.raises(KeyError):
+        opened(tmp_path).load(fail)
+
+
+def test_worker_restores_from_disk(tmp_path):
+    worker = WorkerNode("node1", data_dir=str(tmp_path))
+    worker.cache.put("a", ("1", 1))
+    worker.cache.put("b", ("2", 2), ttl=60)
+    worker.cache.put("c", ("3", 3))
+    worker.cache.delete("c")
+    wait_for(lambda: worker.persistence.synced_records == 4)
+
+    restored = WorkerNode("node1", data_dir=str(tmp_path))
+    assert restored.cache.get("a") == ("1", 1)
+    assert restored.cache.get("b") == ("2", 2)
+    assert 0 < restored.cache.ttls(["b"])["b"] <= 60
+    assert restored.cache.get("c") is None
@@ -0,0 +1,96 @@
+# test_reads.py
+
+import itertools
+import time
+import pytest
+import primary_server
+
+
+@pytest.fixture
+def quorum(monkeypatch):
+    def configure(r):
+        monkeypatch.setattr(primary_server, "READ_QUORUM", r)
+    return configure
+
+
+def test_newest_reply_picks_highest_version(primary):
+    replies = [("a", {"value": "old", "version": 1}), ("b", {"value": None}),
+               ("c", {"value": "new", "version": 5}), ("d", {"value": "mid", "version": 3})]
+    server = primary({})
+    assert server.newest_reply(replies) == ("c", {"value": "new", "version": 5})
+    assert server.newest_reply([("a", {"value": None})]) == (None, None)
+
+
+@pytest.mark.parametrize("written", list(itertools.combinations("abc", 2)))
+def test_overlapping_quorums_see_the_latest_write(written, quorum, primary):
+    # N=3, W=2, R=2: W + R > N, so every read quorum includes a replica
+    # that took the write, whichever replicas answer first.
+    quorum(2)
+    nodes = ["a", "b", "c"]
+    for fast in nodes:
+        server = primary({node: 0 if node == fast else 0.05 for node in nodes})
+        for node in nodes:
+            server.pool.data[node]["k"] = ("new", 2) if node in written else ("old", 1)
+        node, reply = server.quorum_read("k", nodes)
+        assert reply["value"] == "new"
+
+
+def test_read_quorum_of_one_returns_the_fastest_reply(quorum, primary):
+    quorum(1)
+    server = primary({"a": 0.2, "b": 0})
+    server.pool.data["a"]["k"] = ("new", 2)
+    server.pool.data["b"]["k"] = ("old", 1)
+    start = time.monotonic()
+    node, reply = server.quorum_read("k", ["a", "b"])
+    assert (node, reply["value"]) == ("b", "old")
+    assert time.monotonic() - start < 0.15
+
+
+def test_quorum_read_repairs_stale_replicas(quorum, primary):
+    quorum(1)
+    server = primary({"a": 0.05, "b": 0, "c": 0})
+    server.pool.data["a"]["k"] = ("new", 2)
+    server.pool.data["b"]["k"] = ("old", 1)
+    server.quorum_read("k", ["a", "b", "c"])
+    server.repair_executor.shutdown(wait=True)
+    server.pool.executor.shutdown(wait=True)
+    assert server.pool.data["b"]["k"] == ("new", 2)
+    assert server.pool.data["c"]["k"] == ("new", 2)
+    assert server.read_repairs == 2
+
+
+def test_hedged_read_does_not_wait_for_a_slow_replica(primary):
+    server = primary({"a": 0.5, "b": 0}, hedge_delay=0.02)
+    for node in server.pool.data:
+        server.pool.data[node]["k"] = ("v", 1)
+    start = time.monotonic()
+    node, reply = server.hedged_read("k", ["a", "b"])
+    assert node == "b" and reply["value"] == "v"
+    assert time.monotonic() - start < 0.3
+
+
+def test_hedged_read_moves_on_after_a_miss(primary):
+    server = primary({"a": 0, "b": 0}, hedge_delay=1.0)
+    server.pool.data["b"]["k"] = ("v", 1)
+    start = time.monotonic()
+    assert server.hedged_read("k", ["a", "b"])[0] == "b"
+    assert time.monotonic() - start < 0.5
+
+
+def test_reads_do_not_queue_behind_the_write_fan_out(primary):
+    server = primary({"a": 0})
+    server.pool.data["a"]["k"] = ("v", 1)
+    # Every fan-out thread is busy with a slow replica write.
+    for _ in range(server.pool.executor._max_workers):
+        server.pool.executor.submit(time.sleep, 0.5)
+    start = time.monotonic()
+    assert server.hedged_read("k", ["a"])[1]["value"] == "v"
+    assert server.quorum_read("k", ["a"])[1]["value"] == "v"
+    assert time.monotonic() - start < 0.3
+
+
+def test_get_falls_back_to_the_datastore_when_replicas_miss(primary):
+    server = primary({"node1": 0, "node2": 0})
+    server.datastore.store["k"] = "v"
+    assert server.handle_request({"action": "GET", "key": "k"}) == {"status": "OK", "value": "v"}
+    assert server.handle_request({"action": "GET", "key": "nowhere"}) == {"status": "MISS"}
@@ -0,0 +1,107 @@
+# test_replicator.py
+
+import asyncio
+import time
+import replicator
+
+
+def test_quorum_of_one_does_not_wait_for_slow_replicas(workers):
+    workers({"a": 0, "b": 0.5})
+    start = time.monotonic()
+    assert replicator.replicate("k", "v", ["a", "b"], quorum=1) == 1
+    assert time.monotonic() - start < 0.4
+
+
+def test_quorum_waits_for_enough_acks(workers):
+    workers({"a": 0, "b": 0.1, "c": 0.2})
+    assert replicator.replicate("k", "v", ["a", "b", "c"], quorum=2) == 2
+    assert replicator.replicate("k", "v", ["a", "b", "c"], quorum=3) == 3
+
+
+def test_failures_and_refusals_are_not_acks(workers):
+    workers({"a": 0, "b": 0, "c": 0}, replies={"b": ConnectionError("down"), "c": {"status": "ERROR"}})
+    assert replicator.replicate("k", "v", ["a", "b", "c"], quorum=3) == 1
+
+
+def counter(name):
+    return replicator.metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_failures_and_refusals_are_counted(workers):
+    workers({"a": 0, "b": 0, "c": 0, "d": 0},
+            replies={"b": ConnectionError("down"), "c": {"status": "NOT_ADMITTED"}, "d": {"status": "ERROR"}})
+    errors, refused = counter("replication_errors"), counter("not_admitted")
+    assert replicator.replicate("k", "v", ["a", "b", "c", "d"], quorum=4) == 1
+    time.sleep(0.05)
+    assert counter("replication_errors") - errors == 2
+    assert counter("not_admitted") - refused == 1
+
+
+def test_quorum_gives_up_at_the_timeout(workers):
+    workers({"a": 0.5, "b": 0.5})
+    start = time.monotonic()
+    assert replicator.replicate("k", "v", ["a", "b"], quorum=1, timeout=0.1) == 0
+    assert time.monotonic() - start < 0.4
+
+
+def test_slow_writes_finish_in_the_background(workers):
+    fake = workers({"a": 0, "b": 0.1})
+    assert replicator.replicate("k", "v", ["a", "b"], quorum=1) == 1
+    time.sleep(0.2)
+    assert fake.data["b"] == {"k": ("v", 0)}
+
+
+def test_async_quorum_matches_threaded(workers):
+    fake = workers({"a": 0, "b": 0.2, "c": 0}, replies={"c": {"status": "ERROR"}})
+
+    async def run():
+        start = time.monotonic()
+        acks = await replicator.replicate_async("k", "v", ["a", "b", "c"], quorum=1)
+        elapsed = time.monotonic() - start
+        # The slower write keeps running after the quorum was met.
+        await asyncio.sleep(0.3)
+        return acks, elapsed
+
+    acks, elapsed = asyncio.run(run())
+    assert acks == 1 and elapsed < 0.15
+    assert fake.data["b"] == {"k": ("v", 0)}
+
+
+def test_async_quorum_gives_up_at_the_timeout(workers):
+    workers({"a": 0.5})
+    assert asyncio.run(replicator.replicate_async("k", "v", ["a"], quorum=1, timeout=0.1)) == 0
+
+
+def test_batch_versions_override_per_key(workers):
+    fake = workers({"a": 0})
+    replicator.replicate_batch({"a": {"x": "1", "y": "2"}}, version=5, versions={"x": 3, "y": None})
+    message = fake.actions("MSET")["a"][0]
+    assert message["version"] == 5 and message["versions"] == {"x": 3}
+    assert fake.data["a"] == {"x": ("1", 3), "y": ("2", 5)}
+
+
+def test_deletes_carry_their_version(workers):
+    fake = workers({"a": 0, "b": 0})
+    replicator.replicate_delete("k", ["a", "b"], version=7)
+    replicator.replicate_delete_batch({"a": ["x"]}, version=8)
+    assert [message["version"] for message in fake.actions("DELETE")["a"]] == [7]
+    assert fake.actions("MDEL")["a"][0]["version"] == 8
+
+
+def test_set_reply_reports_the_quorum(primary):
+    server = primary({"node1": 0, "node2": 0})
+    reply = server.handle_request({"action": "SET", "key": "k", "value": "v"})
+    assert reply["status"] == "STORED" and reply["acks"] >= 1 and reply["replicas"] == 2
+
+    down = ConnectionError("down")
+    server = primary({"node1": 0, "node2": 0}, replies={"node1": down, "node2": down})
+    reply = server.handle_request({"action": "SET", "key": "k", "value": "v"})
+    assert reply["status"] == "ERROR" and reply["acks"] == 0
+    assert server.datastore.get("k") == "v"
+
+
+def test_mset_lists_keys_that_missed_the_quorum(primary):
+    server = primary({"node1": 0, "node2": 0}, replies={"node1": {"status": "ERROR"}, "node2": {"status": "ERROR"}})
+    reply = server.handle_request({"action": "MSET", "items": {"a": "1", "b": "2"}})
+    assert reply["status"] == "ERROR"
+    assert sorted(reply["under_replicated"]) == ["a", "b"]
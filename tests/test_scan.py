@@ -0,0 +1,83 @@
+# test_scan.py
+
+import random
+from hashing_ring import ring_hash
+from merkle import MerkleTree, merge_pages
+from sharded_store import ShardedStore
+
+KEYS = [f"key:{i}" for i in range(3000)]
+
+
+def source_page(keys, cursor, count):
+    # One source's SCAN page, the way a worker or the DataStore cuts it.
+    tree = MerkleTree()
+    for key in keys:
+        tree.add(key, 1)
+    return tree.scan(cursor, count)
+
+
+def replicas():
+    # Three sources that each hold two thirds of the keys, so every key is
+    # on two of them.
+    rng = random.Random(3)
+    held = [[], [], []]
+    for key in KEYS:
+        for source in rng.sample(range(3), 2):
+            held[source].append(key)
+    return held
+
+
+def scan_all(held, count):
+    seen, pages, cursor = [], [], 0
+    while True:
+        items, cursor = merge_pages([source_page(keys, cursor, count) for keys in held], count)
+        seen.extend(key for _, key in items)
+        pages.append(len(items))
+        if cursor is None:
+            return seen, pages
+
+
+def test_replicated_keys_fill_a_full_page():
+    items, cursor = merge_pages([source_page(keys, 0, 100) for keys in replicas()], 100)
+    keys = [key for _, key in items]
+    assert len(keys) == 100
+    assert len(set(keys)) == 100
+    assert cursor is not None
+
+
+def test_scan_lists_every_key_once():
+    seen, pages = scan_all(replicas(), 100)
+    assert sorted(seen) == sorted(KEYS)
+    assert all(size == 100 for size in pages[:-1])
+
+
+def test_cursor_resumes_after_the_last_key_returned():
+    items, cursor = merge_pages([source_page(keys, 0, 50) for keys in replicas()], 50)
+    assert items[-1][0] < cursor
+    later = sorted(ring_hash(key) for key in KEYS if ring_hash(key) > items[-1][0])
+    assert cursor == later[0]
+
+
+def test_keys_sharing_a_token_stay_on_one_page():
+    items = [(1, "a"), (2, "b"), (2, "c"), (3, "d")]
+    page, cursor = merge_pages([(items, None)], 2)
+    assert page == [(1, "a"), (2, "b"), (2, "c")]
+    assert cursor == 3
+
+
+def test_page_stops_at_the_lowest_source_cursor():
+    page, cursor = merge_pages([([(1, "a"), (5, "e")], None), ([(1, "a"), (2, "b")], 3)], 10)
+    assert page == [(1, "a"), (2, "b")]
+    assert cursor == 3
+
+
+def test_sharded_store_scan_covers_every_shard():
+    store = ShardedStore(capacity=10000, shards=8, policy="lru")
+    store.put_many({key: ("v", 1) for key in KEYS})
+    seen, cursor = [], 0
+    while True:
+        keys, cursor = store.scan(cursor, 128)
+        seen.extend(keys)
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(KEYS)
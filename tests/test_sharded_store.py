@@ -0,0 +1,166 @@
+# test_sharded_store.py
+
+import threading
+import pytest
+from eviction import Budget, LRUCache
+from sharded_store import ShardedStore, STORED, TOO_LARGE
+
+
+@pytest.fixture
+def store():
+    return ShardedStore(capacity=1000, shards=4, policy="lru")
+
+
+def keys_in(store, index, count, prefix="k"):
+    # The first `count` keys of the form prefix:i that hash to shard `index`.
+    keys = []
+    i = 0
+    while len(keys) < count:
+        key = f"{prefix}:{i}"
+        if store.shard(key) is store.shards[index]:
+            keys.append(key)
+        i += 1
+    return keys
+
+
+def used(store):
+    return [shard.cache.used for shard in store.shards]
+
+
+def test_budget_charges():
+    budget = Budget(10)
+    assert budget.lock is None
+    budget.charge(10)
+    assert not budget.over()
+    budget.charge(1)
+    assert budget.over()
+    budget.charge(-1)
+    assert budget.used == 10 and not budget.over()
+    assert Budget(10, shared=True).lock is not None
+
+
+def test_writer_only_evicts_its_own_share():
+    budget = Budget(10, shared=True)
+    a = LRUCache(5, budget=budget)
+    b = LRUCache(5, budget=budget)
+    for i in range(10):
+        a.put(f"a{i}", i)
+    # While the budget has room a cache grows past its share.
+    assert len(a) == 10 and budget.used == 10
+    b.put("b0", 0)
+    # b is under its share, so it leaves a's overshoot for the owner.
+    assert len(a) == 10 and len(b) == 1 and budget.over()
+    for i in range(1, 8):
+        b.put(f"b{i}", i)
+    assert len(b) == 5 and b.evictions == 3 and len(a) == 10
+    a.put("a10", 10)
+    # a is over its share, so its own write evicts it back within budget.
+    assert not budget.over() and len(a) == 5
+    assert budget.used == a.used + b.used
+
+
+def test_put_reclaims_from_shards_over_their_share():
+    store = ShardedStore(capacity=40, shards=4, policy="lru")
+    hot = keys_in(store, 0, 40)
+    for key in hot:
+        assert store.put(key, ("v", 1)) == STORED
+    assert used(store) == [40, 0, 0, 0]
+    for key in keys_in(store, 1, 10):
+        store.put(key, ("v", 1))
+    # Shard 1 stayed at its share; the overshoot came out of shard 0.
+    assert used(store) == [30, 10, 0, 0]
+    assert store.budget.used == 40
+    assert store.get(hot[0]) is None and store.get(hot[-1]) == ("v", 1)
+
+
+def test_put_many_reclaims():
+    store = ShardedStore(capacity=40, shards=4, policy="lru")
+    assert store.put_many({key: ("v", 1) for key in keys_in(store, 2, 30)}) == {}
+    assert store.put_many({key: ("v", 1) for key in keys_in(store, 3, 20)}) == {}
+    # Within one batch shard 3 stops at its share instead of evicting shard
+    # 2's keys under shard 3's lock.
+    assert used(store) == [0, 0, 30, 10]
+    assert len(store) == store.budget.used == 40
+
+
+def test_reclaim_falls_back_to_every_shard():
+    store = ShardedStore(capacity=40, shards=4, policy="lru")
+    for index in range(4):
+        for key in keys_in(store, index, 10):
+            store.put(key, ("v", 1))
+    store.budget.capacity = 20
+    store.reclaim()
+    assert used(store) == [5, 5, 5, 5]
+
+
+def test_one_value_can_use_the_whole_budget():
+    store = ShardedStore(capacity=100, shards=4, policy="lru", sizer=lambda key, entry: len(entry[0]))
+    assert store.put("big", ("x" * 80, 1)) == STORED
+    assert store.get("big") == ("x" * 80, 1)
+    assert store.put("huge", ("x" * 101, 1)) == TOO_LARGE
+    assert store.put("other", ("x" * 40, 1)) == STORED
+    assert not store.budget.over() and len(store) == 1
+
+
+def test_concurrent_writers_stay_within_budget():
+    store = ShardedStore(capacity=200, shards=8, policy="clock")
+
+    def write(prefix):
+        for i in range(2000):
+            store.put(f"{prefix}:{i}", ("v", i))
+
+    threads = [threading.Thread(target=write, args=(f"t{n}",)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.budget.used == sum(used(store)) == len(store) <= 200
+
+
+def test_batch_operations(store):
+    assert store.put_many({"a": ("1", 1), "b": ("2", 2), "c": ("3", 3)}) == {}
+    assert store.put_many({"a": ("9", 0), "b": ("9", 9), "d": ("4", 4)}, if_newer=True) == {}
+    assert store.get_many(["a", "b", "d", "x"]) == {"a": ("1", 1), "b": ("9", 9), "d": ("4", 4)}
+    assert sorted(store.delete_many(["a", "x", "b"])) == ["a", "b"]
+    assert sorted(store.keys()) == ["c", "d"]
+    assert store.peek("c") == ("3", 3) and store.stats()["entries"] == 2
+
+
+def test_if_newer_keeps_the_highest_version(store):
+    store.put("k", ("v2", 2), if_newer=True)
+    store.put("k", ("v1", 1), if_newer=True)
+    assert store.get("k") == ("v2", 2)
+    store.put("k", ("v3", 3), if_newer=True)
+    assert store.get("k") == ("v3", 3)
+
+
+def test_older_delete_leaves_newer_value(store):
+    store.put("k", ("v", 5))
+    assert not store.delete("k", version=4)
+    assert store.get("k") == ("v", 5)
+
+
+def test_older_write_after_delete_is_not_resurrected(store):
+    store.put("k", ("v", 5))
+    assert store.delete("k", version=6)
+    assert store.put("k", ("stale", 5), if_newer=True) == STORED
+    assert store.get("k") is None
+    failed = store.put_many({"k": ("stale", 6)}, if_newer=True)
+    assert failed == {} and store.get("k") is None
+    store.put("k", ("new", 7), if_newer=True)
+    assert store.get("k") == ("new", 7)
+    assert store.tombstone_versions(["k"]) == {}
+
+
+def test_delete_of_absent_key_still_leaves_a_tombstone(store):
+    assert not store.delete("k", version=9)
+    assert store.tombstone_versions(["k"]) == {"k": 9}
+    store.put("k", ("late", 8), if_newer=True)
+    assert store.get("k") is None
+
+
+def test_unversioned_delete_leaves_no_tombstone(store):
+    store.put("k", ("v", 1))
+    assert store.delete("k")
+    assert store.tombstone_versions(["k"]) == {}
+
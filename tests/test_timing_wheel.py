@@ -0,0 +1,64 @@
+# test_timing_wheel.py
+
+import math
+import random
+from timing_wheel import TimingWheel
+
+
+def small_wheel():
+    # Four slots per level and three levels: level 0 spans 4 ticks, level 1
+    # 16 and level 2 64, so short deadlines already cascade twice and the
+    # ones past 64 ticks wrap around the top level.
+    return TimingWheel(tick=1.0, wheel_size=4, levels=3, now=0)
+
+
+def test_every_deadline_expires_on_its_tick():
+    wheel = small_wheel()
+    rng = random.Random(7)
+    deadlines = {i: rng.uniform(0.1, 200) for i in range(500)}
+    for item, deadline in deadlines.items():
+        wheel.schedule(item, deadline)
+    assert len(wheel) == len(deadlines)
+    for now in range(1, 202):
+        for item in wheel.advance(now):
+            assert math.ceil(deadlines.pop(item)) == now
+    assert deadlines == {}
+    assert len(wheel) == 0
+
+
+def test_cascade_boundaries():
+    wheel = small_wheel()
+    deadlines = [1, 3, 4, 5, 15, 16, 17, 63, 64, 65, 128, 129]
+    for deadline in deadlines:
+        wheel.schedule(deadline, deadline)
+    expired = {}
+    for now in range(1, 131):
+        for item in wheel.advance(now):
+            expired[item] = now
+    assert expired == {deadline: deadline for deadline in deadlines}
+
+
+def test_one_large_step_returns_everything_due():
+    wheel = small_wheel()
+    for deadline in (2, 20, 70, 300):
+        wheel.schedule(deadline, deadline)
+    assert sorted(wheel.advance(100)) == [2, 20, 70]
+    assert wheel.advance(299) == []
+    assert wheel.advance(300) == [300]
+
+
+def test_past_deadlines_are_due_on_the_next_advance():
+    wheel = TimingWheel(tick=1.0, wheel_size=4, levels=3, now=50)
+    wheel.schedule("late", 10)
+    assert wheel.advance(50) == ["late"]
+
+
+def test_items_scheduled_while_running_keep_their_deadline():
+    wheel = small_wheel()
+    wheel.advance(37)
+    wheel.schedule("a", 40.5)
+    wheel.schedule("b", 100)
+    assert wheel.advance(40) == []
+    assert wheel.advance(41) == ["a"]
+    assert wheel.advance(99) == []
+    assert wheel.advance(100) == ["b"]
@@ -0,0 +1,43 @@
+# test_worker_node.py
+
+import pytest
+from worker_node import WorkerNode, entry_size
+
+
+@pytest.fixture
+def node():
+    # Room for exactly two of the test entries, in one LRU shard.
+    return WorkerNode("node1", capacity_bytes=2 * entry_size("a", ("1", 1)), policy="lru", shards=1)
+
+
+def counters(node):
+    return node.metrics.snapshot()["counters"]
+
+
+def fill(node):
+    node.handle_command({"action": "MSET", "items": {"a": "1", "b": "2"}, "version": 1})
+
+
+def test_mget_touch_false_leaves_eviction_order_alone(node):
+    fill(node)
+    reply = node.handle_command({"action": "MGET", "keys": ["a"], "touch": False})
+    assert reply["values"] == {"a": "1"}
+    node.handle_command({"action": "SET", "key": "c", "value": "3", "version": 1})
+    assert node.cache.peek("a") is None
+    assert node.cache.peek("b") is not None
+
+
+def test_mget_touches_by_default(node):
+    fill(node)
+    node.handle_command({"action": "MGET", "keys": ["a"]})
+    node.handle_command({"action": "SET", "key": "c", "value": "3", "version": 1})
+    assert node.cache.peek("a") is not None
+    assert node.cache.peek("b") is None
+
+
+def test_mget_touch_false_records_no_hits_or_misses(node):
+    fill(node)
+    node.handle_command({"action": "MGET", "keys": ["a", "missing"], "touch": False})
+    assert "hits" not in counters(node) and "misses" not in counters(node)
+    node.handle_command({"action": "MGET", "keys": ["a", "missing"]})
+    assert counters(node)["hits"] == 1 and counters(node)["misses"] == 1
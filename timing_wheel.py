@@ -0,0 +1,87 @@
+# timing_wheel.py
+
+import math
+import time
+from config import TTL_TICK, EXPIRY_BATCH
+
+
+class TimingWheel:
+    # Hierarchical timing wheel (Varghese & Lauck). Level 0 has one slot per
+    # tick; each higher level covers `wheel_size` times the span of the one
+    # below. Scheduling is O(1), and an entry is re-placed at most once per
+    # level as its deadline approaches, so expiring millions of keys costs
+    # no scans. Entries are never cancelled: callers check on expiry whether
+    # the deadline they scheduled is still the current one.
+    def __init__(self, tick=TTL_TICK, wheel_size=256, levels=4, now=None):
+        self.tick = tick
+        self.size = wheel_size
+        self.levels = [[[] for _ in range(wheel_size)] for _ in range(levels)]
+        self.current = int((time.time() if now is None else now) / tick)
+        self.due = []
+        self.count = 0
+
+    def schedule(self, item, deadline):
+        self.count += 1
+        self._place(item, math.ceil(deadline / self.tick))
+
+    def _place(self, item, expires):
+        delta = expires - self.current
+        if delta <= 0:
+            self.due.append(item)
+            return
+        span = 1
+        last = len(self.levels) - 1
+        for level, slots in enumerate(self.levels):
+            # Deadlines beyond the top level's range sit in its slots and are
+            # re-placed on every rotation until they come into range.
+            if delta < span * self.size or level == last:
+                slots[(expires // span) % self.size].append((expires, item))
+                return
+            span *= self.size
+
+    def advance(self, now):
+        # Moves the wheel to `now` and returns every item whose deadline passed.
+        target = int(now / self.tick)
+        if self.count == 0:
+            self.current = max(self.current, target)
+            return []
+        expired = []
+        while self.current < target:
+            self.current += 1
+            span = self.size
+            for slots in self.levels[1:]:
+                if self.current % span:
+                    break
+                idx = (self.current // span) % self.size
+                entries, slots[idx] = slots[idx], []
+                for expires, item in entries:
+                    self._place(item, expires)
+                span *= self.size
+            idx = self.current % self.size
+            entries, self.levels[0][idx] = self.levels[0][idx], []
+            expired.extend(item for _, item in entries)
+        if self.due:
+            expired.extend(self.due)
+            self.due = []
+        self.count -= len(expired)
+        return expired
+
+    def __len__(self):
+        return self.count
+
+
+def expiry_loop(targets, tick=TTL_TICK, batch=EXPIRY_BATCH):
+    # Background loop over (wheel, lock, expire) targets: every tick each
+    # wheel is advanced and expire(item) called for its due items, taking
+    # that target's lock for at most `batch` items at a time so request
+    # threads never wait behind a large expiry wave.
+    while True:
+        time.sleep(tick)
+        now = time.time()
+        for wheel, lock, expire in targets:
+            with lock:
+                due = wheel.advance(now)
+            for i in range(0, len(due), batch):
+                with lock:
+                    for item in due[i:i + batch]:
+                        expire(item)
@@ -1,115 +1,371 @@
+import os
 import socket
-import threading
-import pickle
 import sys
-from config import WORKER_PORTS
+import threading
+import time
+import asyncio
+import argparse
+from config import (
+    WORKER_PORTS, SERVER_MODE, MAX_INFLIGHT_REQUESTS, PRIMARY_SERVER_PORT, HEARTBEAT_INTERVAL,
+    WORKER_MEMORY_BYTES, ENTRY_OVERHEAD, EVICTION_POLICY, WORKER_SHARDS, SCAN_COUNT, LOG_LEVEL, PEER_CODEC
+)
+from codec import serve_connection, serve_stream, open_connection, encode_value
+from framing import send_message, recv_message
+from hashing_ring import ring_hash, in_ranges
 from collections import OrderedDict
+from eviction import POLICIES
+from sharded_store import ShardedStore, STORED, TOO_LARGE, NOT_ADMITTED
+from persistence import Persistence
+from merkle import range_intervals
+from metrics import Metrics
+from log import get_logger, configure as configure_logging, stats as log_stats, LEVELS
 
-class LRUCache:
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.cache = OrderedDict()
+def entry_size(key, entry):
+    # Bytes charged for one (value, version) entry. Strings and bytes are
+    # measured directly; other values by their encoded size.
+    value = entry[0]
+    if isinstance(value, (str, bytes, bytearray)):
+        size = sys.getsizeof(value)
+    else:
+        size = len(encode_value(value))
+    return sys.getsizeof(key) + size + ENTRY_OVERHEAD
 
-    def get(self, key):
-        if key not in self.cache:
-            return None
-        self.cache.move_to_end(key)
-        return self.cache[key]
+class WorkerNode:
+    def __init__(self, node_id, capacity_bytes=WORKER_MEMORY_BYTES, policy=EVICTION_POLICY, shards=WORKER_SHARDS,
+                 data_dir=None):
+        self.node_id = node_id
+        self.log = get_logger(node_id)
+        self.port = WORKER_PORTS[node_id]
+        # Thread-safe on its own: each shard has its own lock, eviction
+        # state and TTL wheel, so handlers need no lock of their own.
+        self.cache = ShardedStore(capacity_bytes, shards, policy, entry_size)
+        self.metrics = Metrics()
+        self.tracked_command = self.metrics.track(self.handle_command)
+        # Key snapshots for in-progress RANGE_ITEMS scans, oldest first.
+        self.range_sessions = OrderedDict()
+        self.sessions_lock = threading.Lock()
+        self.max_range_sessions = 16
+        self.epoch = 0
+        # Keys written since JOIN_BEGIN, or None outside a join.
+        self.fresh_keys = None
+        # Highest version stored here, reported in heartbeats so the
+        # primary's clock never issues versions below existing data.
+        self.max_version = 0
+        self.persistence = None
+        if data_dir:
+            self.persistence = Persistence(os.path.join(data_dir, node_id), self.cache.items,
+                                           self.cache.tombstone_items)
+            self.restore()
 
-    def put(self, key, value):
-        if key in self.cache:
-            self.cache.move_to_end(key)
-        self.cache[key] = value
-        if len(self.cache) > self.capacity:
-            evicted_key, _ = self.cache.popitem(last=False)
-            print(f"[LRU] Evicted key: {evicted_key}")
+    def restore(self):
+        # Rebuilds the cache from disk before the node accepts connections,
+        # then journals every later write. Replay only keeps the last record
+        # per key, so overwritten and deleted keys cost nothing and the
+        # survivors go in with one batched put. Replayed logs are folded
+        # into a fresh snapshot in the background so the next start is faster.
+        started = time.time()
+        latest = {}
+        count, replayed_logs = self.persistence.load(lambda record: latest.__setitem__(record[1], record))
+        now = time.time()
+        entries = {}
+        ttls = {}
+        tombstones = {}
+        for key, record in latest.items():
+            if record[0] != "S":
+                if len(record) > 2:
+                    tombstones[key] = record[2]
+                continue
+            _, _, value, version, deadline = record
+            if deadline is not None:
+                if deadline <= now:
+                    continue
+                ttls[key] = deadline - now
+            entries[key] = (value, version)
+            self.observe_version(version)
+        self.cache.put_many(entries, ttls)
+        # Tombstones restart their grace period from now.
+        self.cache.delete_many(list(tombstones), versions=tombstones)
+        self.cache.set_journal(self.persistence)
+        self.persistence.start(compact_now=replayed_logs > 0)
+        self.log.info("Restored %d keys from %d records in %.2fs", len(self.cache), count, time.time() - started)
 
-    def keys(self):
-        return list(self.cache.keys())
+    def observe_version(self, version):
+        if version > self.max_version:
+            self.max_version = version
 
-    def __contains__(self, key):
-        return key in self.cache
+    def stats(self):
+        # Evictions and memory use come from the store's own accounting,
+        # read here instead of being counted on the hot path.
+        memory = self.cache.stats()
+        counters = {"evictions": memory["evictions"], "expirations": memory["expirations"],
+                    "log_dropped": log_stats()["dropped"]}
+        gauges = {"bytes_stored": memory["used_bytes"], "capacity_bytes": memory["capacity_bytes"],
+                  "entries": memory["entries"], "tombstones": memory["tombstones"]}
+        if self.persistence is not None:
+            counters["persistence_errors"] = self.persistence.write_errors
+            gauges["persistence_healthy"] = int(self.persistence.healthy)
+        return self.metrics.snapshot(counters=counters, **gauges)
 
-    def __getitem__(self, key):
-        return self.cache[key]
+    def handle_client(self, conn):
+        # Connections are kept alive so the primary's pool can send many
+        # requests over one socket; the loop ends when the peer hangs up.
+        self.metrics.serve(serve_connection, conn, self.tracked_command, self.node_id)
 
-class WorkerNode:
-    def __init__(self, node_id, capacity=3):
-        self.node_id = node_id
-        self.port = WORKER_PORTS[node_id]
-        self.cache = LRUCache(capacity)
+    def handle_command(self, command):
+        action = command.get("action")
+        key = command.get("key")
 
-    def handle_client(self, conn):
-        try:
-            data = conn.recv(4096)
-            if not data:
-                return
+        # Smart clients tag requests with the topology epoch they routed
+        # with; one older than the epoch this node last heard from the
+        # primary means the client's ring is stale.
+        epoch = command.get("epoch")
+        if epoch is not None and epoch < self.epoch:
+            return {"status": "WRONG_EPOCH", "epoch": self.epoch}
 
-            command = pickle.loads(data)
-            action = command.get("action")
-            key = command.get("key")
+        # Writes merge last-write-wins on version: a SET, MSET or DELETE
+        # older than the entry already stored is a no-op, and so is a SET
+        # or MSET older than the tombstone of a delete, so replicas converge
+        # whatever order concurrent writes arrive in.
+        if action == "DELETE":
+            if self.cache.delete(key, command.get("version")):
+                response = {"status": "DELETED"}
+            else:
+                response = {"status": "NOT_FOUND"}
 
-            if action == "DELETE":
+        elif action == "SET":
+            value = command.get("value")
+            if key is not None and value is not None:
+                version = command.get("version", 0)
+                self.observe_version(version)
+                outcome = self.cache.put(key, (value, version), command.get("ttl"), if_newer=True)
+                if outcome == TOO_LARGE:
+                    response = {"status": "ERROR", "message": "Value exceeds worker memory budget"}
+                else:
+                    # NOT_ADMITTED is its own status so the primary does not
+                    # count it towards the write quorum.
+                    if outcome == STORED and self.fresh_keys is not None:
+                        self.fresh_keys.add(key)
+                    response = {"status": outcome}
+            else:
+                response = {"status": "ERROR", "message": "Missing key or value"}
 
-                if key in self.cache:
+        elif action == "GET":
+            # Entries are (value, version) pairs; the version lets the primary
+            # pick the newest reply when it reads from several replicas.
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.metrics.incr("hits")
+                response = {"status": "OK", "value": entry[0], "version": entry[1]}
+            else:
+                self.metrics.incr("misses")
+                response = {"status": "OK", "value": None}
 
-                    self.cache.cache.pop(key, None)
-                    response = {"status": "DELETED"}
+        elif action == "KEY_METADATA":
+            entry = self.cache.peek(key)
+            if entry is not None:
+                response = {"status": "OK", "value": entry[0]}
+            else:
+                response = {"status": "NOT_FOUND"}
 
-                else:
+        elif action == "SCAN":
+            keys, cursor = self.cache.scan(command.get("cursor", 0), command.get("count", SCAN_COUNT),
+                                           command.get("match"))
+            response = {"status": "OK", "keys": keys, "cursor": cursor or 0}
 
-                    response = {"status": "NOT_FOUND"}
-                
-                conn.sendall(pickle.dumps(response))
-                return
+        elif action == "MGET":
+            keys = command.get("keys", [])
+            # "touch": False peeks, for repair copies and listings: the
+            # eviction policy and the hit/miss counts are left as they were.
+            touch = command.get("touch", True)
+            values = {}
+            versions = {}
+            for k, entry in self.cache.get_many(keys, touch).items():
+                values[k], versions[k] = entry
+            if touch:
+                self.metrics.incr("hits", len(values))
+                self.metrics.incr("misses", len(keys) - len(values))
+            response = {"status": "OK", "values": values, "versions": versions}
+            ttls = self.cache.ttls(values)
+            if ttls:
+                response["ttls"] = ttls
 
-            if action == "SET":
-                value = command.get("value")
-                if key is not None and value is not None:
-                    self.cache.put(key, value)
-                    response = {"status": "STORED"}
-                else:
-                    response = {"status": "ERROR", "message": "Missing key or value"}
+        elif action == "MSET":
+            items = command.get("items", {})
+            version = command.get("version", 0)
+            versions = command.get("versions") or {}
+            ttl = command.get("ttl")
+            ttls = command.get("ttls") or {}
+            entries = {k: (value, versions.get(k, version))
+                       for k, value in items.items() if k is not None and value is not None}
+            if ttl:
+                ttls = {**dict.fromkeys(entries, ttl), **ttls}
+            for entry in entries.values():
+                self.observe_version(entry[1])
+            failed = self.cache.put_many(entries, ttls, if_newer=True)
+            if self.fresh_keys is not None:
+                self.fresh_keys.update(entries)
+            response = {"status": "STORED", "count": len(items) - len(failed)}
+            rejected = [k for k, outcome in failed.items() if outcome == TOO_LARGE]
+            not_admitted = [k for k, outcome in failed.items() if outcome == NOT_ADMITTED]
+            if rejected:
+                response["rejected"] = rejected
+            if not_admitted:
+                response["not_admitted"] = not_admitted
 
-            elif action == "GET":
-                value = self.cache.get(key)
-                response = {"status": "OK", "value": value}
+        elif action == "MDEL":
+            # "versions" carries per-key delete versions, for tombstones
+            # copied by anti-entropy or a join.
+            response = {"status": "OK", "deleted": self.cache.delete_many(
+                command.get("keys", []), command.get("version"), command.get("versions"))}
 
-            elif action == "KEY_METADATA":
-                if key in self.cache:
-                    value = self.cache[key]
-                    response = {"status": "OK", "value": value}
-                else:
-                    response = {"status": "NOT_FOUND"}
+        elif action == "MEMORY_STATS":
+            response = {"status": "OK", **self.cache.stats()}
+            if self.persistence is not None:
+                response["persistence"] = self.persistence.stats()
 
-            elif action == "LIST_KEYS":
-                response = {"status": "OK", "keys": self.cache.keys()}
+        elif action == "STATS":
+            response = {"status": "OK", "node": self.node_id, "stats": self.stats()}
 
-            else:
-                response = {"status": "ERROR", "message": f"Unknown action: {action}"}
+        elif action == "JOIN_BEGIN":
+            # Sent by the primary before migrating this node's ranges to it.
+            self.fresh_keys = set()
+            response = {"status": "OK"}
+
+        elif action == "JOIN_END":
+            # Every key this node should own has now been copied or written.
+            # Anything else is left over from before a restart (deleted or
+            # moved elsewhere since) and is dropped when the copy succeeded.
+            pruned = 0
+            if command.get("prune") and self.fresh_keys is not None:
+                pruned = self.cache.retain(self.fresh_keys)
+            self.fresh_keys = None
+            response = {"status": "OK", "pruned": pruned}
+
+        elif action == "RANGE_ITEMS":
+            response = self.range_items(command)
+
+        elif action == "MERKLE_HASHES":
+            # Hashes of the given tree nodes at one level, restricted to the
+            # token ranges this node shares with the replica it is compared to.
+            intervals = range_intervals(command.get("ranges", []))
+            hashes = self.cache.tree_hashes(command.get("level", 0), command.get("nodes", []), intervals)
+            response = {"status": "OK", "hashes": hashes}
+
+        elif action == "MERKLE_LEAVES":
+            intervals = range_intervals(command.get("ranges", []))
+            versions, tombstones = self.cache.leaf_versions(command.get("leaves", []), intervals)
+            response = {"status": "OK", "versions": versions, "tombstones": tombstones}
+
+        elif action == "PING":
+            # The primary's startup probe; it starts its epoch past ours.
+            response = {"status": "OK", "node": self.node_id, "epoch": self.epoch}
+
+        else:
+            response = {"status": "ERROR", "message": f"Unknown action: {action}"}
+
+        return response
 
-            conn.sendall(pickle.dumps(response))
+    def range_items(self, command):
+        # Pages through the entries and tombstones whose ring hash falls in
+        # the requested token ranges. The first page snapshots the matching
+        # keys under the session id so later pages cost only their own slice.
+        session = command.get("session")
+        offset = command.get("offset", 0)
+        count = command.get("count", 500)
+        with self.sessions_lock:
+            keys = self.range_sessions.get(session) if session else None
+        if keys is None:
+            ranges = command.get("ranges", [])
+            keys = [k for k in self.cache.keys() + self.cache.tombstone_keys() if in_ranges(ring_hash(k), ranges)]
+            if session:
+                with self.sessions_lock:
+                    self.range_sessions[session] = keys
+                    while len(self.range_sessions) > self.max_range_sessions:
+                        self.range_sessions.popitem(last=False)
 
-        except Exception as e:
-            print(f"[{self.node_id}] Error: {e}")
+        items = {}
+        versions = {}
+        page = keys[offset:offset + count]
+        # touch=False so the scan leaves the eviction order alone.
+        for k, entry in self.cache.get_many(page, touch=False).items():
+            items[k], versions[k] = entry
+        tombstones = self.cache.tombstone_versions([k for k in page if k not in items])
+        next_offset = offset + count
+        if next_offset >= len(keys):
+            next_offset = None
+            with self.sessions_lock:
+                self.range_sessions.pop(session, None)
+        return {"status": "OK", "items": items, "versions": versions, "ttls": self.cache.ttls(items),
+                "tombstones": tombstones, "next": next_offset, "total": len(keys)}
+
+    def heartbeat_loop(self):
+        # Pushes a heartbeat to the primary every HEARTBEAT_INTERVAL over one
+        # kept-alive connection, reconnecting whenever the primary restarts.
+        sock = codec = None
+        while True:
             try:
-                conn.sendall(pickle.dumps({"status": "ERROR", "message": str(e)}))
-            except:
-                pass
-        finally:
-            conn.close()
+                if sock is None:
+                    sock, codec = open_connection("localhost", PRIMARY_SERVER_PORT, timeout=HEARTBEAT_INTERVAL * 4,
+                                                  codec_name=PEER_CODEC)
+                send_message(sock, {"action": "HEARTBEAT", "node": self.node_id, "version": self.max_version,
+                                    "epoch": self.epoch}, codec)
+                reply = recv_message(sock, codec)
+                if reply is None:
+                    raise ConnectionError("Primary closed the connection")
+                # Never step back: a primary that restarted catches up from
+                # the epoch sent above.
+                self.epoch = max(self.epoch, reply.get("epoch", self.epoch))
+            except Exception:
+                if sock is not None:
+                    sock.close()
+                sock = None
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def start_heartbeats(self):
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
 
     def start(self):
-        print(f"[{self.node_id}] Listening on port {self.port}")
+        self.log.info("Listening on port %d", self.port)
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind(("localhost", self.port))
         server.listen()
+        self.start_heartbeats()
         while True:
             conn, _ = server.accept()
             threading.Thread(target=self.handle_client, args=(conn,), daemon=True).start()
 
+    async def serve_async(self):
+        limiter = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+
+        async def on_connect(reader, writer):
+            await self.metrics.serve_async(serve_stream, reader, writer, self.tracked_command, self.node_id, limiter)
+
+        server = await asyncio.start_server(on_connect, "localhost", self.port, reuse_address=True)
+        self.start_heartbeats()
+        async with server:
+            await server.serve_forever()
+
+    def start_async(self):
+        self.log.info("Listening (async) on port %d", self.port)
+        asyncio.run(self.serve_async())
+
 if __name__ == "__main__":
-    node_id = sys.argv[1]
-    node = WorkerNode(node_id)
-    node.start()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("node_id", choices=list(WORKER_PORTS))
+    parser.add_argument("--mode", choices=["thread", "async"], default=SERVER_MODE)
+    parser.add_argument("--capacity-bytes", type=int, default=WORKER_MEMORY_BYTES)
+    parser.add_argument("--policy", choices=list(POLICIES), default=EVICTION_POLICY)
+    parser.add_argument("--shards", type=int, default=WORKER_SHARDS)
+    parser.add_argument("--data-dir", help="Persist data under this directory and restore it on start")
+    parser.add_argument("--log-file", help="Write the log here, rotated by size, instead of to stdout")
+    parser.add_argument("--log-level", choices=list(LEVELS), default=LOG_LEVEL)
+    args = parser.parse_args()
+    configure_logging(args.log_file, args.log_level)
+
+    node = WorkerNode(args.node_id, args.capacity_bytes, args.policy, args.shards, args.data_dir)
+    if args.mode == "async":
+        node.start_async()
+    else:
+        node.start()
 
@@ -0,0 +1,44 @@
+# workload.py
+
+import bisect
+import itertools
+import random
+
+
+class ZipfGenerator:
+    # Draws ranks 0..n-1 with P(rank k) proportional to 1 / (k + 1) ** alpha,
+    # by bisecting a precomputed cumulative distribution.
+    def __init__(self, n, alpha=0.99, seed=None):
+        self.n = n
+        self.alpha = alpha
+        self.random = random.Random(seed)
+        weights = (1.0 / (k + 1) ** alpha for k in range(n))
+        self.cdf = list(itertools.accumulate(weights))
+        self.total = self.cdf[-1]
+
+    def next(self):
+        return min(bisect.bisect(self.cdf, self.random.random() * self.total), self.n - 1)
+
+    def sample(self, count):
+        cdf = self.cdf
+        total = self.total
+        draw = self.random.random
+        last = self.n - 1
+        return [min(bisect.bisect(cdf, draw() * total), last) for _ in range(count)]
+
+
+def zipf_trace(length, keyspace, alpha=0.99, seed=0):
+    return [f"key:{rank}" for rank in ZipfGenerator(keyspace, alpha, seed).sample(length)]
+
+
+def scan_trace(length, keyspace, alpha=0.99, scan_every=2000, scan_length=1000, seed=0):
+    # A Zipfian trace interleaved with sequential scans over keys that are
+    # never requested again, like a LIST_KEYS walk or a bulk import.
+    trace = []
+    hot = ZipfGenerator(keyspace, alpha, seed)
+    scanned = 0
+    while len(trace) < length:
+        trace.extend(f"key:{rank}" for rank in hot.sample(scan_every))
+        trace.extend(f"scan:{scanned + i}" for i in range(scan_length))
+        scanned += scan_length
+    return trace[:length]